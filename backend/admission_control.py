@@ -0,0 +1,201 @@
+"""
+Controle de admissão por memória para análises concorrentes
+
+Cada análise segura a janela decodificada, espectrogramas e o estado do pYIN.
+Este módulo estima o pico de memória de uma análise a partir dos metadados do
+arquivo (duração, sample rate, canais) e só admite o trabalho se couber no
+orçamento configurado. O excesso espera numa fila limitada; quando a fila está
+cheia ou a espera estoura, a requisição é rejeitada (HTTP 429 + Retry-After).
+"""
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Orçamento e fila configuráveis por variável de ambiente
+DEFAULT_MEMORY_BUDGET_MB = int(os.environ.get('ANALYSIS_MEMORY_BUDGET_MB', '512'))
+DEFAULT_MAX_QUEUE = int(os.environ.get('ANALYSIS_MAX_QUEUE', '8'))
+DEFAULT_QUEUE_TIMEOUT = float(os.environ.get('ANALYSIS_QUEUE_TIMEOUT', '15'))
+
+# Parâmetros espelhados de AudioAnalyzer.load_audio / extractors
+ANALYSIS_WINDOW_S = 30.0
+ANALYSIS_SR = 11025
+N_FFT = 2048
+HOP_LENGTH = 512
+PYIN_PITCH_BINS = 1200          # C2..C7 com resolução de 0.1 semitom (x2 estados)
+BASE_OVERHEAD_BYTES = 24 * 1024 * 1024
+
+# Pior caso quando os metadados não podem ser lidos
+FALLBACK_SR = 48000
+FALLBACK_CHANNELS = 2
+
+
+class AdmissionRejected(Exception):
+    """Requisição recusada por falta de memória disponível"""
+
+    def __init__(self, retry_after, reason):
+        super().__init__(reason)
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+def read_audio_metadata(filepath):
+    """
+    Lê (duração, sample rate, canais) sem decodificar o áudio.
+    Usa soundfile (WAV/FLAC/OGG, caminho ou file-like) e cai para audioread
+    nos demais formatos.
+    Retorna None se nenhum backend conseguir abrir o arquivo.
+    """
+    try:
+        import soundfile as sf
+        info = sf.info(filepath)
+        return float(info.duration), int(info.samplerate), int(info.channels)
+    except Exception:
+        pass
+
+    try:
+        import audioread
+        with audioread.audio_open(filepath) as f:
+            return float(f.duration), int(f.samplerate), int(f.channels)
+    except Exception:
+        return None
+
+
+def estimate_analysis_memory(duration, samplerate, channels):
+    """
+    Estima o pico de memória (bytes) de uma análise completa.
+
+    Soma os buffers de decodificação (PCM intercalado + janela mono), a STFT
+    compartilhada em complex64 com suas magnitudes temporárias e o estado do
+    pYIN (frames + matriz de observação), mais um overhead fixo do processo.
+    """
+    window_s = min(ANALYSIS_WINDOW_S, max(duration, 0.0))
+    window_samples = window_s * samplerate
+
+    # Decodificação: buffer float32 intercalado + janela mono (lista + concatenação)
+    decode_bytes = window_samples * channels * 4 + window_samples * 4 * 2
+
+    # Após a reamostragem para ANALYSIS_SR (AudioAnalyzer._prepare_signal)
+    analysis_samples = window_s * ANALYSIS_SR
+    n_frames = 1 + analysis_samples / HOP_LENGTH
+    n_bins = N_FFT // 2 + 1
+
+    spectral_bytes = n_frames * n_bins * (8 + 4 * 4)
+    pyin_bytes = n_frames * (N_FFT * 4 * 6 + PYIN_PITCH_BINS * 8 * 4)
+
+    return int(BASE_OVERHEAD_BYTES + decode_bytes + spectral_bytes + pyin_bytes)
+
+
+def estimate_file_memory(filepath):
+    """Estimativa de memória a partir do arquivo salvo ou stream (pior caso se sem metadados)"""
+    meta = read_audio_metadata(filepath)
+    if meta is None:
+        return estimate_analysis_memory(ANALYSIS_WINDOW_S + 15.0, FALLBACK_SR, FALLBACK_CHANNELS)
+    return estimate_analysis_memory(*meta)
+
+
+class AdmissionController:
+    """
+    Admite análises contra um orçamento de memória (thread-safe por worker).
+
+    Uso:
+        with controller.admit(estimated_bytes):
+            ... análise ...
+    """
+
+    def __init__(self, budget_mb=DEFAULT_MEMORY_BUDGET_MB, max_queue=DEFAULT_MAX_QUEUE,
+                 queue_timeout=DEFAULT_QUEUE_TIMEOUT):
+        self.budget_bytes = int(budget_mb * 1024 * 1024)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+
+        self._cond = threading.Condition()
+        self._in_use = 0
+        self._in_flight = 0
+        self._queue_depth = 0
+
+        # Métricas acumuladas
+        self._admitted_total = 0
+        self._queued_total = 0
+        self._rejected_total = 0
+        self._avg_service_s = 5.0  # EWMA do tempo de análise (segundos)
+
+    def _fits(self, need):
+        # Uma análise maior que o orçamento inteiro roda sozinha (não fica presa para sempre)
+        return self._in_flight == 0 or self._in_use + need <= self.budget_bytes
+
+    def _retry_after(self):
+        waiting = self._queue_depth + 1
+        slots = max(1, self._in_flight)
+        return max(1, int(math.ceil(self._avg_service_s * waiting / slots)))
+
+    def acquire(self, estimated_bytes, timeout=None):
+        """
+        Reserva memória; bloqueia na fila ou levanta AdmissionRejected.
+        timeout (opcional) só pode encurtar a espera padrão da fila.
+        """
+        need = min(int(estimated_bytes), self.budget_bytes)
+        queue_timeout = self.queue_timeout if timeout is None else min(self.queue_timeout, timeout)
+        with self._cond:
+            if self._fits(need) and self._queue_depth == 0:
+                self._grant(need)
+                return need
+
+            if self._queue_depth >= self.max_queue:
+                self._rejected_total += 1
+                raise AdmissionRejected(self._retry_after(), 'Fila de análise cheia')
+
+            self._queue_depth += 1
+            self._queued_total += 1
+            deadline = time.monotonic() + queue_timeout
+            try:
+                while not self._fits(need):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._rejected_total += 1
+                        raise AdmissionRejected(self._retry_after(), 'Tempo de espera na fila esgotado')
+                    self._cond.wait(remaining)
+            finally:
+                self._queue_depth -= 1
+
+            self._grant(need)
+            return need
+
+    def _grant(self, need):
+        self._in_use += need
+        self._in_flight += 1
+        self._admitted_total += 1
+
+    def release(self, reserved_bytes, service_s=None):
+        """Devolve a memória reservada e acorda a fila"""
+        with self._cond:
+            self._in_use = max(0, self._in_use - reserved_bytes)
+            self._in_flight = max(0, self._in_flight - 1)
+            if service_s is not None:
+                self._avg_service_s = 0.8 * self._avg_service_s + 0.2 * service_s
+            self._cond.notify_all()
+
+    @contextmanager
+    def admit(self, estimated_bytes, timeout=None):
+        """Context manager que reserva e libera a memória da análise"""
+        reserved = self.acquire(estimated_bytes, timeout)
+        start = time.monotonic()
+        try:
+            yield reserved
+        finally:
+            self.release(reserved, time.monotonic() - start)
+
+    def metrics(self):
+        """Snapshot das métricas de admissão"""
+        with self._cond:
+            return {
+                'queue_depth': self._queue_depth,
+                'in_flight': self._in_flight,
+                'memory_in_use_mb': round(self._in_use / (1024 * 1024), 1),
+                'memory_budget_mb': round(self.budget_bytes / (1024 * 1024), 1),
+                'admitted_total': self._admitted_total,
+                'queued_total': self._queued_total,
+                'rejected_total': self._rejected_total,
+                'avg_service_s': round(self._avg_service_s, 2)
+            }
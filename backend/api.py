@@ -8,6 +8,7 @@ except AttributeError:
     pass
 
 import gc
+import hashlib
 import traceback
 import time
 
@@ -47,19 +48,43 @@ else:
 
 # Imports locais do projeto (agora que o path está corrigido)
 try:
-    from backend.audio_analyzer import AudioAnalyzer
+    from backend.audio_analyzer import AudioAnalyzer, ANALYSIS_PROFILE, FINGERPRINT_PROFILE, PCM_ENCODINGS, pcm_from_bytes, sniff_container
     from backend.hit_predictor import HitPredictor
+    from backend.admission_control import AdmissionController, AdmissionRejected, estimate_file_memory, estimate_analysis_memory
+    from backend.single_flight import SingleFlight, file_content_hash
+    from backend.cancellation import CancellationRegistry, AnalysisCancelled, AnalysisDeadlineExceeded
+    from backend.feature_tokens import encode_feature_token, decode_feature_token, InvalidFeatureToken
+    from backend.genre_suggestion import GENRE_RULES, calculate_genre_scores, suggest_genres
+    from backend.fingerprint_index import FingerprintIndex
+    from backend.similarity_index import SimilarityIndex, GENRE_DATASETS
+    from backend.decoder_pool import DecoderPool, DecoderPoolError, DecodeFailed
+    from backend.chunked_upload import UploadRegistry, UploadSessionNotFound, ChunkRejected, UploadAborted, UploadCapacityExceeded, DEFAULT_CHUNK_SIZE, streamable_extensions
     print("[INIT] Modulos internos carregados com sucesso")
 except ImportError as e:
     print(f"[ERROR] Erro ao carregar modulos internos: {e}")
     # Tenta import direto se estiver dentro da pasta backend
     try:
-        from audio_analyzer import AudioAnalyzer
+        from audio_analyzer import AudioAnalyzer, ANALYSIS_PROFILE, FINGERPRINT_PROFILE, PCM_ENCODINGS, pcm_from_bytes, sniff_container
         from hit_predictor import HitPredictor
+        from admission_control import AdmissionController, AdmissionRejected, estimate_file_memory, estimate_analysis_memory
+        from single_flight import SingleFlight, file_content_hash
+        from cancellation import CancellationRegistry, AnalysisCancelled, AnalysisDeadlineExceeded
+        from feature_tokens import encode_feature_token, decode_feature_token, InvalidFeatureToken
+        from genre_suggestion import GENRE_RULES, calculate_genre_scores, suggest_genres
+        from fingerprint_index import FingerprintIndex
+        from similarity_index import SimilarityIndex, GENRE_DATASETS
+        from decoder_pool import DecoderPool, DecoderPoolError, DecodeFailed
+        from chunked_upload import UploadRegistry, UploadSessionNotFound, ChunkRejected, UploadAborted, UploadCapacityExceeded, DEFAULT_CHUNK_SIZE, streamable_extensions
         print("[INIT] Modulos internos carregados (import direto)")
     except ImportError:
         print("[ERROR] Falha critica no carregamento dos modulos")
 
+# Store colunar dos datasets (ml/dataset_store.py); sem ele, os CSVs são lidos direto
+try:
+    from ml.dataset_store import load_table
+except ImportError:
+    load_table = None
+
 print(f"DEBUG: Modo Executável: {getattr(sys, 'frozen', False)}")
 print(f"DEBUG: Diretório Base: {project_root}")
 print(f"DEBUG: Pasta do Frontend: {static_dir}")
@@ -75,51 +100,26 @@ CORS(app)
 UPLOAD_FOLDER = os.path.join(project_root, 'backend', 'uploads')
 def get_hit_averages_by_genre(genre_id):
     """Retorna médias das features dos hits para um gênero específico"""
-    import pandas as pd
-    
-    # Mapeia genre_id para arquivo de dataset
-    # Cada gênero tem seu próprio dataset específico
-    mpb_dataset = os.path.join(project_root, 'ml', 'datasets', 'kaggle_mpb_ml.csv')
-    rnb_dataset = os.path.join(project_root, 'ml', 'datasets', 'kaggle_rnb_ml.csv')
-    pop_urban_dataset = os.path.join(project_root, 'ml', 'datasets', 'kaggle_pop_urban_brasil_ml.csv')
-    sertanejo_dataset = os.path.join(project_root, 'ml', 'datasets', 'kaggle_sertanejo_ml.csv')
-    forro_dataset = os.path.join(project_root, 'ml', 'datasets', 'kaggle_forro_ml.csv')
-    pagode_dataset = os.path.join(project_root, 'ml', 'datasets', 'kaggle_pagode_ml.csv')
-    samba_dataset = os.path.join(project_root, 'ml', 'datasets', 'kaggle_samba_ml.csv')
-    
-    genre_files = {
-        'mpb': mpb_dataset,
-        'mpb_rock': mpb_dataset,
-        'mpb_indie': mpb_dataset,
-        'rnb_brasil': rnb_dataset,
-        'rnb_trap': rnb_dataset,
-        'rnb_pop': rnb_dataset,
-        'pop_urban_brasil': pop_urban_dataset,
-        'sertanejo': sertanejo_dataset,
-        'pagode': pagode_dataset,
-        'samba': samba_dataset,
-        'forro': forro_dataset,
-        'brazil': pop_urban_dataset,
-        'generic': None
-    }
-    
-    file_path = genre_files.get(genre_id)
-    if not file_path or not os.path.exists(file_path):
-        print(f"    [WARNING] Dataset não encontrado para gênero: {genre_id}")
+    # Cada gênero/subcategoria usa o dataset consolidado do gênero
+    dataset = GENRE_DATASETS.get(genre_id)
+    if dataset is None:
         return None
+    table = f'consolidated_knn/{dataset}_consolidated'
+    features = HitPredictor.ML_FEATURES
     
     try:
-        df = pd.read_csv(file_path)
-        hits = df[df['is_hit'] == 1]
+        if load_table is not None:
+            # Store colunar: lê só as features dos hits
+            hits = load_table(table, columns=features, filters=[('is_hit', '==', 1)])
+        else:
+            import pandas as pd
+            df = pd.read_csv(os.path.join(project_root, 'ml', 'datasets', f'{table}.csv'), encoding='utf-8-sig')
+            hits = df[df['is_hit'] == 1]
         
         if len(hits) == 0:
             print(f"    [WARNING] Nenhum hit encontrado no dataset: {genre_id}")
             return None
         
-        features = ['bpm', 'energy', 'danceability', 'valence', 
-                    'acousticness', 'instrumentalness', 'liveness', 
-                    'speechiness', 'loudness']
-        
         averages = {}
         for feature in features:
             if feature in hits.columns:
@@ -135,16 +135,176 @@ def get_hit_averages_by_genre(genre_id):
 ALLOWED_EXTENSIONS = {'mp3', 'wav', 'ogg', 'flac', 'm4a'}
 MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB
 
+# Upload de PCM decodificado no navegador: só a janela de análise (30s) + folga
+PCM_MAX_WINDOW_S = 31.0
+PCM_MIN_SAMPLE_RATE = 4000
+PCM_MAX_SAMPLE_RATE = 192000
+
 # Cria pasta de uploads se não existir
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE
 
+# Controle de admissão: limita a memória total das análises simultâneas deste worker
+# (ANALYSIS_MEMORY_BUDGET_MB, ANALYSIS_MAX_QUEUE, ANALYSIS_QUEUE_TIMEOUT)
+admission = AdmissionController()
+
+# Coalescência de análises idênticas simultâneas (hash do conteúdo + perfil de análise)
+analysis_flights = SingleFlight()
+
+# Tokens de cancelamento por request_id + prazo por análise (ANALYSIS_DEADLINE_S)
+cancellations = CancellationRegistry()
+
+# Processos decodificadores para M4A/AAC e outros formatos fora da libsndfile
+# (DECODER_POOL_SIZE, 0 desativa). Sobem no primeiro uso; no gunicorn, pelo
+# post_worker_init de gunicorn.conf.py (nunca no import: reloader/desktop).
+decoder_pool = DecoderPool()
+
+# Índice de fingerprints: reaproveita features da mesma música em outro encode
+fingerprints = FingerprintIndex()
+
+# Hits mais parecidos por gênero (KD-tree sobre as ML_FEATURES padronizadas)
+similarity = SimilarityIndex()
+SIMILAR_HITS_K = 5
+
+# Uploads em blocos (resumíveis); formatos que o soundfile decodifica enquanto chegam
+uploads = UploadRegistry(UPLOAD_FOLDER)
+STREAMABLE_EXTENSIONS = streamable_extensions()
+
 def allowed_file(filename):
     """Verifica se a extensão do arquivo é permitida"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def admission_rejected_response(rejected):
+    """Resposta 429 com Retry-After quando o orçamento de memória está esgotado"""
+    print(f"⚠️ [ADMISSION] Rejeitado: {rejected.reason} (Retry-After={rejected.retry_after}s)")
+    response = jsonify({
+        'error': 'Servidor ocupado, tente novamente em instantes',
+        'reason': rejected.reason,
+        'retry_after': rejected.retry_after
+    })
+    response.headers['Retry-After'] = str(rejected.retry_after)
+    return response, 429
+
+def cancelled_response(cancelled):
+    """Resposta para análise interrompida (504 prazo esgotado, 499 cliente desistiu)"""
+    cancellations.record(cancelled)
+    timed_out = isinstance(cancelled, AnalysisDeadlineExceeded)
+    print(f"⚠️ [CANCEL] Análise interrompida: {cancelled}")
+    return jsonify({
+        'error': str(cancelled),
+        'cancelled': True,
+        'timed_out': timed_out
+    }), 504 if timed_out else 499
+
+def analyze_with_fingerprint(analyzer, label):
+    """
+    Carrega o sinal (se ainda não carregado), consulta o índice de fingerprints
+    e só roda a extração completa quando não há faixa equivalente já analisada.
+    """
+    if analyzer.y is None:
+        analyzer.load_audio()
+    
+    # Índice desligado (FINGERPRINT_INDEX=0): nem calcula os landmarks
+    if not fingerprints.enabled:
+        return analyzer.analyze_all()
+    
+    hashes, times = analyzer.fingerprint()
+    match = fingerprints.lookup(hashes, times, FINGERPRINT_PROFILE)
+    if match is not None:
+        print(f">>> [FINGERPRINT] Match para {label}: faixa {match.track_id} "
+              f"({match.votes} votos, {match.ratio:.0%} dos hashes) - extração evitada")
+        features = dict(match.features)
+        features['duration'] = analyzer.features.get('duration', features.get('duration'))
+        return features
+    
+    features = analyzer.analyze_all()
+    fingerprints.add(hashes, times, FINGERPRINT_PROFILE, features)
+    return features
+
+def extract_features(filepath, label, token=None):
+    """Decodifica e extrai features sob o controle de admissão de memória"""
+    estimated_bytes = estimate_file_memory(filepath)
+    print(f">>> [ADMISSION] Estimativa: {estimated_bytes / (1024 * 1024):.1f} MB - {admission.metrics()}")
+    
+    with admission.admit(estimated_bytes, timeout=token.remaining() if token else None):
+        print(f">>> [IA] Iniciando extração de features: {label}")
+        analyzer = AudioAnalyzer(filepath, cancel_token=token)
+        
+        # WAV/FLAC/OGG/MP3 decodificam no próprio processo (libsndfile); o resto (M4A) vai para o pool
+        if decoder_pool.enabled and sniff_container(filepath) is None:
+            try:
+                analyzer.load_decoded(*decoder_pool.decode(filepath, token))
+            except DecodeFailed as e:
+                raise RuntimeError(f"Erro ao carregar arquivo de áudio: {e}")
+            except DecoderPoolError as e:
+                print(f"⚠️ [DECODER] {e} - decodificando no processo principal")
+        return analyze_with_fingerprint(analyzer, label)
+
+def extract_pcm_features(samples, sr, duration, label, token=None):
+    """Extrai features de PCM já decodificado sob o controle de admissão de memória"""
+    estimated_bytes = estimate_analysis_memory(len(samples) / sr, sr, 1)
+    print(f">>> [ADMISSION] Estimativa (PCM): {estimated_bytes / (1024 * 1024):.1f} MB - {admission.metrics()}")
+    
+    with admission.admit(estimated_bytes, timeout=token.remaining() if token else None):
+        print(f">>> [IA] Iniciando extração de features (PCM): {label}")
+        analyzer = AudioAnalyzer(label, cancel_token=token)
+        analyzer.load_pcm(samples, sr, duration)
+        return analyze_with_fingerprint(analyzer, label)
+
+def extract_stream_features(session, label, token=None):
+    """
+    Extrai features de um upload em blocos ainda em andamento: a leitura só
+    espera pelos blocos da janela de análise (ver chunked_upload).
+    """
+    wait_check = token.check if token else None
+    reader = session.open_reader(wait_check)
+    try:
+        # Metadados vêm do cabeçalho (primeiro bloco); pior caso se ilegíveis
+        estimated_bytes = estimate_file_memory(reader)
+        if reader.error is not None:
+            raise reader.error
+        reader.seek(0)
+        print(f">>> [ADMISSION] Estimativa (stream): {estimated_bytes / (1024 * 1024):.1f} MB - {admission.metrics()}")
+        
+        with admission.admit(estimated_bytes, timeout=token.remaining() if token else None):
+            print(f">>> [IA] Iniciando extração de features (stream): {label}")
+            analyzer = AudioAnalyzer(label, cancel_token=token)
+            analyzer.load_stream(reader)
+            return analyze_with_fingerprint(analyzer, label)
+    finally:
+        reader.close()
+
+def single_flight_features(key, compute, label, token=None):
+    """
+    Executa compute() coalescendo requisições idênticas em andamento.
+    Retorna (features, shared) - shared=True se reaproveitou outra execução.
+    
+    Se o líder for cancelado, os seguidores ainda ativos refazem a chamada
+    (um deles assume a extração) em vez de herdar o cancelamento.
+    """
+    while True:
+        try:
+            features, shared = analysis_flights.do(
+                key,
+                compute,
+                wait_check=token.check if token else None
+            )
+            break
+        except AnalysisCancelled:
+            if token is None or token.cancelled or token.remaining() == 0:
+                raise
+            print(f">>> [SINGLE-FLIGHT] Líder cancelado, reexecutando para: {label}")
+    if shared:
+        print(f">>> [SINGLE-FLIGHT] Resultado compartilhado para: {label}")
+    return dict(features), shared
+
+def extract_features_single_flight(filepath, label, token=None):
+    """Features de um arquivo salvo, coalescidas pelo hash do conteúdo"""
+    key = (file_content_hash(filepath), ANALYSIS_PROFILE)
+    return single_flight_features(key, lambda: extract_features(filepath, label, token), label, token)
+
 @app.before_request
 def log_request_info():
     print(f"\n>>> [HTTP] {request.method} {request.path}")
@@ -165,9 +325,99 @@ def health_check():
     """Endpoint de health check"""
     return jsonify({'status': 'healthy', 'message': 'Hit Predictor API is running'})
 
-@app.route('/api/analyze', methods=['POST'])
-def analyze_audio():
-    """Endpoint principal para análise de áudio"""
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Métricas operacionais do worker (fila de admissão, memória reservada)"""
+    return jsonify({
+        'admission': admission.metrics(),
+        'single_flight': analysis_flights.metrics(),
+        'cancellation': cancellations.metrics(),
+        'uploads': uploads.metrics(),
+        'decoder_pool': decoder_pool.metrics(),
+        'fingerprints': fingerprints.metrics(),
+        'similarity': similarity.metrics()
+    })
+
+@app.route('/api/analyze/cancel', methods=['POST'])
+def cancel_analysis():
+    """Cancela uma análise em andamento (frontend abortou o fetch ou fechou a aba)"""
+    payload = request.get_json(silent=True) or {}
+    request_id = payload.get('request_id') or request.form.get('request_id') or request.args.get('request_id')
+    if not request_id:
+        return jsonify({'error': 'request_id obrigatório'}), 400
+    
+    cancelled = cancellations.cancel(request_id)
+    print(f">>> [CANCEL] request_id={request_id} ativo={cancelled}")
+    return jsonify({'success': True, 'cancelled': cancelled})
+
+def find_similar_hits(features, genre_id, k=SIMILAR_HITS_K):
+    """Hits conhecidos mais parecidos (vazio se o gênero não tiver dataset)"""
+    try:
+        return similarity.query(features, genre_id, k)
+    except Exception as e:
+        print(f"    [ERROR] Busca de hits similares falhou para {genre_id}: {e}")
+        return []
+
+def predict_genres(features, requested_genres, token=None):
+    """Roda o HitPredictor de cada gênero pedido e anexa as médias dos hits"""
+    predictions = {}
+    for genre_id in requested_genres:
+        if token is not None:
+            token.check()
+        actual_genre = None if genre_id == 'generic' else genre_id
+        predictor = HitPredictor(genre=actual_genre)
+        prediction = predictor.predict(features)
+        
+        # Adiciona médias dos hits para comparação
+        hit_averages = get_hit_averages_by_genre(genre_id)
+        prediction['hit_averages'] = hit_averages
+        prediction['similar_hits'] = find_similar_hits(features, genre_id)
+        
+        predictions[genre_id] = prediction
+        print(f"    - Score para {genre_id}: {prediction['hit_score']}")
+    return predictions
+
+def run_analysis(extract, label, build_response):
+    """
+    Registra o token de cancelamento (request_id + prazo opcional do form),
+    roda extract(token) -> (features, shared), trata os erros da análise e
+    delega a resposta a build_response(features, label, token).
+    """
+    request_id = request.form.get('request_id')
+    token = cancellations.register(request_id, request.form.get('deadline_s', type=float))
+    
+    try:
+        features, shared = extract(token)
+        
+        print(f"\n[DEBUG] FEATURES EXTRAIDAS EM TEMPO REAL:")
+        print(f"File: {label}")
+        for k, v in features.items():
+            print(f"  {k}: {v}")
+        
+        # Log das features extraídas para o terminal
+        print(f"    [RESULTS] {label}: BPM={features['bpm']:.1f}, Energy={features['energy']:.2f}, Loudness={features['loudness']:.1f}dB")
+        
+        return build_response(features, label, token)
+    except AdmissionRejected as rejected:
+        return admission_rejected_response(rejected)
+    except AnalysisCancelled as cancelled:
+        return cancelled_response(cancelled)
+    except Exception as analysis_err:
+        print(f"❌ ERRO Durante Análise IA: {str(analysis_err)}")
+        traceback.print_exc()
+        return jsonify({
+            'error': f'Falha na análise da música: {str(analysis_err)}',
+            'details': traceback.format_exc()
+        }), 500
+    finally:
+        cancellations.unregister(request_id)
+
+def handle_audio_upload(build_response):
+    """
+    Fluxo comum dos endpoints de upload: valida e salva o arquivo, extrai as
+    features (admissão + single-flight + cancelamento) e delega a resposta a
+    build_response(features, filename, token). Remove o arquivo ao final.
+    """
     try:
         # Verifica se há arquivo na requisição
         if 'audio' not in request.files:
@@ -185,13 +435,6 @@ def analyze_audio():
                 'error': f'Formato não suportado. Use: {", ".join(ALLOWED_EXTENSIONS)}'
             }), 400
         
-        # Pega gêneros selecionados (pode ser um ou vários)
-        requested_genres = request.form.getlist('genres[]')
-        if not requested_genres:
-            # Fallback para o campo antigo 'genre' se o novo não existir
-            old_genre = request.form.get('genre', 'generic')
-            requested_genres = [old_genre]
-            
         # Salva arquivo temporariamente com nome seguro e único
         base_filename = secure_filename(file.filename)
         if not base_filename:
@@ -210,48 +453,12 @@ def analyze_audio():
             return jsonify({'error': 'Falha ao salvar arquivo no servidor'}), 500
 
         try:
-            # Analisa áudio (extração de features é feita só uma vez)
-            print(f">>> [IA] Iniciando extração de features: {filename}")
-            
-            analyzer = AudioAnalyzer(filepath)            # Análise
-            features = analyzer.analyze_all()
-            
-            print(f"\n[DEBUG] FEATURES EXTRAIDAS EM TEMPO REAL:")
-            print(f"File: {file.filename}")
-            for k, v in features.items():
-                print(f"  {k}: {v}")
-            
-            # Log das features extraídas para o terminal
-            print(f"    [RESULTS] {file.filename}: BPM={features['bpm']:.1f}, Energy={features['energy']:.2f}, Loudness={features['loudness']:.1f}dB")
-            
-            # Predições
-            predictions = {}
-            for genre_id in requested_genres:
-                actual_genre = None if genre_id == 'generic' else genre_id
-                predictor = HitPredictor(genre=actual_genre)
-                prediction = predictor.predict(features)
-                
-                # Adiciona médias dos hits para comparação
-                hit_averages = get_hit_averages_by_genre(genre_id)
-                prediction['hit_averages'] = hit_averages
-                
-                predictions[genre_id] = prediction
-                print(f"    - Score para {genre_id}: {prediction['hit_score']}")
-            
-            return jsonify({
-                'success': True,
-                'filename': filename,
-                'features': features,
-                'predictions': predictions # Novo formato: mapa de gênero -> predição
-            })
-        except Exception as analysis_err:
-            print(f"❌ ERRO Durante Análise IA: {str(analysis_err)}")
-            traceback.print_exc()
-            return jsonify({
-                'error': f'Falha na análise da música: {str(analysis_err)}',
-                'details': traceback.format_exc()
-            }), 500
-        
+            # Analisa áudio (extração de features é feita só uma vez por conteúdo em andamento)
+            return run_analysis(
+                lambda token: extract_features_single_flight(filepath, filename, token),
+                filename,
+                build_response
+            )
         finally:
             # Limpeza agressiva de memória antes de tentar deletar o arquivo
             gc.collect()
@@ -273,6 +480,313 @@ def analyze_audio():
             'details': traceback.format_exc()
         }), 500
 
+def parse_pcm_upload():
+    """
+    Lê o upload de PCM do form: campo 'pcm' (mono, janela de análise já
+    recortada), 'encoding' (s16le/f32le), 'sample_rate' e 'duration' do original.
+    Levanta ValueError com mensagem para o cliente.
+    """
+    if 'pcm' not in request.files:
+        raise ValueError('Nenhum PCM enviado')
+    
+    encoding = request.form.get('encoding', 's16le')
+    if encoding not in PCM_ENCODINGS:
+        raise ValueError(f'Codificação não suportada. Use: {", ".join(PCM_ENCODINGS)}')
+    
+    sample_rate = request.form.get('sample_rate', type=int)
+    if not sample_rate or not PCM_MIN_SAMPLE_RATE <= sample_rate <= PCM_MAX_SAMPLE_RATE:
+        raise ValueError(f'sample_rate deve estar entre {PCM_MIN_SAMPLE_RATE} e {PCM_MAX_SAMPLE_RATE}')
+    
+    max_bytes = int(PCM_MAX_WINDOW_S * sample_rate) * PCM_ENCODINGS[encoding].itemsize
+    raw = request.files['pcm'].read(max_bytes + 1)
+    if len(raw) > max_bytes:
+        raise ValueError(f'PCM maior que a janela de análise ({PCM_MAX_WINDOW_S:.0f}s)')
+    
+    samples = pcm_from_bytes(raw, encoding)
+    if len(samples) < sample_rate:
+        raise ValueError('PCM muito curto (mínimo 1s)')
+    
+    duration = request.form.get('duration', type=float)
+    return raw, samples, sample_rate, encoding, duration
+
+def handle_pcm_upload(build_response):
+    """
+    Fluxo dos endpoints de PCM: o navegador já decodificou, recortou a janela,
+    misturou para mono e reduziu a taxa. Não há arquivo nem decodificador no
+    servidor; o resto (admissão, single-flight, cancelamento) é o mesmo do upload.
+    """
+    try:
+        raw, samples, sample_rate, encoding, duration = parse_pcm_upload()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    label = secure_filename(request.form.get('filename', '')) or 'pcm_upload'
+    print(f">>> [UPLOAD] PCM recebido: {label} ({len(raw) / 1024:.0f} KB, {encoding}, {sample_rate} Hz)")
+    
+    key = (hashlib.sha256(raw).hexdigest(), encoding, sample_rate, duration, ANALYSIS_PROFILE)
+    return run_analysis(
+        lambda token: single_flight_features(
+            key,
+            lambda: extract_pcm_features(samples, sample_rate, duration, label, token),
+            label,
+            token
+        ),
+        label,
+        build_response
+    )
+
+def handle_chunked_upload(upload_id, build_response):
+    """
+    Fluxo dos endpoints de upload em blocos: roda em paralelo ao envio dos
+    blocos. Formatos suportados pelo soundfile são decodificados à medida que
+    chegam; os demais esperam o arquivo completo e seguem o fluxo normal.
+    A sessão é descartada ao final (blocos enviados depois recebem 404).
+    """
+    try:
+        session = uploads.get(upload_id)
+    except UploadSessionNotFound as e:
+        return jsonify({'error': str(e)}), 404
+    
+    label = session.filename
+    
+    def extract(token):
+        wait_check = token.check if token else None
+        if session.extension in STREAMABLE_EXTENSIONS:
+            key = ('upload', session.id, ANALYSIS_PROFILE)
+            return single_flight_features(key, lambda: extract_stream_features(session, label, token), label, token)
+        session.wait_complete(wait_check)
+        return extract_features_single_flight(session.path, label, token)
+    
+    try:
+        return run_analysis(extract, label, build_response)
+    finally:
+        uploads.remove(upload_id)
+        gc.collect()
+
+@app.route('/api/upload', methods=['POST'])
+def start_chunked_upload():
+    """Abre uma sessão de upload em blocos: {filename, total_size, chunk_size?}"""
+    payload = request.get_json(silent=True) or {}
+    filename = secure_filename(payload.get('filename') or '')
+    if not filename or not allowed_file(filename):
+        return jsonify({
+            'error': f'Formato não suportado. Use: {", ".join(ALLOWED_EXTENSIONS)}'
+        }), 400
+    
+    try:
+        total_size = int(payload.get('total_size', 0))
+        chunk_size = int(payload.get('chunk_size', DEFAULT_CHUNK_SIZE))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'total_size e chunk_size devem ser inteiros'}), 400
+    if not 0 < total_size <= MAX_FILE_SIZE:
+        return jsonify({
+            'error': 'Arquivo muito grande' if total_size > 0 else 'total_size inválido',
+            'max_size_mb': MAX_FILE_SIZE / (1024 * 1024)
+        }), 400 if total_size <= 0 else 413
+    
+    try:
+        session = uploads.create(filename, total_size, chunk_size)
+    except UploadCapacityExceeded as e:
+        print(f"⚠️ [UPLOAD] Rejeitado: {e.reason} (Retry-After={e.retry_after}s) - {uploads.metrics()}")
+        response = jsonify({
+            'error': 'Servidor ocupado, tente novamente em instantes',
+            'reason': e.reason,
+            'retry_after': e.retry_after
+        })
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, 429
+    print(f">>> [UPLOAD] Sessão {session.id}: {filename} ({total_size / 1024:.0f} KB, {session.n_chunks} blocos)")
+    status = session.status()
+    status['streaming'] = session.extension in STREAMABLE_EXTENSIONS
+    return jsonify(status)
+
+@app.route('/api/upload/<upload_id>', methods=['GET'])
+def chunked_upload_status(upload_id):
+    """Blocos já recebidos (para retomar um upload interrompido)"""
+    try:
+        return jsonify(uploads.get(upload_id).status())
+    except UploadSessionNotFound as e:
+        return jsonify({'error': str(e)}), 404
+
+@app.route('/api/upload/<upload_id>', methods=['DELETE'])
+def abort_chunked_upload(upload_id):
+    """Descarta a sessão (o cliente desistiu)"""
+    uploads.remove(upload_id)
+    return jsonify({'success': True})
+
+@app.route('/api/upload/<upload_id>/chunks/<int:index>', methods=['PUT'])
+def put_upload_chunk(upload_id, index):
+    """Recebe um bloco cru; o SHA-256 do bloco vem no header X-Chunk-SHA256"""
+    try:
+        session = uploads.get(upload_id)
+        session.write_chunk(index, request.get_data(cache=False), request.headers.get('X-Chunk-SHA256'))
+    except UploadSessionNotFound as e:
+        return jsonify({'error': str(e)}), 404
+    except UploadAborted as e:
+        return jsonify({'error': str(e)}), 410
+    except ChunkRejected as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'success': True, 'index': index, 'complete': session.complete})
+
+@app.route('/api/upload/<upload_id>/analyze', methods=['POST'])
+def analyze_chunked_upload(upload_id):
+    """Como /api/analyze, sobre um upload em blocos (pode começar antes do último bloco)"""
+    return handle_chunked_upload(upload_id, analysis_response(requested_genres_from_form()))
+
+@app.route('/api/upload/<upload_id>/features', methods=['POST'])
+def chunked_upload_features(upload_id):
+    """Como /api/features, sobre um upload em blocos (pode começar antes do último bloco)"""
+    return handle_chunked_upload(upload_id, features_response)
+
+def requested_genres_from_form():
+    """Gêneros selecionados no form (pode ser um ou vários)"""
+    requested_genres = request.form.getlist('genres[]')
+    if not requested_genres:
+        # Fallback para o campo antigo 'genre' se o novo não existir
+        old_genre = request.form.get('genre', 'generic')
+        requested_genres = [old_genre]
+    return requested_genres
+
+def analysis_response(requested_genres):
+    """build_response de /api/analyze: features + predições por gênero"""
+    def respond(features, filename, token):
+        predictions = predict_genres(features, requested_genres, token)
+        return jsonify({
+            'success': True,
+            'filename': filename,
+            'features': features,
+            'predictions': predictions # Novo formato: mapa de gênero -> predição
+        })
+    return respond
+
+def features_response(features, filename, token):
+    """build_response de /api/features: features + feature_token assinado"""
+    return jsonify({
+        'success': True,
+        'filename': filename,
+        'features': features,
+        'feature_token': encode_feature_token(features, ANALYSIS_PROFILE),
+        'genre_scores': calculate_genre_scores(features)
+    })
+
+@app.route('/api/analyze', methods=['POST'])
+def analyze_audio():
+    """Endpoint principal para análise de áudio (features + predições)"""
+    return handle_audio_upload(analysis_response(requested_genres_from_form()))
+
+@app.route('/api/analyze/pcm', methods=['POST'])
+def analyze_pcm():
+    """Como /api/analyze, mas recebe PCM decodificado no navegador"""
+    return handle_pcm_upload(analysis_response(requested_genres_from_form()))
+
+@app.route('/api/features', methods=['POST'])
+def extract_audio_features():
+    """
+    Extrai apenas as features (sem predição) e devolve um feature_token
+    assinado para ser usado em /api/predict e /api/suggest-genres sem reenviar o áudio.
+    """
+    return handle_audio_upload(features_response)
+
+@app.route('/api/features/pcm', methods=['POST'])
+def extract_pcm_audio_features():
+    """Como /api/features, mas recebe PCM decodificado no navegador"""
+    return handle_pcm_upload(features_response)
+
+def resolve_features(payload):
+    """
+    Features de um payload JSON: 'feature_token' (de /api/features) ou 'features' cruas.
+    Levanta InvalidFeatureToken/ValueError com mensagem para o cliente.
+    """
+    if payload.get('feature_token'):
+        return decode_feature_token(payload['feature_token'], ANALYSIS_PROFILE)
+    
+    features = payload.get('features')
+    if not isinstance(features, dict):
+        raise ValueError("Envie 'feature_token' ou 'features'")
+    
+    missing = [f for f in HitPredictor.ML_FEATURES if f not in features]
+    if missing:
+        raise ValueError(f"Features obrigatórias ausentes: {', '.join(missing)}")
+    try:
+        return {k: (v if isinstance(v, str) else float(v)) for k, v in features.items()}
+    except (TypeError, ValueError):
+        raise ValueError('Valores de features devem ser numéricos')
+
+def parse_genres(payload, default):
+    """'genres' do payload: lista não vazia de strings (ausente -> default)"""
+    genres = payload.get('genres')
+    if genres is None:
+        return default
+    if not isinstance(genres, list) or not genres or not all(isinstance(g, str) and g for g in genres):
+        raise ValueError("'genres' deve ser uma lista não vazia de strings")
+    return genres
+
+@app.route('/api/predict', methods=['POST'])
+def predict_from_features():
+    """Predições para qualquer conjunto de gêneros a partir de features já extraídas"""
+    payload = request.get_json(silent=True) or {}
+    
+    try:
+        requested_genres = parse_genres(payload, ['generic'])
+        features = resolve_features(payload)
+    except (InvalidFeatureToken, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    
+    predictions = predict_genres(features, requested_genres)
+    return jsonify({
+        'success': True,
+        'features': features,
+        'predictions': predictions
+    })
+
+@app.route('/api/similar', methods=['POST'])
+def similar_hits():
+    """Top-k hits mais parecidos por gênero: {feature_token|features, genres, k}"""
+    payload = request.get_json(silent=True) or {}
+    try:
+        k = min(50, max(1, int(payload.get('k', SIMILAR_HITS_K))))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'k deve ser inteiro'}), 400
+    
+    genre = payload.get('genre', 'generic')
+    if not isinstance(genre, str) or not genre:
+        return jsonify({'error': "'genre' deve ser uma string"}), 400
+    try:
+        requested_genres = parse_genres(payload, [genre])
+        features = resolve_features(payload)
+    except (InvalidFeatureToken, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({
+        'success': True,
+        'similar': {genre_id: find_similar_hits(features, genre_id, k) for genre_id in requested_genres}
+    })
+
+@app.route('/api/suggest-genres', methods=['POST'])
+def suggest_genres_endpoint():
+    """Sugere os gêneros mais compatíveis com uma ou mais músicas (média dos scores)"""
+    payload = request.get_json(silent=True) or {}
+    try:
+        top_k = min(len(GENRE_RULES), max(1, int(payload.get('top_k', 2))))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'top_k deve ser inteiro'}), 400
+    
+    try:
+        features_list = [decode_feature_token(t, ANALYSIS_PROFILE) for t in payload.get('feature_tokens', [])]
+        features_list += [resolve_features({'features': f}) for f in payload.get('features', [])]
+    except (InvalidFeatureToken, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if not features_list:
+        return jsonify({'error': "Envie 'feature_tokens' ou 'features'"}), 400
+    
+    scores, suggested = suggest_genres(features_list, top_k=top_k)
+    return jsonify({
+        'success': True,
+        'scores': scores,
+        'suggested': suggested
+    })
+
 @app.route('/api/supported-formats', methods=['GET'])
 def get_supported_formats():
     """Retorna formatos de áudio suportados"""
@@ -351,55 +865,6 @@ def static_proxy(path):
         return send_from_directory(static_dir, path)
     return send_from_directory(static_dir, 'index.html')
 
-def get_hit_averages_by_genre(genre_id):
-    """Retorna médias das features dos hits para o gênero"""
-    if genre_id == 'brazil': 
-        genre_id = 'pop_urban_brasil'
-        
-    features = ['bpm', 'energy', 'danceability', 'valence', 
-                'acousticness', 'instrumentalness', 'liveness', 
-                'speechiness', 'loudness']
-    
-    # Reutiliza lógica de arquivo do main
-    import sys
-    if getattr(sys, 'frozen', False):
-        project_root = sys._MEIPASS
-    else:
-        project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        
-    ml_dir = os.path.join(project_root, 'ml', 'datasets')
-    
-    # Mapeamento simples
-    dataset_map = {
-        'mpb': 'kaggle_mpb_ml.csv',
-        'rnb_brasil': 'kaggle_rnb_ml.csv',
-        'pop_urban_brasil': 'kaggle_pop_urban_brasil_ml.csv',
-        'sertanejo': 'kaggle_sertanejo_ml.csv',
-        'pagode': 'kaggle_pagode_ml.csv',
-        'samba': 'kaggle_samba_ml.csv',
-        'forro': 'kaggle_forro_ml.csv'
-    }
-    
-    filename = dataset_map.get(genre_id)
-    if not filename: return None
-    
-    path = os.path.join(ml_dir, filename)
-    if not os.path.exists(path): return None
-    
-    try:
-        import pandas as pd # Ensure pandas is imported
-        df = pd.read_csv(path)
-        hits = df[df['is_hit'] == 1]
-        if hits.empty: return None
-        
-        avgs = {}
-        for f in features:
-            if f in hits.columns:
-                avgs[f] = float(hits[f].mean())
-        return avgs
-    except:
-        return None
-
 if __name__ == '__main__':
     PORT = 5002
     print(f"\n==========================================")
@@ -2,6 +2,7 @@
 import os
 import sys
 import subprocess
+from functools import lru_cache
 import numpy as np
 import librosa
 
@@ -42,17 +43,314 @@ except Exception as e:
 # import numpy as np
 # from scipy import stats
 
+# Política de dtype do analisador: sinais em float32 e espectros em complex64
+# do carregamento até a calibragem (metade da memória de float64/complex128)
+AUDIO_DTYPE = np.float32
+SPECTRUM_DTYPE = np.complex64
+
+# Parâmetros do estágio MFCC (mesmas convenções do librosa.feature.mfcc)
+N_MELS = 40
+N_MFCC_MAX = 13
+
+# Identificador dos parâmetros que afetam as features extraídas (janela, taxa,
+# dtype, MFCC). Mudou algum deles? Atualize para invalidar resultados reaproveitados.
+ANALYSIS_PROFILE = 'native-v4:win30s@15s:sr11025-poly:float32:mfcc5'
+
+# Taxa de análise: toda janela é levada exatamente a ela (ver _prepare_signal)
+ANALYSIS_SR = 11025
+
+# Fingerprint por pares de picos espectrais (landmarks). Tempo e frequência são
+# quantizados em segundos/Hz, e não em frames/bins, para que arquivos de taxas
+# diferentes (44.1 kHz vs 48 kHz reamostrados) gerem os mesmos hashes.
+FP_TIME_QUANT_S = 512 / 11025       # ~46 ms (um hop a 11025 Hz)
+FP_FREQ_QUANT_HZ = 21.5             # ~2 bins a 11025 Hz / n_fft 2048
+FP_FREQ_RANGE_HZ = (100.0, 4000.0)
+FP_PEAK_NEIGHBORHOOD = (25, 15)      # (bins, frames) do máximo local
+FP_PEAK_MIN_DB = 10.0               # acima da mediana do espectrograma
+FP_FAN_OUT = 5                      # alvos por âncora
+FP_MAX_DT = 63                      # distância máxima âncora->alvo (quanta de tempo)
+
+# Layout do hash de um landmark: f (8 bits) | df + 256 (9 bits) | dt (6 bits).
+# Com FP_FREQ_RANGE_HZ/FP_FREQ_QUANT_HZ, f vai de ~5 a ~186 e df de ~-181 a ~181.
+FP_F_BITS = 8
+FP_DF_BITS = 9
+FP_DT_BITS = 6
+FP_DF_OFFSET = 1 << (FP_DF_BITS - 1)
+
+# Perfil das consultas ao índice de fingerprints: muda junto com o layout do hash
+FINGERPRINT_PROFILE = f'{ANALYSIS_PROFILE}:landmark-v2'
+
+# Assinaturas de container -> caminho de decodificação em load_audio
+_CONTAINER_MAGIC = (
+    (b'RIFF', 8, b'WAVE', 'wav'),
+    (b'fLaC', None, None, 'flac'),
+    (b'OggS', None, None, 'ogg'),
+    (b'ID3', None, None, 'mp3'),
+)
+
+
+def pack_landmarks(f, df, dt):
+    """(frequência da âncora, delta de frequência, delta de tempo) quantizados -> hash int64"""
+    f, df, dt = (np.asarray(v, dtype=np.int64) for v in (f, df, dt))
+    return (f << (FP_DF_BITS + FP_DT_BITS)) | ((df + FP_DF_OFFSET) << FP_DT_BITS) | dt
+
+
+def unpack_landmarks(hashes):
+    """Inverso de pack_landmarks: hash -> (f, df, dt)"""
+    hashes = np.asarray(hashes, dtype=np.int64)
+    dt = hashes & ((1 << FP_DT_BITS) - 1)
+    df = ((hashes >> FP_DT_BITS) & ((1 << FP_DF_BITS) - 1)) - FP_DF_OFFSET
+    f = hashes >> (FP_DF_BITS + FP_DT_BITS)
+    return f, df, dt
+
+
+def landmark_fits(f, df, dt):
+    """Máscara dos triplos que cabem nos campos do hash (fora disso colidiriam)"""
+    f, df, dt = (np.asarray(v, dtype=np.int64) for v in (f, df, dt))
+    return ((f >= 0) & (f < (1 << FP_F_BITS)) & (df >= -FP_DF_OFFSET) & (df < FP_DF_OFFSET)
+            & (dt >= 0) & (dt < (1 << FP_DT_BITS)))
+
+
+def sniff_container(path):
+    """Identifica o container pelos bytes iniciais ('wav', 'flac', 'ogg', 'mp3' ou None)"""
+    with open(path, 'rb') as f:
+        head = f.read(12)
+    for magic, sub_offset, sub_magic, name in _CONTAINER_MAGIC:
+        if head.startswith(magic) and (sub_magic is None or head[sub_offset:sub_offset + 4] == sub_magic):
+            return name
+    # MP3 sem tag ID3: começa direto no sync de um frame MPEG (11 bits em 1, layer III)
+    if len(head) >= 2 and head[0] == 0xFF and (head[1] & 0xE6) == 0xE2:
+        return 'mp3'
+    return None
+
+
+# WAVE_FORMAT_PCM / WAVE_FORMAT_IEEE_FLOAT: (tag, bits) -> (dtype, escala para [-1, 1], offset)
+_WAV_SAMPLE_FORMATS = {
+    (1, 8): (np.dtype('u1'), 1.0 / 128.0, 128),
+    (1, 16): (np.dtype('<i2'), 1.0 / 32768.0, 0),
+    (1, 32): (np.dtype('<i4'), 1.0 / 2147483648.0, 0),
+    (3, 32): (np.dtype('<f4'), 1.0, 0),
+}
+_WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+def parse_wav_header(path):
+    """
+    Lê os chunks RIFF de um WAV e devolve (dtype, escala, offset_amostra,
+    sample_rate, canais, offset_dados, n_frames). Levanta ValueError para
+    variantes sem leitura direta (24-bit, ADPCM, RF64...).
+    """
+    import struct
+    
+    file_size = os.path.getsize(path)
+    fmt = None
+    with open(path, 'rb') as f:
+        riff, _, wave = struct.unpack('<4sI4s', f.read(12))
+        if riff != b'RIFF' or wave != b'WAVE':
+            raise ValueError('Não é um arquivo RIFF/WAVE')
+        
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise ValueError('Chunk de dados não encontrado')
+            chunk_id, chunk_size = struct.unpack('<4sI', header)
+            
+            if chunk_id == b'fmt ':
+                raw = f.read(chunk_size)
+                tag, channels, sr, _, block_align, bits = struct.unpack('<HHIIHH', raw[:16])
+                if tag == _WAVE_FORMAT_EXTENSIBLE and len(raw) >= 26:
+                    tag = struct.unpack('<H', raw[24:26])[0]  # subformato (GUID)
+                fmt = (tag, channels, sr, block_align, bits)
+                if chunk_size % 2:
+                    f.seek(1, 1)
+            elif chunk_id == b'data':
+                if fmt is None:
+                    raise ValueError('Chunk fmt ausente antes dos dados')
+                data_offset = f.tell()
+                break
+            else:
+                f.seek(chunk_size + chunk_size % 2, 1)
+    
+    tag, channels, sr, block_align, bits = fmt
+    sample_format = _WAV_SAMPLE_FORMATS.get((tag, bits))
+    if sample_format is None or channels < 1 or block_align != channels * bits // 8:
+        raise ValueError(f'Formato WAV sem leitura direta (tag={tag}, bits={bits})')
+    
+    # Tamanho do chunk pode estar errado (gravação interrompida, 0xFFFFFFFF): limita ao arquivo
+    data_size = min(chunk_size, file_size - data_offset)
+    dtype, scale, zero = sample_format
+    return dtype, scale, zero, sr, channels, data_offset, data_size // block_align
+
+
+# PCM mono já decodificado (upload do navegador): codificação -> dtype little-endian
+PCM_ENCODINGS = {
+    's16le': np.dtype('<i2'),
+    'f32le': np.dtype('<f4')
+}
+
+
+def pcm_from_bytes(raw, encoding='s16le'):
+    """Converte PCM mono cru (s16le/f32le) em float32 no intervalo [-1, 1]"""
+    dtype = PCM_ENCODINGS.get(encoding)
+    if dtype is None:
+        raise ValueError(f"Codificação PCM não suportada: {encoding}")
+    if len(raw) % dtype.itemsize:
+        raise ValueError("Tamanho do PCM não é múltiplo do tamanho da amostra")
+
+    samples = np.frombuffer(raw, dtype=dtype).astype(AUDIO_DTYPE)
+    if dtype.kind == 'i':
+        samples *= AUDIO_DTYPE(1.0 / 32768.0)
+    return samples
+
+
+def _hz_to_mel(freqs):
+    """Escala Mel de Slaney (linear até 1 kHz, logarítmica acima)"""
+    freqs = np.asanyarray(freqs, dtype=np.float64)
+    f_sp = 200.0 / 3
+    mels = freqs / f_sp
+    min_log_hz = 1000.0
+    min_log_mel = min_log_hz / f_sp
+    logstep = np.log(6.4) / 27.0
+    log_t = freqs >= min_log_hz
+    mels = np.where(log_t, min_log_mel + np.log(np.maximum(freqs, min_log_hz) / min_log_hz) / logstep, mels)
+    return mels
+
+
+def _mel_to_hz(mels):
+    """Inverso de _hz_to_mel"""
+    mels = np.asanyarray(mels, dtype=np.float64)
+    f_sp = 200.0 / 3
+    freqs = f_sp * mels
+    min_log_hz = 1000.0
+    min_log_mel = min_log_hz / f_sp
+    logstep = np.log(6.4) / 27.0
+    log_t = mels >= min_log_mel
+    freqs = np.where(log_t, min_log_hz * np.exp(logstep * (mels - min_log_mel)), freqs)
+    return freqs
+
+
+@lru_cache(maxsize=None)
+def _mel_filterbank(sr, n_fft, dtype, n_mels=N_MELS):
+    """
+    Banco de filtros Mel triangular (normalização Slaney), memoizado por
+    (sample rate, n_fft, dtype, n_mels) para ser construído uma única vez por
+    processo. Retorna matriz (n_mels, n_fft//2 + 1) em dtype (AUDIO_DTYPE de
+    quem chama), somente leitura.
+    """
+    fft_freqs = np.linspace(0, sr / 2.0, n_fft // 2 + 1)
+    mel_pts = _mel_to_hz(np.linspace(_hz_to_mel(0.0), _hz_to_mel(sr / 2.0), n_mels + 2))
+    fdiff = np.diff(mel_pts)
+    ramps = mel_pts[:, np.newaxis] - fft_freqs[np.newaxis, :]
+    lower = -ramps[:-2] / fdiff[:-1, np.newaxis]
+    upper = ramps[2:] / fdiff[1:, np.newaxis]
+    weights = np.maximum(0, np.minimum(lower, upper))
+    # Normalização de área (Slaney): cada filtro tem energia aproximadamente constante
+    weights *= (2.0 / (mel_pts[2:n_mels + 2] - mel_pts[:n_mels]))[:, np.newaxis]
+    weights = weights.astype(dtype)
+    weights.setflags(write=False)
+    return weights
+
+
+@lru_cache(maxsize=None)
+def _dct_matrix(dtype, n_mels=N_MELS, n_mfcc=N_MFCC_MAX):
+    """Matriz DCT tipo II ortonormal (n_mfcc, n_mels), memoizada por dtype"""
+    n = np.arange(n_mels)
+    k = np.arange(n_mfcc)[:, np.newaxis]
+    basis = np.cos(np.pi / n_mels * (n + 0.5) * k) * np.sqrt(2.0 / n_mels)
+    basis[0] *= 1.0 / np.sqrt(2.0)
+    basis = basis.astype(dtype)
+    basis.setflags(write=False)
+    return basis
+
 class AudioAnalyzer:
     """Analisa características de áudio para predição de hits"""
     
-    def __init__(self, audio_path):
+    # Número de blocos do enquadramento temporal (mesma granularidade do antigo array_split)
+    N_TIME_FRAMES = 100
+    
+    # Duração dos segmentos do pYIN (ponto de checagem de cancelamento entre segmentos)
+    PITCH_CHUNK_S = 10.0
+    
+    def __init__(self, audio_path, cancel_token=None):
+        """
+        Args:
+            audio_path: caminho do arquivo de áudio
+            cancel_token: objeto com .check() (ex: cancellation.CancellationToken),
+                consultado entre estágios e nos laços longos; None desativa
+        """
         self.audio_path = audio_path
+        self.cancel_token = cancel_token
         self.y = None
         self.sr = None
         self.features = {}
+        self.frame_block = None
+        self._stft_cache = {}
+        self.decoder = None
+        
+    def _check_cancelled(self):
+        """Ponto de cancelamento cooperativo (levanta se cliente desistiu ou prazo venceu)"""
+        if self.cancel_token is not None:
+            self.cancel_token.check()
         
     def load_audio(self):
-        """Carrega o arquivo de áudio"""
+        """
+        Carrega a janela de análise escolhendo o decodificador pelo container:
+        WAV PCM via memmap (sem processo decodificador), WAV restante/FLAC/OGG/MP3
+        via soundfile com seek por frame (libsndfile >= 1.1 lê MP3, como nos
+        uploads em blocos) e os demais (M4A) via audioread. Se um caminho
+        rápido falhar, cai para o próximo.
+        """
+        container = sniff_container(self.audio_path)
+        
+        if container == 'wav':
+            try:
+                return self._load_wav_mmap()
+            except Exception as e:
+                print(f"    [DEBUG] WAV sem leitura direta ({e}), usando soundfile")
+        
+        if container in ('wav', 'flac', 'ogg', 'mp3'):
+            try:
+                return self.load_stream(self.audio_path)
+            except Exception as e:
+                print(f"    [WARNING] soundfile falhou ({e}), usando audioread")
+        
+        return self._load_audioread()
+    
+    def _load_wav_mmap(self):
+        """
+        WAV PCM/float sem cópia: mapeia o chunk de dados em memória e fatia só
+        os frames da janela; a única cópia é a conversão para float32 mono.
+        """
+        dtype, scale, zero, sr, channels, data_offset, n_frames = parse_wav_header(self.audio_path)
+        duration = n_frames / sr
+        
+        print(f"    [DEBUG] Carregando áudio (WAV mmap): SR={sr}, Ch={channels}, Dur={duration:.2f}s")
+        self._check_cancelled()
+        
+        self.sr = sr
+        self.features['duration'] = duration
+        start_sample, end_sample = self._analysis_window(duration, sr)
+        
+        frames = np.memmap(self.audio_path, dtype=dtype, mode='r', offset=data_offset, shape=(n_frames, channels))
+        window = frames[start_sample:end_sample]
+        if len(window) == 0:
+            raise RuntimeError("Nenhum dado de áudio decodificado")
+        # Mix down to mono (acumula em float32 direto das amostras mapeadas)
+        y = window.mean(axis=1, dtype=AUDIO_DTYPE) if channels > 1 else window[:, 0].astype(AUDIO_DTYPE)
+        # Libera o mapeamento antes da remoção do arquivo temporário (Windows)
+        del frames, window
+        
+        if zero:
+            y -= AUDIO_DTYPE(zero)
+        if scale != 1.0:
+            y *= AUDIO_DTYPE(scale)
+        
+        self.decoder = 'wav-mmap'
+        self._prepare_signal(y)
+        return self
+    
+    def _load_audioread(self):
+        """Carrega o arquivo de áudio via audioread (ffmpeg/gstreamer/etc.)"""
         # Implementação 100% manual sem librosa.load para evitar Numba/Resampy crash
         import audioread
         import contextlib
@@ -70,18 +368,7 @@ class AudioAnalyzer:
                 print(f"    [DEBUG] Metadados: SR={self.sr}, Ch={channels}, Dur={input_file.duration:.2f}s")
                 
                 # 2. Definição da janela de leitura (Otimização)
-                total_samples = int(input_file.duration * self.sr)
-                # Janela de 30s
-                analysis_duration = min(30.0, input_file.duration)
-                
-                # offset logic
-                if input_file.duration > 30:
-                    start_time = 15.0
-                else:
-                    start_time = 0.0
-                    
-                start_sample = int(start_time * self.sr)
-                end_sample = start_sample + int(analysis_duration * self.sr)
+                start_sample, end_sample = self._analysis_window(input_file.duration, self.sr)
                 
                 # 3. Decodificação Bufferizada
                 # Audioread não suporta seek preciso em todos backends, então lemos e descartamos ou carregamos tudo (se memória permitir)
@@ -91,9 +378,12 @@ class AudioAnalyzer:
                 current_sample = 0
                 
                 for buf in input_file:
+                    self._check_cancelled()
+                    
                     # Converte buffer de bytes para array numpy int16
                     # Supondo 16-bit PCM que é o padrão da maioria dos decoders
-                    array_buf = np.frombuffer(buf, dtype=np.int16).astype(np.float32) / 32768.0
+                    array_buf = np.frombuffer(buf, dtype=np.int16).astype(AUDIO_DTYPE)
+                    array_buf *= AUDIO_DTYPE(1.0 / 32768.0)
                     
                     # Se estéreo, o buffer vem entrelaçado [L, R, L, R...]
                     if channels > 1:
@@ -126,28 +416,8 @@ class AudioAnalyzer:
                 if not audio_data:
                     raise RuntimeError("Nenhum dado de áudio decodificado")
                     
-                self.y = np.concatenate(audio_data)
-                
-                # 4. Decimação Manual (Downsample) para 11025Hz
-                target_sr = 11025
-                if self.sr > target_sr:
-                    step = int(self.sr / target_sr)
-                    if step > 1:
-                        self.y = self.y[::step]
-                        self.sr = int(self.sr / step)
-                
-                # 5. PEAK NORMALIZATION (CRÍTICO)
-                # Garante que o áudio esteja no volume máximo antes da análise
-                # Isso resolve o problema de arquivos baixos terem features ruins
-                max_val = np.max(np.abs(self.y))
-                if max_val > 0.001:
-                    print(f"    [DEBUG] Normalizando pico: {max_val:.4f} -> 0.95")
-                    self.y = (self.y / max_val) * 0.95
-                
-            # Verificação de segurança
-            energy_sum = np.sum(np.abs(self.y))
-            if energy_sum < 0.001:
-                print("    [WARNING] Audio carregado parece estar em silencio absoluto!")
+                self.decoder = 'audioread'
+                self._prepare_signal(np.concatenate(audio_data))
                 
         except Exception as e:
             print(f"    [ERROR] Falha no carregamento nativo: {e}")
@@ -156,12 +426,141 @@ class AudioAnalyzer:
             raise RuntimeError(f"Erro ao carregar arquivo de áudio: {str(e)}")
         return self
     
+    @staticmethod
+    def _analysis_window(duration, sr):
+        """Janela de análise em amostras: 30s a partir de 15s (ou o início, se curto)"""
+        # Janela de 30s
+        analysis_duration = min(30.0, duration)
+        
+        # offset logic
+        if duration > 30:
+            start_time = 15.0
+        else:
+            start_time = 0.0
+            
+        start_sample = int(start_time * sr)
+        end_sample = start_sample + int(analysis_duration * sr)
+        return start_sample, end_sample
+    
+    # Frames por leitura na decodificação via soundfile
+    STREAM_BLOCK_FRAMES = 65536
+    
+    def load_stream(self, fileobj):
+        """
+        Decodifica só a janela de análise de um arquivo (ou stream que ainda
+        está chegando, ver chunked_upload.ProgressiveReader) via soundfile,
+        com seek por frame: os bytes após a janela nunca são lidos.
+        """
+        import soundfile as sf
+        
+        print(f"    [DEBUG] Carregando áudio (stream): {self.audio_path}")
+        
+        try:
+            with sf.SoundFile(fileobj) as snd:
+                self.sr = snd.samplerate
+                channels = snd.channels
+                duration = snd.frames / snd.samplerate
+                self.features['duration'] = duration
+                
+                print(f"    [DEBUG] Metadados: SR={self.sr}, Ch={channels}, Dur={duration:.2f}s")
+                
+                start_sample, end_sample = self._analysis_window(duration, self.sr)
+                snd.seek(start_sample)
+                
+                audio_data = []
+                remaining = end_sample - start_sample
+                while remaining > 0:
+                    self._check_cancelled()
+                    block = snd.read(min(remaining, self.STREAM_BLOCK_FRAMES), dtype=AUDIO_DTYPE, always_2d=True)
+                    self._raise_stream_error(fileobj)
+                    if len(block) == 0:
+                        break
+                    # Mix down to mono
+                    audio_data.append(block.mean(axis=1, dtype=AUDIO_DTYPE) if channels > 1 else block[:, 0])
+                    remaining -= len(block)
+            
+            if not audio_data:
+                raise RuntimeError("Nenhum dado de áudio decodificado")
+            
+            self.decoder = 'soundfile'
+            self._prepare_signal(np.concatenate(audio_data))
+        except Exception as e:
+            self._raise_stream_error(fileobj)
+            print(f"    [ERROR] Falha no carregamento via stream: {e}")
+            raise RuntimeError(f"Erro ao carregar (stream): {str(e)}")
+        return self
+    
+    def load_decoded(self, y, sr, duration, decoder):
+        """Adota o sinal já preparado por load_audio em outro processo (decoder_pool)"""
+        self.y = y
+        self.sr = sr
+        self.features['duration'] = duration
+        self.decoder = decoder
+        self.frame_block = None
+        self._stft_cache = {}
+        return self
+    
+    @staticmethod
+    def _raise_stream_error(fileobj):
+        """Relança o erro guardado pelo stream (callbacks do soundfile não propagam exceções)"""
+        error = getattr(fileobj, 'error', None)
+        if error is not None:
+            raise error
+    
+    def load_pcm(self, samples, sr, duration=None):
+        """
+        Carrega PCM mono já decodificado e recortado na janela de análise
+        (decodificação feita no navegador), sem passar por audioread/ffmpeg.
+        
+        Args:
+            samples: amostras float em [-1, 1] (ver pcm_from_bytes)
+            sr: taxa de amostragem das amostras enviadas
+            duration: duração do arquivo original em segundos (feature 'duration')
+        """
+        print(f"    [DEBUG] Carregando PCM: SR={sr}, Amostras={len(samples)}")
+        
+        self.sr = int(sr)
+        self.features['duration'] = float(duration) if duration else len(samples) / self.sr
+        self.decoder = 'pcm'
+        self._prepare_signal(np.asarray(samples, dtype=AUDIO_DTYPE))
+        return self
+    
+    def _prepare_signal(self, y):
+        """Reamostragem para ANALYSIS_SR e normalização de pico do sinal mono da janela"""
+        self.y = y.astype(AUDIO_DTYPE, copy=False)
+        self.frame_block = None
+        self._stft_cache = {}
+        
+        # Toda análise roda a 11025 Hz, qualquer que seja a taxa do arquivo (o
+        # navegador já envia o PCM a 11025 Hz, reamostrado pelo Web Audio).
+        # Reamostragem polifásica para todas as taxas, inclusive múltiplos exatos
+        # (44.1/22.05 kHz): o filtro anti-aliasing evita que o conteúdo acima de
+        # 5.5 kHz se dobre sobre a banda analisada.
+        if self.sr != ANALYSIS_SR:
+            from scipy.signal import resample_poly
+            g = int(np.gcd(int(self.sr), ANALYSIS_SR))
+            self.y = resample_poly(self.y, ANALYSIS_SR // g, int(self.sr) // g).astype(AUDIO_DTYPE, copy=False)
+            self.sr = ANALYSIS_SR
+        
+        # PEAK NORMALIZATION (CRÍTICO)
+        # Garante que o áudio esteja no volume máximo antes da análise
+        # Isso resolve o problema de arquivos baixos terem features ruins
+        max_val = np.max(np.abs(self.y))
+        if max_val > 0.001:
+            print(f"    [DEBUG] Normalizando pico: {max_val:.4f} -> 0.95")
+            self.y *= AUDIO_DTYPE(0.95 / max_val)
+        
+        # Verificação de segurança
+        energy_sum = np.sum(np.abs(self.y))
+        if energy_sum < 0.001:
+            print("    [WARNING] Audio carregado parece estar em silencio absoluto!")
+    
     def extract_tempo(self):
         """Extrai BPM usando FFT puro (SEM LIBROSA - compatível Python 3.14)"""
         print(f"    [DEBUG] === BPM EXTRACTION (Pure NumPy Mode) ===")
         
         import numpy as np
-        from scipy import signal
+        from scipy import fft as scipy_fft
         
         try:
             if self.y is None or len(self.y) < 1000:
@@ -172,14 +571,16 @@ class AudioAnalyzer:
             hop_length = 512
             n_fft = 2048
             
-            # Janelamento
-            window = np.hanning(n_fft)
+            # Janelamento (float32 para não promover o frame a float64)
+            window = np.hanning(n_fft).astype(AUDIO_DTYPE)
             
             # Calcula Short-Time Fourier Transform manualmente
             num_frames = 1 + (len(self.y) - n_fft) // hop_length
-            onset_env = np.zeros(num_frames)
+            onset_env = np.zeros(num_frames, dtype=AUDIO_DTYPE)
             
             for i in range(num_frames):
+                if i % 64 == 0:
+                    self._check_cancelled()
                 start = i * hop_length
                 end = start + n_fft
                 if end > len(self.y):
@@ -189,7 +590,7 @@ class AudioAnalyzer:
                 frame = self.y[start:end] * window
                 
                 # FFT magnitude
-                spectrum = np.abs(np.fft.rfft(frame))
+                spectrum = np.abs(scipy_fft.rfft(frame))
                 
                 # Onset strength = diferença espectral (flux)
                 if i > 0:
@@ -251,21 +652,72 @@ class AudioAnalyzer:
         
         return self
     
+    def _compute_frame_block(self):
+        """
+        Enquadramento temporal único do sinal (passada vetorizada).
+        
+        Cada frame é uma view (sem cópia) de tamanho L+1 com hop L: os L primeiros
+        samples alimentam RMS/pico/soma absoluta e o sample extra garante que os
+        cruzamentos por zero entre frames vizinhos sejam contados exatamente uma vez.
+        Retorna dicionário com RMS, ZCR, pico e crest factor por frame, mais as
+        somas globais usadas pelas features de energia, loudness, ZCR e dinâmica.
+        """
+        if self.frame_block is not None:
+            return self.frame_block
+        
+        import numpy as np
+        from numpy.lib.stride_tricks import sliding_window_view
+        
+        y = self.y
+        if y is None or len(y) < 2:
+            raise ValueError("Audio muito curto para enquadramento")
+        
+        frame_length = max(1, (len(y) - 1) // self.N_TIME_FRAMES)
+        frames = sliding_window_view(y, frame_length + 1)[::frame_length]
+        body = frames[:, :frame_length]
+        
+        # Soma dos quadrados sem array temporário (einsum reduz direto)
+        sum_sq = np.einsum('ij,ij->i', body, body, dtype=np.float64)
+        abs_body = np.abs(body)
+        sum_abs = abs_body.sum(axis=1, dtype=np.float64)
+        peak = abs_body.max(axis=1)
+        del abs_body
+        
+        signs = np.signbit(frames)
+        crossings = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1)
+        del signs
+        
+        # Somas acumuladas em float64 (precisão), vetores por frame no dtype do analisador
+        rms = np.sqrt(sum_sq / frame_length).astype(AUDIO_DTYPE)
+        crest = np.where(rms > 0, peak / np.maximum(rms, AUDIO_DTYPE(1e-12)), AUDIO_DTYPE(0.0))
+        
+        self.frame_block = {
+            'frame_length': frame_length,
+            'n_samples': frame_length * len(body),
+            'rms': rms,
+            'zcr': (crossings / (2.0 * frame_length)).astype(AUDIO_DTYPE),
+            'peak': peak,
+            'crest_factor': crest,
+            'sum_sq': float(sum_sq.sum()),
+            'sum_abs': float(sum_abs.sum()),
+            'crossings': int(crossings.sum())
+        }
+        return self.frame_block
+    
     def extract_energy(self):
         """Calcula energia e Loudness usando NumPy (Nativo)"""
         import numpy as np
         
         try:
+            block = self._compute_frame_block()
+            
             # 1. RMS Energy (Simples e direto)
             # Energia = raiz quadrada da média dos quadrados da amplitude
-            rms_value = np.sqrt(np.mean(self.y**2))
+            rms_value = np.sqrt(block['sum_sq'] / block['n_samples'])
             self.features['energy'] = float(rms_value)
             
-            # Variância aproximada (calculada em blocos para simular frame-wise)
-            # Dividimos em 100 blocos para estatística
-            blocks = np.array_split(self.y, 100)
-            block_rms = [np.sqrt(np.mean(b**2)) for b in blocks if len(b) > 0]
-            self.features['energy_variance'] = float(np.var(block_rms))
+            # Variância do RMS por frame (estatística frame-wise)
+            self.features['energy_variance'] = float(np.var(block['rms']))
             
             # 2. Loudness (dBFS) - MELHORADO
             # Referência digital full scale = 1.0 (que é nosso max amplitude float)
@@ -291,6 +743,60 @@ class AudioAnalyzer:
             
         return self
     
+    def _get_stft(self, n_fft=2048, hop_length=512):
+        """
+        STFT compartilhada em SPECTRUM_DTYPE (cache por n_fft/hop_length).
+
+        Com sinal em float32 o scipy já devolve complex64; o astype final só
+        age quando a política de dtype é outra.
+        """
+        key = (n_fft, hop_length)
+        if key not in self._stft_cache:
+            from scipy import signal
+            window = signal.get_window('hann', n_fft).astype(AUDIO_DTYPE)
+            _, _, Zxx = signal.stft(self.y.astype(AUDIO_DTYPE, copy=False), fs=self.sr,
+                                    window=window, nperseg=n_fft, noverlap=n_fft - hop_length)
+            self._stft_cache[key] = Zxx.astype(SPECTRUM_DTYPE, copy=False)
+        return self._stft_cache[key]
+    
+    def fingerprint(self):
+        """
+        Landmarks da janela a partir da STFT compartilhada: picos locais do
+        espectrograma em dB pareados com os próximos FP_FAN_OUT picos.
+        Retorna (hashes, tempos) como arrays int64 (tempo da âncora em quanta).
+        """
+        from scipy.ndimage import maximum_filter
+        
+        n_fft, hop_length = 2048, 512
+        magnitude = np.abs(self._get_stft(n_fft, hop_length))
+        db = 20.0 * np.log10(magnitude + AUDIO_DTYPE(1e-6))
+        
+        freqs_hz = np.arange(db.shape[0]) * (self.sr / n_fft)
+        band = (freqs_hz >= FP_FREQ_RANGE_HZ[0]) & (freqs_hz <= FP_FREQ_RANGE_HZ[1])
+        db[~band] = db.min()
+        
+        is_peak = (db == maximum_filter(db, size=FP_PEAK_NEIGHBORHOOD)) & (db > np.median(db[band]) + FP_PEAK_MIN_DB)
+        bins, frames = np.nonzero(is_peak)
+        
+        # Quantização independente da taxa de amostragem
+        t_q = np.rint(frames * (hop_length / self.sr) / FP_TIME_QUANT_S).astype(np.int64)
+        f_q = np.rint(freqs_hz[bins] / FP_FREQ_QUANT_HZ).astype(np.int64)
+        order = np.lexsort((f_q, t_q))
+        t_q, f_q = t_q[order], f_q[order]
+        
+        # Cada âncora pareia com os próximos FP_FAN_OUT picos de frames posteriores
+        # (dt de 1 a FP_MAX_DT); como está ordenado por tempo, são um intervalo contíguo
+        first = np.searchsorted(t_q, t_q, side='right')
+        last = np.searchsorted(t_q, t_q + FP_MAX_DT, side='right')
+        counts = np.minimum(FP_FAN_OUT, last - first)
+        anchors = np.repeat(np.arange(len(t_q)), counts)
+        offsets = np.arange(len(anchors)) - np.repeat(np.cumsum(counts) - counts, counts)
+        targets = first[anchors] + offsets
+        
+        f, df, dt = f_q[anchors], f_q[targets] - f_q[anchors], t_q[targets] - t_q[anchors]
+        fits = landmark_fits(f, df, dt)
+        return pack_landmarks(f[fits], df[fits], dt[fits]), t_q[anchors][fits]
+    
     def extract_spectral_features(self):
         """Extrai características espectrais"""
         import librosa
@@ -299,21 +805,19 @@ class AudioAnalyzer:
     def extract_spectral_features(self):
         """Extrai features espectrais usando NumPy/Scipy (Nativo)"""
         import numpy as np
-        from scipy import signal
         
         try:
             # Reutiliza ou calcula STFT
             n_fft = 2048
             hop_length = 512
-            f, t, Zxx = signal.stft(self.y, fs=self.sr, nperseg=n_fft, noverlap=n_fft-hop_length)
-            magnitude = np.abs(Zxx)
+            magnitude = np.abs(self._get_stft(n_fft, hop_length))
             
             # Frequências em Hz
-            freqs = np.linspace(0, self.sr/2, magnitude.shape[0])
+            freqs = np.linspace(0, self.sr/2, magnitude.shape[0], dtype=AUDIO_DTYPE)
             
             # 1. Spectral Centroid
             # C = sum(f * mag) / sum(mag)
-            mag_sum = np.sum(magnitude, axis=0) + 1e-9
+            mag_sum = np.sum(magnitude, axis=0) + AUDIO_DTYPE(1e-9)
             centroid = np.sum(freqs[:, np.newaxis] * magnitude, axis=0) / mag_sum
             self.features['brightness'] = float(np.mean(centroid))
             
@@ -321,7 +825,7 @@ class AudioAnalyzer:
             # Frequência onde acumula 85% da energia
             cum_energy = np.cumsum(magnitude, axis=0)
             total_energy = cum_energy[-1, :]
-            threshold = 0.85 * total_energy
+            threshold = AUDIO_DTYPE(0.85) * total_energy
             # Encontra índice onde passa do threshold
             rolloff_idx = np.argmax(cum_energy >= threshold, axis=0)
             rolloff = freqs[rolloff_idx]
@@ -384,49 +888,53 @@ class AudioAnalyzer:
     
     def extract_zero_crossing_rate(self):
         """Taxa de cruzamento por zero manual"""
-        import numpy as np
         try:
-            # ZCR = média de mudanças de sinal
-            zero_crossings = np.sum(np.abs(np.diff(np.signbit(self.y))))
-            zcr = zero_crossings / (2 * len(self.y))
+            # ZCR = média de mudanças de sinal (contadas no enquadramento único)
+            block = self._compute_frame_block()
+            zcr = block['crossings'] / (2 * block['n_samples'])
             self.features['zero_crossing_rate'] = float(zcr)
         except Exception:
             self.features['zero_crossing_rate'] = 0.0
         return self
     
-    def extract_mfcc(self):
-        """Estima MFCCs usando log-energia em bandas (Simplificado)"""
+    def extract_mfcc(self, n_mfcc=5):
+        """
+        MFCCs reais: banco Mel + log (dB) + DCT sobre o espectrograma compartilhado.
+        
+        O banco de filtros e a matriz DCT são memoizados por (sr, n_fft) no módulo;
+        por chamada restam um produto matricial e a média temporal. Gera as chaves
+        mfcc_1..mfcc_{n_mfcc} (padrão 5, máximo N_MFCC_MAX).
+        """
         import numpy as np
-        from scipy import signal, fftpack
         
+        n_mfcc = int(min(max(n_mfcc, 1), N_MFCC_MAX))
         try:
-            # Simplificação: Log-Energy em 13 bandas lineares + DCT
-            # Não é um MFCC perfeito (escala linear vs Mel), mas captura timbre
             n_fft = 2048
-            f, t, Zxx = signal.stft(self.y, fs=self.sr, nperseg=n_fft)
-            psd = np.abs(Zxx)**2
-            
-            # Divide em 13 bandas
-            n_bins = psd.shape[0]
-            bands = np.array_split(psd, 13, axis=0)
-            energies = np.array([np.mean(b, axis=0) for b in bands])
-            
-            # Log
-            log_energies = np.log(energies + 1e-9)
-            
-            # DCT Tipo 2
-            # mfcc_approx = fftpack.dct(log_energies, type=2, axis=0, norm='ortho')
-            # Simplificando: Média das log-energias serve como proxy de feature
-            avg_log_energies = np.mean(log_energies, axis=1)
-            
-            for i in range(5):
-                # Pega as primeiras 5 bandas como features
-                val = avg_log_energies[i] if i < len(avg_log_energies) else 0.0
-                self.features[f'mfcc_{i+1}'] = float(val)
+            hop_length = 512
+            Zxx = self._get_stft(n_fft, hop_length)
+            
+            # Potência no mesmo nível do STFT sem escala (librosa): o scipy divide por sum(janela)
+            win_sum = AUDIO_DTYPE(n_fft / 2)
+            power = np.abs(Zxx) * win_sum
+            power *= power
+            
+            # 1 produto matricial: (n_mels, n_bins) @ (n_bins, frames)
+            mel_spec = _mel_filterbank(self.sr, n_fft, np.dtype(AUDIO_DTYPE)) @ power
+            del power
+            
+            # power_to_db (ref=1, amin=1e-10, top_db=80)
+            log_mel = AUDIO_DTYPE(10.0) * np.log10(np.maximum(mel_spec, AUDIO_DTYPE(1e-10)))
+            log_mel = np.maximum(log_mel, log_mel.max() - AUDIO_DTYPE(80.0))
+            
+            # DCT é linear: média temporal antes da DCT evita materializar (n_mfcc, frames)
+            mfcc = _dct_matrix(np.dtype(AUDIO_DTYPE))[:n_mfcc] @ np.mean(log_mel, axis=1)
+            
+            for i in range(n_mfcc):
+                self.features[f'mfcc_{i+1}'] = float(mfcc[i])
                 
         except Exception as e:
             print(f"    [ERROR] Falha MFCC nativa: {e}")
-            for i in range(5):
+            for i in range(n_mfcc):
                 self.features[f'mfcc_{i+1}'] = 0.0
         return self
     
@@ -434,10 +942,12 @@ class AudioAnalyzer:
         """Analisa variação dinâmica (Estrutura)"""
         import numpy as np
         try:
-            # Usa variância da magnitude do STFT global
-            # Se já calculamos STFT no passo anterior, poderíamos reutilizar, mas ok recalcular
-            # Variação simples da amplitude
-            variation = np.std(np.abs(self.y))
+            # Variação simples da amplitude: std(|y|) = sqrt(E[y²] - E[|y|]²)
+            # derivada das somas do enquadramento único (sem nova passada no sinal)
+            block = self._compute_frame_block()
+            mean_abs = block['sum_abs'] / block['n_samples']
+            mean_sq = block['sum_sq'] / block['n_samples']
+            variation = np.sqrt(max(mean_sq - mean_abs ** 2, 0.0))
             self.features['dynamic_variation'] = float(variation)
         except Exception:
             self.features['dynamic_variation'] = 0.0
@@ -481,7 +991,8 @@ class AudioAnalyzer:
     def analyze_all(self):
         """Executa todas as análises com alta resiliência e calibragem"""
         print("    [DEBUG] Iniciando análise completa...")
-        self.load_audio()
+        if self.y is None:
+            self.load_audio()
         
         # Lista de funções de extração
         extractions = [
@@ -501,6 +1012,7 @@ class AudioAnalyzer:
 
         for name, func, default in extractions:
             import sys
+            self._check_cancelled()
             print(f"    [DEBUG] >>> Iniciando extração: {name}")
             sys.stdout.flush()  # FORÇA output imediato
             try:
@@ -517,6 +1029,7 @@ class AudioAnalyzer:
                 elif "Energia" in name: self.features['energy'] = default
         
         # APLICA CALIBRAGEM SPOTIFY
+        self._check_cancelled()
         self.extract_spectral_features()
         self._calibrate_to_spotify()
         
@@ -526,6 +1039,7 @@ class AudioAnalyzer:
         self.extract_acousticness()
         self.extract_instrumentalness()
         self.extract_liveness()
+        self._check_cancelled()
         self.extract_speechiness()
         
         # Limpeza de memória
@@ -690,13 +1204,27 @@ class AudioAnalyzer:
             
             # Extrai pitch usando pYIN (melhor para voz)
             # pYIN é robusto para detectar pitch em música com voz
-            f0, voiced_flag, voiced_probs = librosa.pyin(
-                self.y,
-                fmin=librosa.note_to_hz('C2'),  # ~65 Hz (voz masculina grave)
-                fmax=librosa.note_to_hz('C7'),  # ~2093 Hz (voz feminina aguda)
-                sr=self.sr,
-                frame_length=2048
-            )
+            # Processado em segmentos: limita o estado do pYIN em memória e
+            # permite interromper a análise entre um segmento e outro
+            chunk = max(int(self.PITCH_CHUNK_S * self.sr), 4096)
+            f0_parts, voiced_parts = [], []
+            for start in range(0, len(self.y), chunk):
+                self._check_cancelled()
+                segment = self.y[start:start + chunk]
+                if len(segment) < 2048:
+                    break
+                f0_seg, voiced_seg, _ = librosa.pyin(
+                    segment,
+                    fmin=librosa.note_to_hz('C2'),  # ~65 Hz (voz masculina grave)
+                    fmax=librosa.note_to_hz('C7'),  # ~2093 Hz (voz feminina aguda)
+                    sr=self.sr,
+                    frame_length=2048
+                )
+                f0_parts.append(f0_seg)
+                voiced_parts.append(voiced_seg)
+            
+            f0 = np.concatenate(f0_parts)
+            voiced_flag = np.concatenate(voiced_parts)
             
             # Remove NaN (frames sem pitch detectado)
             f0_clean = f0[~np.isnan(f0)]
@@ -0,0 +1,128 @@
+"""
+Cancelamento cooperativo de análises
+
+Cada requisição de análise recebe um CancellationToken com prazo (deadline).
+O pipeline chama token.check() entre os estágios de analyze_all e dentro dos
+laços longos (buffers de decodificação, frames de pitch); quando o cliente
+desiste (endpoint de cancelamento) ou o prazo vence, a análise para ali mesmo
+e libera o worker.
+
+As exceções derivam de BaseException (como asyncio.CancelledError) para não
+serem engolidas pelos `except Exception` de fallback dos extratores.
+"""
+import os
+import threading
+import time
+
+# Prazo padrão por análise (abaixo do --timeout 120 do gunicorn)
+DEFAULT_DEADLINE_S = float(os.environ.get('ANALYSIS_DEADLINE_S', '100'))
+
+# Cancelamentos que chegam antes do upload terminar ficam guardados por um tempo
+EARLY_CANCEL_TTL_S = 120.0
+MAX_EARLY_CANCELS = 1024
+
+
+class AnalysisCancelled(BaseException):
+    """Análise abandonada pelo cliente"""
+
+
+class AnalysisDeadlineExceeded(AnalysisCancelled):
+    """Análise interrompida por estourar o prazo"""
+
+
+class CancellationToken:
+    """Sinal de cancelamento + prazo de uma análise (thread-safe)"""
+
+    def __init__(self, deadline_s=None):
+        self._event = threading.Event()
+        self.deadline = time.monotonic() + deadline_s if deadline_s else None
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def remaining(self):
+        """Segundos até o prazo (None se sem prazo)"""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def check(self):
+        """Levanta AnalysisCancelled/AnalysisDeadlineExceeded se for hora de parar"""
+        if self._event.is_set():
+            raise AnalysisCancelled('Análise cancelada pelo cliente')
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            raise AnalysisDeadlineExceeded('Prazo da análise esgotado')
+
+
+class CancellationRegistry:
+    """
+    Tokens ativos por request_id (gerado pelo frontend) e métricas de
+    trabalho abandonado/estourado.
+    """
+
+    def __init__(self, default_deadline_s=DEFAULT_DEADLINE_S):
+        self.default_deadline_s = default_deadline_s
+        self._lock = threading.Lock()
+        self._tokens = {}
+        self._early_cancels = {}
+        self._abandoned_total = 0
+        self._timed_out_total = 0
+
+    def register(self, request_id=None, deadline_s=None):
+        """Cria token; o prazo pedido pelo cliente só pode encurtar o padrão"""
+        deadline = self.default_deadline_s
+        if deadline_s:
+            deadline = min(deadline, float(deadline_s))
+        token = CancellationToken(deadline)
+        if request_id:
+            with self._lock:
+                self._tokens[request_id] = token
+                if self._early_cancels.pop(request_id, None) is not None:
+                    token.cancel()
+        return token
+
+    def unregister(self, request_id):
+        if request_id:
+            with self._lock:
+                self._tokens.pop(request_id, None)
+
+    def cancel(self, request_id):
+        """
+        Cancela a análise de um request_id; retorna False se não estiver ativa.
+        Um request_id ainda desconhecido (upload em andamento) é lembrado e
+        cancelado assim que for registrado.
+        """
+        with self._lock:
+            token = self._tokens.get(request_id)
+            if token is None:
+                now = time.monotonic()
+                self._early_cancels = {
+                    rid: ts for rid, ts in self._early_cancels.items()
+                    if now - ts < EARLY_CANCEL_TTL_S
+                }
+                if len(self._early_cancels) < MAX_EARLY_CANCELS:
+                    self._early_cancels[request_id] = now
+                return False
+        token.cancel()
+        return True
+
+    def record(self, error):
+        """Contabiliza uma análise interrompida"""
+        with self._lock:
+            if isinstance(error, AnalysisDeadlineExceeded):
+                self._timed_out_total += 1
+            else:
+                self._abandoned_total += 1
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'active': len(self._tokens),
+                'abandoned_total': self._abandoned_total,
+                'timed_out_total': self._timed_out_total,
+                'deadline_s': self.default_deadline_s
+            }
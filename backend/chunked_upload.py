@@ -0,0 +1,295 @@
+"""
+Upload em blocos (resumível) com leitura progressiva
+
+O cliente abre uma sessão informando o tamanho total, envia os blocos com o
+SHA-256 de cada um (em qualquer ordem, podendo reenviar os que falharam) e,
+em paralelo, pede a análise da sessão. A análise lê o arquivo por um
+ProgressiveReader que só bloqueia quando o trecho pedido ainda não chegou:
+como AudioAnalyzer só precisa da janela de 15s a 45s, a decodificação começa
+com o primeiro bloco e muitas vezes termina antes da cauda do arquivo chegar.
+"""
+import hashlib
+import io
+import os
+import threading
+import time
+import uuid
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+MIN_CHUNK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Sessões sem atividade por mais que isso são descartadas
+SESSION_TTL_S = float(os.environ.get('UPLOAD_SESSION_TTL_S', '600'))
+# Leitor desiste se nenhum bloco novo chegar nesse intervalo
+STALL_TIMEOUT_S = float(os.environ.get('UPLOAD_STALL_TIMEOUT_S', '30'))
+# Cada sessão pré-aloca o arquivo inteiro: limita sessões abertas e bytes reservados em disco
+MAX_SESSIONS = int(os.environ.get('UPLOAD_MAX_SESSIONS', '16'))
+MAX_RESERVED_MB = float(os.environ.get('UPLOAD_MAX_RESERVED_MB', '256'))
+
+# Extensões -> formato do libsndfile que permite decodificar enquanto o upload chega
+_STREAM_FORMATS = {'wav': 'WAV', 'flac': 'FLAC', 'ogg': 'OGG', 'mp3': 'MP3'}
+
+
+def streamable_extensions():
+    """Extensões que o soundfile instalado consegue decodificar de um stream"""
+    try:
+        import soundfile as sf
+        formats = sf.available_formats()
+    except Exception:
+        return set()
+    return {ext for ext, fmt in _STREAM_FORMATS.items() if fmt in formats}
+
+
+class UploadSessionNotFound(Exception):
+    """Sessão inexistente, expirada ou já consumida pela análise"""
+
+
+class ChunkRejected(Exception):
+    """Bloco com índice, tamanho ou checksum inválido (cliente deve reenviar)"""
+
+
+class UploadAborted(Exception):
+    """Sessão cancelada ou parada (sem blocos novos) enquanto a análise lia"""
+
+
+class UploadCapacityExceeded(Exception):
+    """Sessões ou espaço reservado no limite do worker (HTTP 429 + Retry-After)"""
+
+    def __init__(self, retry_after, reason):
+        super().__init__(reason)
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class UploadSession:
+    """Arquivo sendo recebido em blocos de tamanho fixo (thread-safe)"""
+
+    def __init__(self, folder, filename, total_size, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.id = uuid.uuid4().hex
+        self.filename = filename
+        self.extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+        self.total_size = int(total_size)
+        self.chunk_size = int(chunk_size)
+        self.n_chunks = max(1, -(-self.total_size // self.chunk_size))
+        self.path = os.path.join(folder, f"{self.id}_{filename}")
+
+        self._cond = threading.Condition()
+        self._received = set()
+        self._aborted = False
+        self.created_at = time.monotonic()
+        self.last_activity = self.created_at
+
+        # Pré-aloca o arquivo para gravar blocos fora de ordem
+        with open(self.path, 'wb') as f:
+            f.truncate(self.total_size)
+
+    @property
+    def complete(self):
+        return len(self._received) == self.n_chunks
+
+    def _chunk_length(self, index):
+        return min(self.chunk_size, self.total_size - index * self.chunk_size)
+
+    def write_chunk(self, index, data, sha256_hex):
+        """Grava um bloco após validar tamanho e checksum (reenvio é idempotente)"""
+        if not 0 <= index < self.n_chunks:
+            raise ChunkRejected(f'Índice de bloco inválido: {index}')
+        if len(data) != self._chunk_length(index):
+            raise ChunkRejected(f'Bloco {index} com tamanho {len(data)}, esperado {self._chunk_length(index)}')
+        if not sha256_hex or hashlib.sha256(data).hexdigest() != sha256_hex.lower():
+            raise ChunkRejected(f'Checksum do bloco {index} não confere')
+
+        with self._cond:
+            if self._aborted:
+                raise UploadAborted('Sessão de upload cancelada')
+            if index in self._received:
+                return
+            with open(self.path, 'r+b') as f:
+                f.seek(index * self.chunk_size)
+                f.write(data)
+            self._received.add(index)
+            self.last_activity = time.monotonic()
+            self._cond.notify_all()
+
+    def _has_range(self, start, end):
+        first, last = start // self.chunk_size, (end - 1) // self.chunk_size
+        return all(i in self._received for i in range(first, last + 1))
+
+    def wait_for_range(self, start, end, wait_check=None, poll_s=0.25):
+        """
+        Bloqueia até os bytes [start, end) terem chegado.
+        wait_check (opcional) é chamado a cada poll (ex: token de cancelamento).
+        """
+        with self._cond:
+            while not self._has_range(start, end):
+                if self._aborted:
+                    raise UploadAborted('Sessão de upload cancelada')
+                if time.monotonic() - self.last_activity > STALL_TIMEOUT_S:
+                    raise UploadAborted(f'Upload parado há mais de {STALL_TIMEOUT_S:.0f}s')
+                self._cond.wait(poll_s)
+                if wait_check is not None:
+                    wait_check()
+
+    def wait_complete(self, wait_check=None):
+        """Bloqueia até o arquivo inteiro ter chegado"""
+        self.wait_for_range(0, self.total_size, wait_check)
+
+    def open_reader(self, wait_check=None):
+        """Leitor de arquivo que espera pelos blocos ainda não recebidos"""
+        return ProgressiveReader(self, wait_check)
+
+    def abort(self):
+        with self._cond:
+            self._aborted = True
+            self._cond.notify_all()
+
+    def status(self):
+        with self._cond:
+            return {
+                'upload_id': self.id,
+                'filename': self.filename,
+                'total_size': self.total_size,
+                'chunk_size': self.chunk_size,
+                'n_chunks': self.n_chunks,
+                'received': sorted(self._received),
+                'complete': self.complete
+            }
+
+
+class ProgressiveReader(io.RawIOBase):
+    """
+    Arquivo somente leitura sobre uma UploadSession ainda incompleta.
+
+    O soundfile chama read/seek de dentro de callbacks cffi, que engolem
+    exceções; por isso um erro na espera (cancelamento, upload parado) é
+    guardado em `error`, a leitura devolve EOF e quem decodifica relança.
+    """
+
+    def __init__(self, session, wait_check=None):
+        self._session = session
+        self._wait_check = wait_check
+        self._file = open(session.path, 'rb')
+        self._pos = 0
+        self.error = None
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        # O tamanho final é conhecido desde o início: SEEK_END não espera pelo upload
+        if whence == io.SEEK_SET:
+            self._pos = offset
+        elif whence == io.SEEK_CUR:
+            self._pos += offset
+        elif whence == io.SEEK_END:
+            self._pos = self._session.total_size + offset
+        else:
+            raise ValueError(f'whence inválido: {whence}')
+        return self._pos
+
+    def readinto(self, buffer):
+        n = min(len(buffer), self._session.total_size - self._pos)
+        if n <= 0 or self.error is not None:
+            return 0
+        try:
+            self._session.wait_for_range(self._pos, self._pos + n, self._wait_check)
+        except BaseException as e:
+            self.error = e
+            return 0
+        self._file.seek(self._pos)
+        got = self._file.readinto(memoryview(buffer)[:n])
+        self._pos += got
+        return got
+
+    def close(self):
+        if not self.closed:
+            self._file.close()
+        super().close()
+
+
+class UploadRegistry:
+    """Sessões de upload ativas do worker, com expiração por inatividade e limite de capacidade"""
+
+    def __init__(self, folder, ttl_s=SESSION_TTL_S, max_sessions=MAX_SESSIONS, max_reserved_mb=MAX_RESERVED_MB):
+        self.folder = folder
+        self.ttl_s = ttl_s
+        self.max_sessions = max_sessions
+        self.max_reserved_bytes = int(max_reserved_mb * 1024 * 1024)
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._started_total = 0
+        self._expired_total = 0
+        self._rejected_total = 0
+
+    def _reserved_bytes(self):
+        return sum(s.total_size for s in self._sessions.values())
+
+    def _retry_after(self):
+        """Segundos até a sessão ociosa mais antiga expirar"""
+        now = time.monotonic()
+        idle = max((now - s.last_activity for s in self._sessions.values()), default=self.ttl_s)
+        return max(1, int(self.ttl_s - idle))
+
+    def create(self, filename, total_size, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Abre uma sessão; levanta UploadCapacityExceeded se o limite de sessões ou de bytes estourar"""
+        chunk_size = min(MAX_CHUNK_SIZE, max(MIN_CHUNK_SIZE, int(chunk_size)))
+        self._expire()
+        with self._lock:
+            if len(self._sessions) >= self.max_sessions:
+                reason = 'Uploads simultâneos demais'
+            elif self._reserved_bytes() + int(total_size) > self.max_reserved_bytes:
+                reason = 'Espaço para uploads esgotado'
+            else:
+                reason = None
+            if reason is not None:
+                self._rejected_total += 1
+                raise UploadCapacityExceeded(self._retry_after(), reason)
+            # Criada sob o lock: a reserva de espaço conta antes de outra sessão ser admitida
+            session = UploadSession(self.folder, filename, total_size, chunk_size)
+            self._sessions[session.id] = session
+            self._started_total += 1
+        return session
+
+    def get(self, upload_id):
+        with self._lock:
+            session = self._sessions.get(upload_id)
+        if session is None:
+            raise UploadSessionNotFound(f'Sessão de upload não encontrada: {upload_id}')
+        return session
+
+    def remove(self, upload_id):
+        """Descarta a sessão e apaga o arquivo parcial"""
+        with self._lock:
+            session = self._sessions.pop(upload_id, None)
+        if session is None:
+            return
+        session.abort()
+        try:
+            os.remove(session.path)
+        except OSError as e:
+            print(f"⚠️ Aviso: Não foi possível deletar upload parcial: {e}")
+
+    def _expire(self):
+        now = time.monotonic()
+        with self._lock:
+            expired = [sid for sid, s in self._sessions.items() if now - s.last_activity > self.ttl_s]
+            self._expired_total += len(expired)
+        for sid in expired:
+            self.remove(sid)
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'active': len(self._sessions),
+                'reserved_mb': round(self._reserved_bytes() / (1024 * 1024), 1),
+                'started_total': self._started_total,
+                'expired_total': self._expired_total,
+                'rejected_total': self._rejected_total
+            }
@@ -0,0 +1,262 @@
+"""
+Pool de processos decodificadores para os formatos que a libsndfile não lê
+
+WAV/FLAC/OGG/MP3 são decodificados no próprio worker HTTP pela libsndfile
+(AudioAnalyzer.load_audio), sem processo externo. O que sobra (M4A/AAC e
+containers não reconhecidos) passa pelo audioread, que abre um ffmpeg por
+arquivo. Este módulo tira esse caminho do worker HTTP: alguns processos de
+vida longa (numpy/audioread/AudioAnalyzer já importados) recebem o caminho do
+arquivo por um pipe e devolvem o sinal mono da janela de análise em float32,
+o mesmo que AudioAnalyzer.load_audio produz. O ffmpeg continua sendo aberto a
+cada arquivo; o ganho é não pagar imports/sondagem de backends por requisição
+e isolar decodificações travadas (timeout + processo substituído sem derrubar
+o servidor).
+
+Os processos sobem no primeiro decode() ou, no gunicorn, logo após o worker
+carregar a aplicação (gunicorn.conf.py, post_worker_init).
+
+Configuração:
+    DECODER_POOL_SIZE          processos no pool (0 desativa; padrão 2, 0 no executável)
+    DECODER_JOB_TIMEOUT_S      tempo máximo de uma decodificação
+    DECODER_MAX_JOBS           decodificações antes de reciclar o processo
+    DECODER_HEALTH_INTERVAL_S  intervalo do health check dos processos ociosos
+"""
+import atexit
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+
+DEFAULT_POOL_SIZE = int(os.environ.get('DECODER_POOL_SIZE', '0' if getattr(sys, 'frozen', False) else '2'))
+DEFAULT_JOB_TIMEOUT_S = float(os.environ.get('DECODER_JOB_TIMEOUT_S', '60'))
+DEFAULT_MAX_JOBS = int(os.environ.get('DECODER_MAX_JOBS', '200'))
+DEFAULT_HEALTH_INTERVAL_S = float(os.environ.get('DECODER_HEALTH_INTERVAL_S', '30'))
+
+PING_TIMEOUT_S = 5.0
+
+
+class DecoderPoolError(Exception):
+    """Falha do pool (processo morreu, travou ou não respondeu)"""
+
+
+class DecodeFailed(Exception):
+    """O processo decodificador não conseguiu ler o arquivo"""
+
+
+def _worker_main(conn):
+    """Laço do processo decodificador: ('decode', path) -> ('ok', y, sr, duração, decoder)"""
+    try:
+        from backend.audio_analyzer import AudioAnalyzer
+    except ImportError:
+        from audio_analyzer import AudioAnalyzer
+    import audioread  # noqa: F401  (backends importados uma vez por processo)
+
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            break
+
+        kind = message[0]
+        if kind == 'stop':
+            break
+        if kind == 'ping':
+            conn.send(('pong',))
+            continue
+
+        try:
+            analyzer = AudioAnalyzer(message[1])
+            analyzer.load_audio()
+            conn.send(('ok', analyzer.y, analyzer.sr, analyzer.features['duration'], analyzer.decoder))
+        except Exception as e:
+            conn.send(('error', str(e)))
+
+
+class _Worker:
+    """Processo decodificador + lado do pai do pipe"""
+
+    def __init__(self, ctx, index):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(
+            target=_worker_main, args=(child_conn,), name=f'decoder-{index}', daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self.jobs = 0
+
+    def alive(self):
+        return self.process.is_alive()
+
+    def stop(self, graceful=False):
+        if graceful and self.alive():
+            try:
+                self.conn.send(('stop',))
+                self.process.join(1.0)
+            except (OSError, BrokenPipeError):
+                pass
+        if self.alive():
+            self.process.terminate()
+            self.process.join(1.0)
+        self.conn.close()
+
+
+class DecoderPool:
+    """
+    Pool fixo de processos decodificadores (thread-safe; iniciado no primeiro uso ou por start()).
+
+    Uso:
+        y, sr, duration, decoder = pool.decode(path, token)
+    """
+
+    def __init__(self, size=DEFAULT_POOL_SIZE, job_timeout_s=DEFAULT_JOB_TIMEOUT_S,
+                 max_jobs=DEFAULT_MAX_JOBS, health_interval_s=DEFAULT_HEALTH_INTERVAL_S):
+        self.size = size
+        self.job_timeout_s = job_timeout_s
+        self.max_jobs = max_jobs
+        self.health_interval_s = health_interval_s
+
+        # spawn: seguro com threads no processo pai e igual em Linux/Windows
+        self._ctx = multiprocessing.get_context('spawn')
+        self._lock = threading.Lock()
+        self._idle = queue.Queue()
+        self._started = False
+        self._closed = False
+        self._spawned = 0
+
+        self._jobs_total = 0
+        self._failed_total = 0
+        self._restarts_total = 0
+        self._crashes_total = 0
+        self._timeouts_total = 0
+
+    @property
+    def enabled(self):
+        return self.size > 0 and not self._closed
+
+    def _spawn(self):
+        with self._lock:
+            self._spawned += 1
+            index = self._spawned
+        return _Worker(self._ctx, index)
+
+    def start(self):
+        """Inicia os processos e o health check (idempotente)"""
+        with self._lock:
+            if self._started or not self.enabled:
+                return
+            self._started = True
+        for _ in range(self.size):
+            self._idle.put(self._spawn())
+        threading.Thread(target=self._health_loop, name='decoder-pool-health', daemon=True).start()
+        atexit.register(self.close)
+        print(f"[INIT] Pool de decodificação iniciado com {self.size} processos")
+
+    def _acquire(self, wait_check=None, poll_s=0.25):
+        while True:
+            try:
+                return self._idle.get(timeout=poll_s)
+            except queue.Empty:
+                if wait_check is not None:
+                    wait_check()
+
+    def _release(self, worker, healthy):
+        """Devolve o processo ao pool, substituindo-o se falhou ou atingiu max_jobs"""
+        if self._closed:
+            worker.stop()
+            return
+        if not healthy or not worker.alive() or worker.jobs >= self.max_jobs:
+            worker.stop(graceful=healthy)
+            with self._lock:
+                self._restarts_total += 1
+            worker = self._spawn()
+        self._idle.put(worker)
+
+    def decode(self, path, token=None, poll_s=0.25):
+        """
+        Decodifica a janela de análise em um processo do pool.
+        Retorna (y, sr, duração, decoder). token.check() é consultado durante a
+        espera; no cancelamento o processo é descartado e substituído.
+        """
+        self.start()
+        wait_check = token.check if token else None
+        worker = self._acquire(wait_check)
+        healthy = False
+        try:
+            worker.conn.send(('decode', path))
+            worker.jobs += 1
+            deadline = time.monotonic() + self.job_timeout_s
+            while not worker.conn.poll(poll_s):
+                if wait_check is not None:
+                    wait_check()
+                if not worker.alive():
+                    with self._lock:
+                        self._crashes_total += 1
+                    raise DecoderPoolError('Processo decodificador terminou inesperadamente')
+                if time.monotonic() > deadline:
+                    with self._lock:
+                        self._timeouts_total += 1
+                    raise DecoderPoolError(f'Decodificação excedeu {self.job_timeout_s:.0f}s')
+            try:
+                reply = worker.conn.recv()
+            except (EOFError, OSError):
+                with self._lock:
+                    self._crashes_total += 1
+                raise DecoderPoolError('Processo decodificador terminou inesperadamente')
+            healthy = True
+        finally:
+            self._release(worker, healthy)
+
+        with self._lock:
+            self._jobs_total += 1
+            if reply[0] != 'ok':
+                self._failed_total += 1
+        if reply[0] != 'ok':
+            raise DecodeFailed(reply[1])
+        _, y, sr, duration, decoder = reply
+        return y, sr, duration, decoder
+
+    def health_check(self):
+        """Pinga os processos ociosos e substitui os que não respondem"""
+        for _ in range(self._idle.qsize()):
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            healthy = False
+            try:
+                worker.conn.send(('ping',))
+                healthy = worker.conn.poll(PING_TIMEOUT_S) and worker.conn.recv() == ('pong',)
+            except (EOFError, OSError):
+                pass
+            if not healthy:
+                print(f"⚠️ [DECODER] Processo {worker.process.name} sem resposta, reiniciando")
+            self._release(worker, healthy)
+
+    def _health_loop(self):
+        while not self._closed:
+            time.sleep(self.health_interval_s)
+            if not self._closed:
+                self.health_check()
+
+    def close(self):
+        """Encerra os processos ociosos (os ocupados são encerrados ao serem devolvidos)"""
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().stop(graceful=True)
+            except queue.Empty:
+                break
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'size': self.size if self.enabled else 0,
+                'idle': self._idle.qsize(),
+                'jobs_total': self._jobs_total,
+                'failed_total': self._failed_total,
+                'restarts_total': self._restarts_total,
+                'crashes_total': self._crashes_total,
+                'timeouts_total': self._timeouts_total
+            }
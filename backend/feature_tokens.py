@@ -0,0 +1,97 @@
+"""
+Tokens de features (opacos e assinados)
+
+/api/features devolve as features extraídas junto com um token que as carrega
+assinadas (HMAC-SHA256). /api/predict aceita esse token e roda as predições sem
+um novo upload. Como o token é autocontido, funciona com qualquer número de
+workers sem estado compartilhado; a assinatura impede que o cliente altere as
+features e o perfil de análise embutido invalida tokens de versões antigas.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+
+# Sem FEATURE_TOKEN_SECRET, um segredo gerado é guardado neste arquivo (vale entre
+# restarts e workers da mesma máquina, não entre instâncias)
+SECRET_FILE = os.environ.get(
+    'FEATURE_TOKEN_SECRET_FILE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'feature_token_secret')
+)
+_SECRET_BYTES = 32
+
+
+def _load_secret():
+    """FEATURE_TOKEN_SECRET, senão o segredo persistido em SECRET_FILE (criado na primeira vez)"""
+    secret = os.environ.get('FEATURE_TOKEN_SECRET', '')
+    if secret:
+        return secret.encode('utf-8')
+
+    print("[AVISO] FEATURE_TOKEN_SECRET não definido; tokens de features valem só nesta máquina "
+          f"(segredo em {SECRET_FILE})")
+    try:
+        os.makedirs(os.path.dirname(SECRET_FILE), exist_ok=True)
+        # Grava num temporário e publica com link: outro worker nunca lê um arquivo pela metade
+        tmp = f'{SECRET_FILE}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(secrets.token_bytes(_SECRET_BYTES))
+        try:
+            os.link(tmp, SECRET_FILE)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tmp)
+        with open(SECRET_FILE, 'rb') as f:
+            secret = f.read()
+        if len(secret) >= _SECRET_BYTES:
+            return secret
+    except OSError as e:
+        print(f"[AVISO] Não foi possível persistir o segredo dos tokens ({e})")
+    print("[AVISO] Usando segredo aleatório: tokens de features deixam de valer a cada restart e entre workers")
+    return secrets.token_bytes(_SECRET_BYTES)
+
+
+_SECRET = _load_secret()
+
+
+class InvalidFeatureToken(Exception):
+    """Token malformado, adulterado ou de outro perfil de análise"""
+
+
+def _b64encode(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(text):
+    padding = '=' * (-len(text) % 4)
+    return base64.urlsafe_b64decode(text + padding)
+
+
+def _sign(payload):
+    return hmac.new(_SECRET, payload, hashlib.sha256).digest()
+
+
+def encode_feature_token(features, profile):
+    """Serializa e assina as features de uma análise"""
+    payload = json.dumps({'p': profile, 'f': features}, separators=(',', ':'), sort_keys=True).encode('utf-8')
+    return f"{_b64encode(payload)}.{_b64encode(_sign(payload))}"
+
+
+def decode_feature_token(token, profile):
+    """Valida o token e devolve o dicionário de features"""
+    try:
+        payload_b64, signature_b64 = token.split('.', 1)
+        payload = _b64decode(payload_b64)
+        signature = _b64decode(signature_b64)
+    except (AttributeError, ValueError):
+        raise InvalidFeatureToken('Token de features malformado')
+
+    if not hmac.compare_digest(signature, _sign(payload)):
+        raise InvalidFeatureToken('Assinatura do token de features inválida')
+
+    data = json.loads(payload.decode('utf-8'))
+    if data.get('p') != profile:
+        raise InvalidFeatureToken('Token gerado por outra versão da análise, reenvie o áudio')
+    return data['f']
@@ -0,0 +1,182 @@
+"""
+Índice de fingerprints de áudio (cache de features entre re-encodes)
+
+O hash de bytes (single-flight) só reconhece o mesmo arquivo. A mesma música
+reenviada como MP3 e M4A, com outro bitrate ou com o silêncio inicial cortado
+tem bytes diferentes, mas os mesmos picos espectrais. Este módulo guarda os
+landmarks de AudioAnalyzer.fingerprint() num índice invertido local (SQLite:
+hash -> faixa, tempo) e, antes da extração, procura uma faixa já analisada
+com votos suficientes num mesmo deslocamento de tempo. Havendo match, as
+features guardadas são devolvidas sem reextrair; as predições são recalculadas
+a partir delas (modelos em cache, milissegundos), então acompanham retreinos.
+
+Configuração:
+    FINGERPRINT_INDEX          1 ativa (padrão), 0 desativa
+    FINGERPRINT_DB             caminho do banco (padrão backend/cache/fingerprints.sqlite3)
+    FINGERPRINT_MIN_RATIO      fração mínima dos hashes da consulta alinhados (padrão 0.03)
+    FINGERPRINT_MIN_VOTES      votos mínimos no melhor deslocamento (padrão 25)
+    FINGERPRINT_MAX_TRACKS     faixas mantidas (as mais antigas saem primeiro)
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+DEFAULT_DB_PATH = os.environ.get(
+    'FINGERPRINT_DB',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'fingerprints.sqlite3')
+)
+DEFAULT_ENABLED = os.environ.get('FINGERPRINT_INDEX', '1') != '0'
+DEFAULT_MIN_RATIO = float(os.environ.get('FINGERPRINT_MIN_RATIO', '0.03'))
+DEFAULT_MIN_VOTES = int(os.environ.get('FINGERPRINT_MIN_VOTES', '25'))
+DEFAULT_MAX_TRACKS = int(os.environ.get('FINGERPRINT_MAX_TRACKS', '5000'))
+
+# Limite de parâmetros por consulta do SQLite
+_SQL_BATCH = 900
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tracks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    profile TEXT NOT NULL,
+    n_hashes INTEGER NOT NULL,
+    features TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS hashes (
+    hash INTEGER NOT NULL,
+    track_id INTEGER NOT NULL,
+    t INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_hashes_hash ON hashes(hash);
+CREATE INDEX IF NOT EXISTS idx_hashes_track ON hashes(track_id);
+"""
+
+
+class FingerprintMatch:
+    """Faixa já analisada que casou com a consulta"""
+
+    def __init__(self, track_id, features, votes, ratio, offset):
+        self.track_id = track_id
+        self.features = features
+        self.votes = votes
+        self.ratio = ratio
+        self.offset = offset
+
+
+class FingerprintIndex:
+    """
+    Índice invertido de landmarks persistido em SQLite (thread-safe).
+
+    Uso:
+        match = index.lookup(hashes, times, profile)
+        if match is None:
+            features = ...extração...
+            index.add(hashes, times, profile, features)
+    """
+
+    def __init__(self, db_path=DEFAULT_DB_PATH, enabled=DEFAULT_ENABLED, min_ratio=DEFAULT_MIN_RATIO,
+                 min_votes=DEFAULT_MIN_VOTES, max_tracks=DEFAULT_MAX_TRACKS):
+        self.db_path = db_path
+        self.enabled = enabled
+        self.min_ratio = min_ratio
+        self.min_votes = min_votes
+        self.max_tracks = max_tracks
+
+        self._lock = threading.Lock()
+        self._conn = None
+        self._lookups_total = 0
+        self._hits_total = 0
+
+    def _connection(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.executescript(_SCHEMA)
+        return self._conn
+
+    def lookup(self, hashes, times, profile):
+        """
+        Procura a faixa com mais hashes alinhados num mesmo deslocamento.
+        Retorna FingerprintMatch ou None se nenhuma passar dos limiares.
+        """
+        if not self.enabled or len(hashes) == 0:
+            return None
+
+        query_times = {}
+        for h, t in zip(hashes.tolist(), times.tolist()):
+            query_times.setdefault(h, []).append(t)
+        unique = list(query_times)
+
+        votes = Counter()
+        with self._lock:
+            self._lookups_total += 1
+            conn = self._connection()
+            for start in range(0, len(unique), _SQL_BATCH):
+                batch = unique[start:start + _SQL_BATCH]
+                rows = conn.execute(
+                    f"SELECT h.hash, h.track_id, h.t FROM hashes h JOIN tracks tr ON tr.id = h.track_id "
+                    f"WHERE tr.profile = ? AND h.hash IN ({','.join('?' * len(batch))})",
+                    [profile, *batch]
+                )
+                for h, track_id, t in rows:
+                    for qt in query_times[h]:
+                        votes[(track_id, t - qt)] += 1
+
+        if not votes:
+            return None
+
+        (track_id, offset), best = votes.most_common(1)[0]
+        ratio = best / len(hashes)
+        if best < self.min_votes or ratio < self.min_ratio:
+            return None
+
+        with self._lock:
+            row = self._connection().execute('SELECT features FROM tracks WHERE id = ?', (track_id,)).fetchone()
+            if row is None:
+                return None
+            self._hits_total += 1
+        return FingerprintMatch(track_id, json.loads(row[0]), best, ratio, offset)
+
+    def add(self, hashes, times, profile, features):
+        """Indexa uma faixa recém-analisada; devolve o id da faixa"""
+        if not self.enabled or len(hashes) == 0:
+            return None
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                cursor = conn.execute(
+                    'INSERT INTO tracks (profile, n_hashes, features, created) VALUES (?, ?, ?, ?)',
+                    (profile, len(hashes), json.dumps(features), time.time())
+                )
+                track_id = cursor.lastrowid
+                conn.executemany(
+                    'INSERT INTO hashes (hash, track_id, t) VALUES (?, ?, ?)',
+                    zip(hashes.tolist(), [track_id] * len(hashes), times.tolist())
+                )
+                self._prune(conn)
+        return track_id
+
+    def _prune(self, conn):
+        """Remove as faixas mais antigas acima de max_tracks"""
+        excess = conn.execute('SELECT COUNT(*) FROM tracks').fetchone()[0] - self.max_tracks
+        if excess > 0:
+            old_ids = [r[0] for r in conn.execute('SELECT id FROM tracks ORDER BY id LIMIT ?', (excess,))]
+            conn.executemany('DELETE FROM hashes WHERE track_id = ?', [(i,) for i in old_ids])
+            conn.executemany('DELETE FROM tracks WHERE id = ?', [(i,) for i in old_ids])
+
+    def metrics(self):
+        with self._lock:
+            tracks = 0
+            if self.enabled and self._conn is not None:
+                tracks = self._conn.execute('SELECT COUNT(*) FROM tracks').fetchone()[0]
+            return {
+                'enabled': self.enabled,
+                'tracks': tracks,
+                'lookups_total': self._lookups_total,
+                'hits_total': self._hits_total,
+                'min_ratio': self.min_ratio,
+                'min_votes': self.min_votes
+            }
@@ -0,0 +1,113 @@
+"""
+Sugestão de gêneros a partir das features de áudio
+
+Regras de afinidade por gênero (antes em calculateGenreScores no frontend).
+Cada regra soma ou subtrai pontos; scores negativos viram 0. Para várias
+músicas, a sugestão usa a média dos scores e devolve os melhores gêneros.
+"""
+
+# (condição, pontos) por gênero
+GENRE_RULES = {
+    # R&B Trap: BPM baixo + ALTA speechiness + energia alta + NÃO acústico
+    'rnb_trap': [
+        (lambda f: f['bpm'] < 95, 30),
+        (lambda f: f['speechiness'] > 0.2, 35),
+        (lambda f: f['energy'] > 0.7, 20),
+        (lambda f: f['danceability'] > 0.6, 15),
+        # PENALIDADES para evitar falsos positivos
+        (lambda f: f['acousticness'] > 0.5, -40),  # Trap não é acústico
+        (lambda f: f['speechiness'] < 0.15, -30),  # Trap TEM que ter rap
+    ],
+    # R&B Pop: BPM médio + baixa speechiness + valence positiva
+    'rnb_pop': [
+        (lambda f: 95 <= f['bpm'] <= 120, 25),
+        (lambda f: f['speechiness'] < 0.15, 20),
+        (lambda f: f['valence'] > 0.5, 25),
+        (lambda f: f['danceability'] > 0.6, 15),
+        (lambda f: f['acousticness'] > 0.4, 10),
+    ],
+    # MPB Rock: Alta energia + loudness alto
+    'mpb_rock': [
+        (lambda f: f['energy'] > 0.6, 30),
+        (lambda f: f['loudness'] > -7, 25),
+        (lambda f: f['bpm'] > 110, 20),
+        (lambda f: f['acousticness'] < 0.4, 15),
+    ],
+    # MPB Indie: Acústico + valence médio + speechiness BAIXA
+    'mpb_indie': [
+        (lambda f: f['acousticness'] > 0.5, 35),
+        (lambda f: 0.4 <= f['valence'] <= 0.7, 25),
+        (lambda f: 95 <= f['bpm'] <= 120, 20),
+        (lambda f: 0.4 <= f['energy'] <= 0.65, 15),
+        (lambda f: f['speechiness'] < 0.15, 15),
+    ],
+    # Sertanejo: BPM alto + danceability alta
+    'sertanejo': [
+        (lambda f: f['bpm'] > 120, 30),
+        (lambda f: f['danceability'] > 0.7, 25),
+        (lambda f: f['valence'] > 0.6, 20),
+        (lambda f: f['acousticness'] > 0.4, 15),
+    ],
+    # Pagode: BPM médio-alto + danceability alta + acústico
+    'pagode': [
+        (lambda f: 100 <= f['bpm'] <= 130, 25),
+        (lambda f: f['danceability'] > 0.7, 30),
+        (lambda f: f['acousticness'] > 0.5, 20),
+        (lambda f: f['valence'] > 0.6, 15),
+    ],
+    # Samba: Similar ao pagode mas mais acústico + speechiness baixa
+    'samba': [
+        (lambda f: 90 <= f['bpm'] <= 120, 30),
+        (lambda f: f['acousticness'] > 0.6, 35),
+        (lambda f: f['danceability'] > 0.6, 20),
+        (lambda f: f['valence'] > 0.5, 15),
+        (lambda f: f['speechiness'] < 0.15, 10),
+    ],
+    # Forró: BPM específico + danceability
+    'forro': [
+        (lambda f: 110 <= f['bpm'] <= 140, 30),
+        (lambda f: f['danceability'] > 0.7, 25),
+        (lambda f: f['acousticness'] > 0.4, 20),
+    ],
+    # Pop Urban: Energia + danceability + produção moderna
+    'pop_urban_brasil': [
+        (lambda f: f['energy'] > 0.6, 25),
+        (lambda f: f['danceability'] > 0.65, 25),
+        (lambda f: f['loudness'] > -6, 20),
+        (lambda f: f['valence'] > 0.5, 15),
+    ],
+}
+
+# Valores neutros para features ausentes
+_DEFAULTS = {
+    'bpm': 120.0, 'energy': 0.5, 'danceability': 0.5, 'valence': 0.5,
+    'acousticness': 0.5, 'speechiness': 0.05, 'loudness': -10.0
+}
+
+
+def calculate_genre_scores(features):
+    """Score de afinidade (>= 0) de uma música para cada gênero"""
+    f = {k: float(features.get(k, default)) for k, default in _DEFAULTS.items()}
+    scores = {}
+    for genre_id, rules in GENRE_RULES.items():
+        score = sum(points for condition, points in rules if condition(f))
+        scores[genre_id] = max(0, score)
+    return scores
+
+
+def suggest_genres(features_list, top_k=2):
+    """
+    Média dos scores de várias músicas e os top_k gêneros.
+    Retorna (scores_medios, [genre_id, ...]).
+    """
+    if not features_list:
+        return {}, []
+
+    totals = dict.fromkeys(GENRE_RULES, 0.0)
+    for features in features_list:
+        for genre_id, score in calculate_genre_scores(features).items():
+            totals[genre_id] += score
+
+    avg_scores = {g: total / len(features_list) for g, total in totals.items()}
+    ranked = sorted(avg_scores, key=avg_scores.get, reverse=True)
+    return avg_scores, ranked[:top_k]
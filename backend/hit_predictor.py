@@ -13,13 +13,17 @@ class HitPredictor:
     
     # Cache global de modelos para evitar recarregamento pesado do disco (economia de RAM)
     _model_cache = {}
+    # Features (e ordem) de cada modelo + valores de preenchimento do treino, lidos do _metadata.txt
+    _features_cache = {}
     
-    def __init__(self, genre=None):
+    def __init__(self, genre=None, compact=None):
         """
         Inicializa preditor
         
         Args:
             genre: Gênero musical ('mpb', 'rnb_brasil', ou None para genérico)
+            compact: Usa a variante compacta do modelo (ml/models/compact/) quando
+                existir; padrão: variável HIT_PREDICTOR_COMPACT=1
         """
         # Alias para compatibilidade
         if genre == 'brazil':
@@ -27,6 +31,11 @@ class HitPredictor:
             
         self.genre = genre
         self.ml_model = None
+        self.ml_features = list(self.ML_FEATURES)
+        self.ml_fill_values = {}
+        if compact is None:
+            compact = os.environ.get('HIT_PREDICTOR_COMPACT', '0') == '1'
+        self.compact = compact
         self.scaler = None
         self.model_type = 'heuristic' # default
         
@@ -260,6 +269,13 @@ class HitPredictor:
                     latest_model = sorted(model_files)[-1]
                     break
             
+            if latest_model and self.compact:
+                # Variante compacta (ml/compact_models.py): mesmo nome, dentro de compact/
+                compact_model = latest_model.parent / 'compact' / latest_model.name
+                if compact_model.exists():
+                    latest_model = compact_model
+                    print(f"    [INFO] Usando a variante compacta de {latest_model.name}")
+            
             if latest_model:
                 model_path = str(latest_model)
                 
@@ -273,6 +289,9 @@ class HitPredictor:
                     self._model_cache[model_path] = self.ml_model
                     print(f"    [OK] Modelo ML carregado: {latest_model.name}")
                 
+                if model_path not in self._features_cache:
+                    self._features_cache[model_path] = self._model_features(latest_model, self.ml_model)
+                self.ml_features, self.ml_fill_values = self._features_cache[model_path]
                 self.model_type = 'ml'
             else:
                 print(f"    [INFO] Nenhum modelo ML encontrado para '{genre}', usando heuristicas")
@@ -281,18 +300,58 @@ class HitPredictor:
             print(f"    [ERRO] Ao carregar modelo ML: {e}")
             print("    [INFO] Usando heuristicas como fallback")
     
+    def _model_features(self, model_path, model):
+        """
+        Features com que o modelo foi treinado (linha 'features:' do
+        _metadata.txt) e valores de preenchimento das faltantes (linha
+        'fill_values:', médias do treino); sem metadata compatível, as 9
+        features básicas e preenchimento com 0.
+        """
+        import ast
+        metadata_path = model_path.with_name(f"{model_path.stem}_metadata.txt")
+        names, fill_values = None, {}
+        try:
+            with open(metadata_path, encoding='utf-8') as f:
+                for line in f:
+                    if line.startswith('features: '):
+                        names = list(ast.literal_eval(line[len('features: '):].strip()))
+                    elif line.startswith('fill_values: '):
+                        fill_values = dict(ast.literal_eval(line[len('fill_values: '):].strip()))
+        except (OSError, ValueError, SyntaxError):
+            names, fill_values = None, {}
+        if names is None or len(names) != getattr(model, 'n_features_in_', len(names)):
+            return list(self.ML_FEATURES), {}
+        return names, fill_values
+    
     def _prepare_ml_features(self, features):
-        """Prepara features no formato esperado pelo modelo ML"""
+        """
+        Prepara features no formato esperado pelo modelo ML. Features
+        derivadas (modelos enhanced) vêm do feature store, com as mesmas
+        transformações usadas no treino. Faltantes recebem a média do treino
+        (fill_values do metadata), como em ml/training.py prepare().
+        """
         import numpy as np
+        derived = {}
+        extra = [f for f in self.ml_features if f not in self.ML_FEATURES and f not in features]
+        if extra:
+            import sys
+            project_root = str(Path(__file__).parent.parent)
+            if project_root not in sys.path:
+                sys.path.insert(0, project_root)
+            from ml.feature_store import compute_row
+            base = {f: features.get(f, self.ml_fill_values.get(f, 0)) for f in self.ML_FEATURES}
+            derived = compute_row({**features, **base}, extra)
         ml_input = []
-        for feature_name in self.ML_FEATURES:
+        for feature_name in self.ml_features:
             # Mapeia nomes de features
             if feature_name == 'duration_ms':
                 # No backend vem em segundos, ML quer em milissegundos
                 # Se não existir, assume 3:30 (210000ms)
                 value = features.get('duration', 210.0) * 1000
+            elif feature_name in derived:
+                value = derived[feature_name]
             else:
-                value = features.get(feature_name, 0)
+                value = features.get(feature_name, self.ml_fill_values.get(feature_name, 0))
             ml_input.append(value)
         return np.array([ml_input])
     
@@ -0,0 +1,184 @@
+"""
+Busca dos hits mais parecidos com uma música (por gênero)
+
+Para cada gênero, monta uma KD-tree sobre as ML_FEATURES padronizadas
+(z-score com média/desvio do dataset do gênero) dos hits de
+ml/datasets/consolidated_knn/<genero>_consolidated.csv. As árvores ficam em
+memória depois do primeiro uso e em disco (backend/cache/similarity) com a
+assinatura do CSV de origem: quando um dataset muda, só o gênero dele é
+reconstruído.
+"""
+import hashlib
+import os
+import threading
+
+import numpy as np
+
+DEFAULT_DATASETS_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ml', 'datasets', 'consolidated_knn'
+)
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'similarity')
+
+# Mesmas features do HitPredictor (ordem importa para a padronização)
+SIMILARITY_FEATURES = ['bpm', 'energy', 'danceability', 'valence',
+                       'acousticness', 'instrumentalness', 'liveness',
+                       'speechiness', 'loudness']
+
+# Gêneros/subcategorias da API -> dataset consolidado
+GENRE_DATASETS = {
+    'mpb': 'mpb', 'mpb_rock': 'mpb', 'mpb_indie': 'mpb',
+    'rnb_brasil': 'rnb_brasil', 'rnb_trap': 'rnb_brasil', 'rnb_pop': 'rnb_brasil',
+    'pop_urban_brasil': 'pop_urban_brasil', 'brazil': 'pop_urban_brasil',
+    'sertanejo': 'sertanejo', 'pagode': 'pagode', 'samba': 'samba', 'forro': 'forro',
+}
+
+# Versão do formato do cache em disco
+_CACHE_VERSION = 1
+
+
+def _file_signature(path):
+    """Assinatura barata do CSV (tamanho + mtime), conferida a cada consulta"""
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def _content_hash(path):
+    """SHA-256 do CSV: decide se o cache em disco ainda vale quando o mtime muda"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class _GenreIndex:
+    """KD-tree dos hits de um dataset + metadados para a resposta"""
+
+    def __init__(self, tree, mean, std, tracks, signature, content_hash):
+        self.tree = tree
+        self.mean = mean
+        self.std = std
+        self.tracks = tracks
+        self.signature = signature
+        self.content_hash = content_hash
+
+
+class SimilarityIndex:
+    """
+    Índices de similaridade por gênero, carregados sob demanda (thread-safe).
+
+    Uso:
+        index.query(features, 'samba', k=5)
+        -> [{'track_name', 'artist', 'distance', 'features'}, ...]
+    """
+
+    def __init__(self, datasets_dir=DEFAULT_DATASETS_DIR, cache_dir=DEFAULT_CACHE_DIR):
+        self.datasets_dir = datasets_dir
+        self.cache_dir = cache_dir
+        self._lock = threading.Lock()
+        self._indexes = {}
+        self._builds_total = 0
+
+    def _dataset_path(self, dataset):
+        return os.path.join(self.datasets_dir, f'{dataset}_consolidated.csv')
+
+    def _cache_path(self, dataset):
+        return os.path.join(self.cache_dir, f'{dataset}.joblib')
+
+    def _build(self, dataset, path, signature, content_hash):
+        import pandas as pd
+        from sklearn.neighbors import KDTree
+
+        print(f"    [SIMILARITY] Construindo índice: {dataset}")
+        df = pd.read_csv(path, encoding='utf-8-sig')
+        df = df.dropna(subset=SIMILARITY_FEATURES)
+
+        values = df[SIMILARITY_FEATURES].to_numpy(dtype=np.float64)
+        mean = values.mean(axis=0)
+        std = values.std(axis=0)
+        std[std == 0] = 1.0
+
+        hits = df[pd.to_numeric(df.get('is_hit'), errors='coerce') == 1]
+        X = (hits[SIMILARITY_FEATURES].to_numpy(dtype=np.float64) - mean) / std
+
+        artist_column = next((c for c in ('artists', 'artist', 'artist_name') if c in hits.columns), None)
+        tracks = [
+            {
+                'track_name': str(row.get('track_name', '')),
+                'artist': str(row[artist_column]).replace(';', ', ') if artist_column and pd.notna(row[artist_column]) else '',
+                'features': {f: float(row[f]) for f in SIMILARITY_FEATURES}
+            }
+            for _, row in hits.iterrows()
+        ]
+
+        with self._lock:
+            self._builds_total += 1
+        return _GenreIndex(KDTree(X) if len(X) else None, mean, std, tracks, signature, content_hash)
+
+    def _load(self, dataset):
+        """Índice do dataset: memória -> disco (se o CSV não mudou) -> reconstrução"""
+        import joblib
+
+        path = self._dataset_path(dataset)
+        if not os.path.exists(path):
+            return None
+        signature = _file_signature(path)
+
+        with self._lock:
+            index = self._indexes.get(dataset)
+        if index is not None and index.signature == signature:
+            return index
+
+        cache_path = self._cache_path(dataset)
+        content_hash = _content_hash(path)
+        index = None
+        if os.path.exists(cache_path):
+            try:
+                version, cached = joblib.load(cache_path)
+                if version == _CACHE_VERSION and cached.content_hash == content_hash:
+                    cached.signature = signature
+                    index = cached
+            except Exception as e:
+                print(f"    [WARNING] Cache de similaridade inválido ({dataset}): {e}")
+
+        if index is None:
+            index = self._build(dataset, path, signature, content_hash)
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                joblib.dump((_CACHE_VERSION, index), cache_path)
+            except OSError as e:
+                print(f"    [WARNING] Não foi possível salvar cache de similaridade: {e}")
+
+        with self._lock:
+            self._indexes[dataset] = index
+        return index
+
+    def warm_up(self):
+        """Carrega/constrói os índices de todos os gêneros (só os CSVs alterados são reprocessados)"""
+        for dataset in sorted(set(GENRE_DATASETS.values())):
+            self._load(dataset)
+
+    def query(self, features, genre_id, k=5):
+        """Top-k hits mais próximos do gênero (distância euclidiana no espaço padronizado)"""
+        dataset = GENRE_DATASETS.get(genre_id)
+        if dataset is None:
+            return []
+        index = self._load(dataset)
+        if index is None or index.tree is None:
+            return []
+
+        x = np.array([[float(features.get(f, m)) for f, m in zip(SIMILARITY_FEATURES, index.mean)]])
+        k = max(1, min(int(k), len(index.tracks)))
+        distances, positions = index.tree.query((x - index.mean) / index.std, k=k)
+
+        return [
+            dict(index.tracks[pos], distance=round(float(dist), 4))
+            for dist, pos in zip(distances[0], positions[0])
+        ]
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'loaded': {d: len(i.tracks) for d, i in self._indexes.items()},
+                'builds_total': self._builds_total
+            }
@@ -0,0 +1,95 @@
+"""
+Single-flight: coalescência de análises idênticas em andamento
+
+Quando duas requisições chegam com o mesmo conteúdo (duplo clique, sugestão de
+gêneros seguida de análise em lote), só a primeira executa a decodificação e a
+extração; as demais esperam o resultado dela. Funciona entre threads do mesmo
+worker. Erros da execução líder são repassados a todos que estavam esperando.
+"""
+import hashlib
+import threading
+
+
+def file_content_hash(filepath, chunk_size=1024 * 1024):
+    """SHA-256 do conteúdo do arquivo lido em blocos"""
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class _Call:
+    """Execução em andamento de uma chave"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Garante uma única execução simultânea por chave.
+
+    Uso:
+        result, shared = flights.do(key, fn)
+        # shared=True quando o resultado veio de outra requisição em andamento
+
+    wait_check (opcional) é chamado periodicamente enquanto um seguidor espera,
+    permitindo que ele desista (ex: token de cancelamento) sem afetar o líder.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._executed_total = 0
+        self._coalesced_total = 0
+
+    def do(self, key, fn, wait_check=None, poll_s=0.25):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self._coalesced_total += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self._executed_total += 1
+                leader = True
+
+        if not leader:
+            try:
+                while not call.done.wait(poll_s if wait_check else None):
+                    wait_check()
+            finally:
+                with self._lock:
+                    call.waiters -= 1
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            # Remove a chave antes de liberar: chegadas posteriores recomputam
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+        return call.result, False
+
+    def metrics(self):
+        """Snapshot das métricas de coalescência"""
+        with self._lock:
+            return {
+                'in_flight_keys': len(self._calls),
+                'waiting': sum(c.waiters for c in self._calls.values()),
+                'executed_total': self._executed_total,
+                'coalesced_total': self._coalesced_total
+            }
@@ -6,6 +6,8 @@ const API_URL = '/api';
 let selectedFiles = []; // Lista de arquivos File
 let availableGenres = []; // Lista de gêneros da API
 let analysisResults = []; // [{ filename: string, features: {}, predictions: { genreId: predictionObj } }]
+const pendingAnalyses = new Map(); // request_id -> AbortController (análises em andamento)
+const featureCache = new Map(); // File -> { features, feature_token } (cada arquivo é enviado uma única vez)
 
 // Elementos DOM
 const dropZone = document.getElementById('dropZone');
@@ -43,6 +45,7 @@ newBatchBtn.addEventListener('click', resetApp);
 newAnalysisBtn.addEventListener('click', resetApp);
 backToBatchBtn.addEventListener('click', showBatchResults);
 suggestGenresBtn.addEventListener('click', suggestBestGenres);
+window.addEventListener('pagehide', cancelPendingAnalyses);
 
 // Drag and Drop Handlers
 function handleDragOver(e) { e.preventDefault(); dropZone.classList.add('drag-over'); }
@@ -105,6 +108,220 @@ function validateInputs() {
     suggestGenresBtn.disabled = selectedFiles.length === 0;
 }
 
+// Cancelamento cooperativo: cada análise leva um request_id.
+// Ao abortar (fechar aba, nova análise) o servidor é avisado e libera o worker.
+function newRequestId() {
+    if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+    return `${Date.now()}-${Math.random().toString(16).slice(2)}`;
+}
+
+async function postAnalysis(formData, endpoint = 'analyze') {
+    const requestId = newRequestId();
+    formData.append('request_id', requestId);
+
+    const controller = new AbortController();
+    pendingAnalyses.set(requestId, controller);
+    try {
+        return await fetch(`${API_URL}/${endpoint}`, {
+            method: 'POST',
+            body: formData,
+            signal: controller.signal
+        });
+    } finally {
+        pendingAnalyses.delete(requestId);
+    }
+}
+
+function cancelPendingAnalyses() {
+    pendingAnalyses.forEach((controller, requestId) => {
+        controller.abort();
+        const payload = new Blob([JSON.stringify({ request_id: requestId })], { type: 'application/json' });
+        navigator.sendBeacon(`${API_URL}/analyze/cancel`, payload);
+    });
+    pendingAnalyses.clear();
+}
+
+// Decodificação no navegador: reproduz o recorte de AudioAnalyzer.load_audio
+// (janela de 30s a partir de 15s, mono, 11025 Hz) e envia só esse trecho em
+// PCM int16 (~0,6 MB) em vez do arquivo original (até 50 MB).
+// O navegador decodifica a 44.1 kHz; a janela mono é então renderizada num
+// OfflineAudioContext a 11025 Hz, a mesma taxa do servidor (_prepare_signal).
+// Os dois lados reamostram com filtro anti-aliasing (o do navegador e o
+// polifásico do scipy), sem decimação crua.
+const PCM_DECODE_SAMPLE_RATE = 44100;
+const PCM_TARGET_SAMPLE_RATE = 11025;
+const ANALYSIS_WINDOW_S = 30;
+const ANALYSIS_OFFSET_S = 15;
+
+async function decodeToPcm(file) {
+    const OfflineCtx = window.OfflineAudioContext || window.webkitOfflineAudioContext;
+    if (!OfflineCtx) throw new Error('Web Audio API indisponível');
+
+    const ctx = new OfflineCtx(1, 1, PCM_DECODE_SAMPLE_RATE);
+    const audioBuffer = await ctx.decodeAudioData(await file.arrayBuffer());
+
+    const sr = audioBuffer.sampleRate;
+    const duration = audioBuffer.duration;
+    const startTime = duration > ANALYSIS_WINDOW_S ? ANALYSIS_OFFSET_S : 0;
+    const startSample = Math.floor(startTime * sr);
+    const endSample = Math.min(
+        audioBuffer.length,
+        startSample + Math.floor(Math.min(ANALYSIS_WINDOW_S, duration) * sr)
+    );
+
+    const windowLength = endSample - startSample;
+    const channels = [];
+    for (let c = 0; c < audioBuffer.numberOfChannels; c++) {
+        channels.push(audioBuffer.getChannelData(c));
+    }
+
+    // Mixdown para mono (média dos canais, como no servidor)
+    const mono = ctx.createBuffer(1, windowLength, sr);
+    const monoData = mono.getChannelData(0);
+    for (let i = 0; i < windowLength; i++) {
+        let sum = 0;
+        for (let c = 0; c < channels.length; c++) sum += channels[c][startSample + i];
+        monoData[i] = sum / channels.length;
+    }
+
+    // Reamostragem para 11025 Hz pelo próprio Web Audio (com anti-aliasing)
+    const outLength = Math.ceil(windowLength * PCM_TARGET_SAMPLE_RATE / sr);
+    const resampler = new OfflineCtx(1, outLength, PCM_TARGET_SAMPLE_RATE);
+    const source = resampler.createBufferSource();
+    source.buffer = mono;
+    source.connect(resampler.destination);
+    source.start();
+    const samples = (await resampler.startRendering()).getChannelData(0);
+
+    // Quantização int16 (mesma ordem do servidor)
+    const pcm = new Int16Array(outLength);
+    for (let i = 0; i < outLength; i++) {
+        pcm[i] = Math.max(-32768, Math.min(32767, Math.round(samples[i] * 32768)));
+    }
+
+    return { pcm, sampleRate: PCM_TARGET_SAMPLE_RATE, duration };
+}
+
+// Upload em blocos (resumível): a análise é pedida junto com o primeiro bloco e
+// o servidor decodifica à medida que os blocos chegam. Se a análise terminar
+// antes (só a janela de 15s-45s importa), o restante do arquivo nem é enviado.
+const UPLOAD_CHUNK_SIZE = 1024 * 1024;
+const CHUNK_MAX_RETRIES = 3;
+
+async function sha256Hex(buffer) {
+    const digest = await crypto.subtle.digest('SHA-256', buffer);
+    return Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, '0')).join('');
+}
+
+async function putChunk(uploadId, index, buffer, checksum) {
+    for (let attempt = 0; ; attempt++) {
+        try {
+            const response = await fetch(`${API_URL}/upload/${uploadId}/chunks/${index}`, {
+                method: 'PUT',
+                headers: { 'Content-Type': 'application/octet-stream', 'X-Chunk-SHA256': checksum },
+                body: buffer
+            });
+            // 404/410: sessão encerrada (análise já terminou ou foi cancelada)
+            if (response.ok || response.status === 404 || response.status === 410) return response.ok;
+            if (attempt >= CHUNK_MAX_RETRIES) throw new Error(`Falha ao enviar bloco ${index}: HTTP ${response.status}`);
+        } catch (error) {
+            if (attempt >= CHUNK_MAX_RETRIES) throw error;
+        }
+        await new Promise(resolve => setTimeout(resolve, 500 * 2 ** attempt));
+    }
+}
+
+async function getFileFeaturesChunked(file) {
+    if (!(window.crypto && crypto.subtle)) throw new Error('crypto.subtle indisponível');
+
+    const session = await postJson('upload', {
+        filename: file.name,
+        total_size: file.size,
+        chunk_size: UPLOAD_CHUNK_SIZE
+    });
+    const uploadId = session.upload_id;
+    const received = new Set(session.received);
+
+    // Análise em paralelo ao envio dos blocos
+    let analysisDone = false;
+    const analysis = postAnalysis(new FormData(), `upload/${uploadId}/features`)
+        .finally(() => { analysisDone = true; });
+
+    try {
+        for (let index = 0; index < session.n_chunks && !analysisDone; index++) {
+            if (received.has(index)) continue;
+            const start = index * session.chunk_size;
+            const buffer = await file.slice(start, start + session.chunk_size).arrayBuffer();
+            if (!await putChunk(uploadId, index, buffer, await sha256Hex(buffer))) break;
+        }
+    } catch (error) {
+        // Envio falhou de vez: encerra a sessão (a análise em espera termina com erro)
+        fetch(`${API_URL}/upload/${uploadId}`, { method: 'DELETE' }).catch(() => {});
+        await analysis.catch(() => {});
+        throw error;
+    }
+
+    return analysis;
+}
+
+// Upload único: extrai features via /api/features e guarda o feature_token.
+// Sugestão de gêneros e predições reutilizam o token sem reenviar o áudio.
+// Tenta primeiro o upload compacto de PCM; se o navegador não decodificar o
+// formato, envia o arquivo original em blocos (ou inteiro, se o servidor não
+// aceitar sessões de upload).
+async function getFileFeatures(file) {
+    if (featureCache.has(file)) return featureCache.get(file);
+
+    let response = null;
+    try {
+        const { pcm, sampleRate, duration } = await decodeToPcm(file);
+        const formData = new FormData();
+        formData.append('pcm', new Blob([pcm.buffer], { type: 'application/octet-stream' }), 'window.pcm');
+        formData.append('encoding', 's16le');
+        formData.append('sample_rate', sampleRate);
+        formData.append('duration', duration);
+        formData.append('filename', file.name);
+        response = await postAnalysis(formData, 'features/pcm');
+    } catch (error) {
+        if (error.name === 'AbortError') throw error;
+        console.warn(`Decodificação local falhou para ${file.name}, enviando arquivo original`, error);
+    }
+
+    if (!response) {
+        try {
+            response = await getFileFeaturesChunked(file);
+        } catch (error) {
+            if (error.name === 'AbortError') throw error;
+            console.warn(`Upload em blocos falhou para ${file.name}, enviando arquivo inteiro`, error);
+            const formData = new FormData();
+            formData.append('audio', file);
+            response = await postAnalysis(formData, 'features');
+        }
+    }
+
+    const data = await response.json();
+    if (!response.ok) {
+        throw new Error(data.error || `Erro HTTP ${response.status}`);
+    }
+
+    const entry = { features: data.features, feature_token: data.feature_token };
+    featureCache.set(file, entry);
+    return entry;
+}
+
+async function postJson(endpoint, payload) {
+    const response = await fetch(`${API_URL}/${endpoint}`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify(payload)
+    });
+    const data = await response.json();
+    if (!response.ok) {
+        throw new Error(data.error || `Erro HTTP ${response.status}`);
+    }
+    return data;
+}
+
 function getSelectedGenres() {
     const checkboxes = genresGrid.querySelectorAll('input:checked');
     return Array.from(checkboxes).map(cb => cb.value);
@@ -120,54 +337,31 @@ async function suggestBestGenres() {
     suggestGenresBtn.textContent = '⏳ Analisando...';
 
     try {
-        const allGenreScores = {}; // Acumula scores de todas as músicas
+        const featureTokens = [];
 
-        // Analisa cada música
+        // Extrai features de cada música (upload único, reaproveitado na análise)
         for (let i = 0; i < selectedFiles.length; i++) {
             const file = selectedFiles[i];
 
             // Atualiza progresso
             suggestGenresBtn.textContent = `⏳ ${i + 1}/${selectedFiles.length}...`;
 
-            // Extrai features da música
-            const formData = new FormData();
-            formData.append('audio', file);
-            formData.append('genres[]', 'mpb_rock'); // Dummy para extrair features
-
-            const response = await fetch(`${API_URL}/analyze`, {
-                method: 'POST',
-                body: formData
-            });
-
-            if (!response.ok) {
-                console.warn(`Erro ao analisar ${file.name}, pulando...`);
-                continue;
-            }
-
-            const data = await response.json();
-            const features = data.features;
-
-            // Calcula scores para esta música
-            const genreScores = calculateGenreScores(features);
-
-            // Acumula scores
-            for (const [genre, score] of Object.entries(genreScores)) {
-                if (!allGenreScores[genre]) allGenreScores[genre] = 0;
-                allGenreScores[genre] += score;
+            try {
+                const { feature_token } = await getFileFeatures(file);
+                featureTokens.push(feature_token);
+            } catch (error) {
+                if (error.name === 'AbortError') throw error;
+                console.warn(`Erro ao analisar ${file.name}, pulando...`, error);
             }
         }
 
-        // Calcula média dos scores
-        const avgScores = {};
-        for (const [genre, totalScore] of Object.entries(allGenreScores)) {
-            avgScores[genre] = totalScore / selectedFiles.length;
+        if (featureTokens.length === 0) {
+            throw new Error('Nenhuma música pôde ser analisada');
         }
 
-        // Ordena por score médio e pega os top 2
-        const sortedGenres = Object.entries(avgScores)
-            .sort((a, b) => b[1] - a[1])
-            .slice(0, 2)
-            .map(([id]) => id);
+        // Scores por gênero calculados no servidor (média entre as músicas, top 2)
+        const suggestion = await postJson('suggest-genres', { feature_tokens: featureTokens, top_k: 2 });
+        const sortedGenres = suggestion.suggested;
 
         // Desmarca todos
         genresGrid.querySelectorAll('input').forEach(cb => cb.checked = false);
@@ -194,6 +388,10 @@ async function suggestBestGenres() {
         }, 3000);
 
     } catch (error) {
+        if (error.name === 'AbortError') {
+            suggestGenresBtn.textContent = '✨ Sugerir Gêneros';
+            return;
+        }
         console.error('Erro ao sugerir gêneros:', error);
         alert('Erro ao analisar músicas. Tente novamente.');
         suggestGenresBtn.textContent = '✨ Sugerir Gêneros';
@@ -201,85 +399,6 @@ async function suggestBestGenres() {
     }
 }
 
-function calculateGenreScores(features) {
-    const genreScores = {};
-
-    // R&B Trap: BPM baixo + ALTA speechiness + energia alta + NÃO acústico
-    genreScores['rnb_trap'] = 0;
-    if (features.bpm < 95) genreScores['rnb_trap'] += 30;
-    if (features.speechiness > 0.2) genreScores['rnb_trap'] += 35; // Aumentado threshold
-    if (features.energy > 0.7) genreScores['rnb_trap'] += 20;
-    if (features.danceability > 0.6) genreScores['rnb_trap'] += 15;
-    // PENALIDADES para evitar falsos positivos
-    if (features.acousticness > 0.5) genreScores['rnb_trap'] -= 40; // Trap não é acústico
-    if (features.speechiness < 0.15) genreScores['rnb_trap'] -= 30; // Trap TEM que ter rap
-
-    // R&B Pop: BPM médio + baixa speechiness + valence positiva
-    genreScores['rnb_pop'] = 0;
-    if (features.bpm >= 95 && features.bpm <= 120) genreScores['rnb_pop'] += 25;
-    if (features.speechiness < 0.15) genreScores['rnb_pop'] += 20;
-    if (features.valence > 0.5) genreScores['rnb_pop'] += 25;
-    if (features.danceability > 0.6) genreScores['rnb_pop'] += 15;
-    if (features.acousticness > 0.4) genreScores['rnb_pop'] += 10; // R&B Pop pode ser acústico
-
-    // MPB Rock: Alta energia + loudness alto
-    genreScores['mpb_rock'] = 0;
-    if (features.energy > 0.6) genreScores['mpb_rock'] += 30;
-    if (features.loudness > -7) genreScores['mpb_rock'] += 25;
-    if (features.bpm > 110) genreScores['mpb_rock'] += 20;
-    if (features.acousticness < 0.4) genreScores['mpb_rock'] += 15;
-
-    // MPB Indie: Acústico + valence médio + speechiness BAIXA
-    genreScores['mpb_indie'] = 0;
-    if (features.acousticness > 0.5) genreScores['mpb_indie'] += 35;
-    if (features.valence >= 0.4 && features.valence <= 0.7) genreScores['mpb_indie'] += 25;
-    if (features.bpm >= 95 && features.bpm <= 120) genreScores['mpb_indie'] += 20;
-    if (features.energy >= 0.4 && features.energy <= 0.65) genreScores['mpb_indie'] += 15;
-    if (features.speechiness < 0.15) genreScores['mpb_indie'] += 15; // Indie tem pouca fala
-
-    // Sertanejo: BPM alto + danceability alta
-    genreScores['sertanejo'] = 0;
-    if (features.bpm > 120) genreScores['sertanejo'] += 30;
-    if (features.danceability > 0.7) genreScores['sertanejo'] += 25;
-    if (features.valence > 0.6) genreScores['sertanejo'] += 20;
-    if (features.acousticness > 0.4) genreScores['sertanejo'] += 15;
-
-    // Pagode: BPM médio-alto + danceability alta + acústico
-    genreScores['pagode'] = 0;
-    if (features.bpm >= 100 && features.bpm <= 130) genreScores['pagode'] += 25;
-    if (features.danceability > 0.7) genreScores['pagode'] += 30;
-    if (features.acousticness > 0.5) genreScores['pagode'] += 20;
-    if (features.valence > 0.6) genreScores['pagode'] += 15;
-
-    // Samba: Similar ao pagode mas mais acústico + speechiness baixa
-    genreScores['samba'] = 0;
-    if (features.bpm >= 90 && features.bpm <= 120) genreScores['samba'] += 30;
-    if (features.acousticness > 0.6) genreScores['samba'] += 35;
-    if (features.danceability > 0.6) genreScores['samba'] += 20;
-    if (features.valence > 0.5) genreScores['samba'] += 15;
-    if (features.speechiness < 0.15) genreScores['samba'] += 10; // Samba tem pouca fala
-
-    // Forró: BPM específico + danceability
-    genreScores['forro'] = 0;
-    if (features.bpm >= 110 && features.bpm <= 140) genreScores['forro'] += 30;
-    if (features.danceability > 0.7) genreScores['forro'] += 25;
-    if (features.acousticness > 0.4) genreScores['forro'] += 20;
-
-    // Pop Urban: Energia + danceability + produção moderna
-    genreScores['pop_urban_brasil'] = 0;
-    if (features.energy > 0.6) genreScores['pop_urban_brasil'] += 25;
-    if (features.danceability > 0.65) genreScores['pop_urban_brasil'] += 25;
-    if (features.loudness > -6) genreScores['pop_urban_brasil'] += 20;
-    if (features.valence > 0.5) genreScores['pop_urban_brasil'] += 15;
-
-    // Garante que scores negativos viram 0
-    for (const genre in genreScores) {
-        genreScores[genre] = Math.max(0, genreScores[genre]);
-    }
-
-    return genreScores;
-}
-
 // Batch Analysis
 async function startBatchAnalysis() {
     const genreIds = getSelectedGenres();
@@ -301,30 +420,19 @@ async function startBatchAnalysis() {
             progressFill.style.width = `${Math.max(5, baseProgress)}%`;
             loadingText.textContent = `Analisando: ${file.name} (${i + 1}/${selectedFiles.length})`;
 
-            const formData = new FormData();
-            formData.append('audio', file);
-            genreIds.forEach(id => formData.append('genres[]', id));
-
             try {
-                const response = await fetch(`${API_URL}/analyze`, {
-                    method: 'POST',
-                    body: formData
-                });
-
-                if (!response.ok) {
-                    const errBody = await response.json();
-                    throw new Error(errBody.error || `Erro HTTP ${response.status}`);
-                }
-
-                const data = await response.json();
+                // Features do cache (se já sugeriu gêneros) ou upload único
+                const { features, feature_token } = await getFileFeatures(file);
+                const data = await postJson('predict', { feature_token, genres: genreIds });
                 console.log(`<<< Sucesso: ${file.name}`, data);
 
                 analysisResults.push({
                     originalName: file.name,
-                    features: data.features,
+                    features: features,
                     predictions: data.predictions
                 });
             } catch (error) {
+                if (error.name === 'AbortError') return; // Análise cancelada (reset/fechamento)
                 console.error(`Falha no arquivo ${file.name}:`, error);
                 alert(`Erro ao analisar "${file.name}":\n${error.message}`);
                 // Continua para o próximo arquivo mesmo com erro
@@ -560,6 +668,8 @@ function displayRecommendations(recommendations) {
 }
 
 function resetApp() {
+    cancelPendingAnalyses();
+    featureCache.clear();
     selectedFiles = [];
     analysisResults = [];
     renderFilesList();
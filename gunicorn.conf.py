@@ -0,0 +1,10 @@
+"""
+Configuração do gunicorn (lida automaticamente do diretório de trabalho).
+Os parâmetros de bind/workers/threads ficam no CMD do Dockerfile.
+"""
+
+
+def post_worker_init(worker):
+    """Sobe o pool de decodificação do worker assim que a aplicação carrega"""
+    from backend.api import decoder_pool
+    decoder_pool.start()
@@ -2,6 +2,7 @@
 Reclassificação de Non-Hits para Subcategorias
 Balanceia datasets adicionando non-hits classificados
 """
+import numpy as np
 import pandas as pd
 from pathlib import Path
 
@@ -25,16 +26,13 @@ def reclassify_nonhits():
         
         print(f"MPB non-hits encontrados: {len(df_mpb_nonhits)}")
         
-        # Classifica non-hits baseado em features
-        def classify_mpb_nonhit(row):
-            # MPB Rock: alta energia + loudness alto
-            if 'energy' in row and 'loudness' in row:
-                if row['energy'] > 0.65 and row['loudness'] > -8:
-                    return 'mpb_rock'
-            # Default: Nova MPB
-            return 'nova_mpb'
-        
-        df_mpb_nonhits['subgenre'] = df_mpb_nonhits.apply(classify_mpb_nonhit, axis=1)
+        # Classifica non-hits baseado em features (vetorizado)
+        # MPB Rock: alta energia + loudness alto; default: Nova MPB
+        if {'energy', 'loudness'} <= set(df_mpb_nonhits.columns):
+            is_rock = (df_mpb_nonhits['energy'] > 0.65) & (df_mpb_nonhits['loudness'] > -8)
+        else:
+            is_rock = pd.Series(False, index=df_mpb_nonhits.index)
+        df_mpb_nonhits['subgenre'] = np.where(is_rock, 'mpb_rock', 'nova_mpb')
         
         # Separa
         mpb_rock_nonhits = df_mpb_nonhits[df_mpb_nonhits['subgenre'] == 'mpb_rock'].drop('subgenre', axis=1)
@@ -59,19 +57,14 @@ def reclassify_nonhits():
         
         print(f"R&B non-hits encontrados: {len(df_rnb_nonhits)}")
         
-        # Classifica non-hits
-        def classify_rnb_nonhit(row):
-            if 'bpm' in row and 'speechiness' in row and 'valence' in row:
-                # R&B Trap: BPM baixo + alta speechiness
-                if row['bpm'] < 95 and row['speechiness'] > 0.15:
-                    return 'rnb_trap'
-                # R&B Pop: BPM médio + baixa speechiness
-                elif row['bpm'] >= 95 and row['speechiness'] < 0.15 and row['valence'] > 0.4:
-                    return 'rnb_pop'
-            # Default: R&B Trap (maioria)
-            return 'rnb_trap'
-        
-        df_rnb_nonhits['subgenre'] = df_rnb_nonhits.apply(classify_rnb_nonhit, axis=1)
+        # Classifica non-hits (vetorizado)
+        # R&B Pop: BPM médio + baixa speechiness + valence positiva; default: R&B Trap (maioria)
+        if {'bpm', 'speechiness', 'valence'} <= set(df_rnb_nonhits.columns):
+            is_pop = ((df_rnb_nonhits['bpm'] >= 95) & (df_rnb_nonhits['speechiness'] < 0.15)
+                      & (df_rnb_nonhits['valence'] > 0.4))
+        else:
+            is_pop = pd.Series(False, index=df_rnb_nonhits.index)
+        df_rnb_nonhits['subgenre'] = np.where(is_pop, 'rnb_pop', 'rnb_trap')
         
         # Separa
         rnb_trap_nonhits = df_rnb_nonhits[df_rnb_nonhits['subgenre'] == 'rnb_trap'].drop('subgenre', axis=1)
@@ -0,0 +1,400 @@
+"""
+Índice de scores do catálogo por gênero (top-k sem reprocessar o dataset)
+
+Os scripts de TOP 10 recarregavam o dataset e o modelo e pontuavam todas as
+linhas a cada consulta. Aqui o build pontua uma vez cada faixa dos datasets
+consolidados (ml/datasets/consolidated_knn) com o HitPredictor de cada gênero
+(o mesmo score da API) e grava o resultado em colunas .npy ordenadas por score
+decrescente em ml/datasets/score_index/<genero>/. As consultas leem as colunas
+por mmap: top-k é uma fatia, faixas de score são busca binária e filtros
+(dataset de origem, is_hit) varrem só o trecho já ordenado.
+
+Rebuild incremental: cada linha guarda o hash das features e cada índice a
+versão do modelo (hit_predictor.py, versão do feature store, .pkl e
+_metadata.txt do gênero, inclusive as variantes compactas). Se a versão não mudou,
+só faixas novas ou com features alteradas são pontuadas de novo.
+
+Uso:
+    python ml/catalog_scores.py build [--genre mpb ...] [--workers N] [--force]
+    python ml/catalog_scores.py top mpb [-k 10] [--source mpb] [--hits-only] [--min-score 70]
+"""
+import argparse
+import contextlib
+import hashlib
+import heapq
+import io
+import json
+import os
+import shutil
+import sys
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from pathlib import Path
+
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+import pandas as pd
+
+from ml.dataset_store import StringColumn, load_table, table_name
+from ml.feature_store import feature_set_version
+
+CATALOG_DIR = PROJECT_ROOT / 'ml' / 'datasets' / 'consolidated_knn'
+INDEX_DIR = PROJECT_ROOT / 'ml' / 'datasets' / 'score_index'
+MODELS_DIR = PROJECT_ROOT / 'ml' / 'models'
+PREDICTOR_SOURCE = PROJECT_ROOT / 'backend' / 'hit_predictor.py'
+
+# Mesmas features do HitPredictor
+ML_FEATURES = ['bpm', 'energy', 'danceability', 'valence',
+               'acousticness', 'instrumentalness', 'liveness',
+               'speechiness', 'loudness']
+
+GENRES = ['mpb', 'rnb_brasil', 'pop_urban_brasil', 'sertanejo', 'pagode', 'samba', 'forro']
+GENRE_ALIASES = {'brazil': 'pop_urban_brasil'}
+
+# Subcategorias cujos modelos o HitPredictor pode carregar para o gênero
+GENRE_MODEL_PREFIXES = {
+    'mpb': ['mpb', 'mpb_rock', 'mpb_indie'],
+    'rnb_brasil': ['rnb_brasil', 'rnb_trap', 'rnb_pop'],
+}
+
+# Colunas gravadas no índice (uma .npy por coluna; texto em dicionário, como no dataset_store)
+COLUMNS = ['key', 'track_name', 'artist', 'source', 'is_hit',
+           'features', 'feature_hash', 'hit_score', 'ml_probability']
+STRING_COLUMNS = {'key', 'track_name', 'artist', 'source'}
+
+INDEX_FORMAT = 2
+
+
+def resolve_genre(genre):
+    return GENRE_ALIASES.get(genre, genre)
+
+
+def _file_signature(path):
+    stat = path.stat()
+    return f"{path.name}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def model_version(genre):
+    """
+    Hash do código do preditor + versão das features derivadas + assinatura
+    dos modelos que o gênero pode usar (.pkl e _metadata.txt, normais e
+    compactos: a lista de features e a variante vêm desses arquivos)
+    """
+    digest = hashlib.sha256(PREDICTOR_SOURCE.read_bytes())
+    digest.update(feature_set_version().encode())
+    for models_dir in (MODELS_DIR, MODELS_DIR / 'compact'):
+        for prefix in GENRE_MODEL_PREFIXES.get(genre, [genre]):
+            for model_file in sorted(models_dir.glob(f"{prefix}_*")):
+                if model_file.suffix in ('.pkl', '.txt'):
+                    digest.update(_file_signature(model_file).encode())
+    return digest.hexdigest()[:16]
+
+
+def feature_hashes(features):
+    """Hash de 64 bits de cada linha de features (float32), para detectar mudanças"""
+    rows = np.ascontiguousarray(features, dtype=np.float32)
+    return np.array(
+        [int.from_bytes(hashlib.blake2b(row.tobytes(), digest_size=8).digest(), 'little') for row in rows],
+        dtype=np.uint64
+    )
+
+
+def load_catalog(catalog_dir=CATALOG_DIR):
+    """Une os datasets consolidados numa tabela de faixas (uma linha por dataset + track_id)"""
+    frames = []
+    for path in sorted(Path(catalog_dir).glob('*_consolidated.csv')):
+        df = load_table(table_name(path), columns=['track_id', 'track_name', 'artists', 'artist', 'artist_name',
+                                                   'is_hit', *ML_FEATURES])
+        df = df.dropna(subset=ML_FEATURES)
+
+        # Os datasets misturam colunas de artista: usa a primeira preenchida
+        artist_columns = [c for c in ('artists', 'artist', 'artist_name') if c in df.columns]
+        if artist_columns:
+            artist = df[artist_columns].astype(object).bfill(axis=1).iloc[:, 0]
+        else:
+            artist = pd.Series('', index=df.index)
+        artist = artist.fillna('').astype(str).str.replace(';', ', ')
+        track_name = df['track_name'].fillna('').astype(str) if 'track_name' in df.columns else ''
+        key = track_name + '|' + artist
+        if 'track_id' in df.columns:
+            key = df['track_id'].astype(object).where(df['track_id'].notna(), key).astype(str)
+
+        frames.append(pd.DataFrame({
+            'key': key,
+            'track_name': track_name,
+            'artist': artist,
+            'source': path.name.replace('_consolidated.csv', ''),
+            'is_hit': (df['is_hit'] == 1).fillna(False).astype(np.int8) if 'is_hit' in df.columns else np.int8(0),
+            **{f: df[f].astype(np.float32) for f in ML_FEATURES}
+        }))
+
+    if not frames:
+        return pd.DataFrame(columns=['key', 'track_name', 'artist', 'source', 'is_hit', *ML_FEATURES])
+    # Uma faixa pode estar em mais de um dataset (com rótulos diferentes): cada dataset mantém a sua linha
+    catalog = pd.concat(frames, ignore_index=True)
+    return catalog.drop_duplicates(['source', 'key'], keep='first').reset_index(drop=True)
+
+
+def score_features(genre, features):
+    """
+    Score do HitPredictor para cada linha (o mesmo da API). Um preditor por
+    gênero: predict() troca o modelo pela subcategoria detectada em cada
+    faixa (mpb, rnb_brasil) a partir do cache da classe, então reaproveitar
+    a instância dá o mesmo resultado que um preditor novo por faixa.
+    """
+    from backend.hit_predictor import HitPredictor
+
+    scores = np.empty(len(features), dtype=np.float32)
+    probabilities = np.full(len(features), np.nan, dtype=np.float32)
+    with warnings.catch_warnings(), contextlib.redirect_stdout(io.StringIO()):
+        warnings.simplefilter('ignore')
+        predictor = HitPredictor(genre=genre)
+        for i, row in enumerate(features):
+            prediction = predictor.predict(dict(zip(ML_FEATURES, row.tolist())))
+            scores[i] = prediction['hit_score']
+            if 'ml_prediction' in prediction:
+                probabilities[i] = prediction['ml_prediction']['probability'] / 100
+    return scores, probabilities
+
+
+def _read_index(genre, index_dir):
+    """Colunas + metadados de um índice já gravado (None se não existir/corrompido)"""
+    folder = Path(index_dir) / genre
+    meta_path = folder / 'meta.json'
+    if not meta_path.exists():
+        return None, None
+    try:
+        meta = json.loads(meta_path.read_text(encoding='utf-8'))
+        columns = {
+            c: StringColumn.load(folder, c) if c in STRING_COLUMNS else np.load(folder / f'{c}.npy', mmap_mode='r')
+            for c in COLUMNS
+        }
+    except (OSError, ValueError) as e:
+        print(f"  [AVISO] Índice de {genre} ilegível, reconstruindo: {e}")
+        return None, None
+    if meta.get('format') != INDEX_FORMAT or any(len(col) != meta['rows'] for col in columns.values()):
+        return None, None
+    return columns, meta
+
+
+def _write_index(genre, columns, meta, index_dir):
+    """Grava as colunas num diretório temporário e troca pelo índice anterior"""
+    folder = Path(index_dir) / genre
+    building = Path(index_dir) / f'{genre}.building'
+    shutil.rmtree(building, ignore_errors=True)
+    building.mkdir(parents=True)
+    for name in COLUMNS:
+        if name in STRING_COLUMNS:
+            StringColumn.encode(columns[name]).save(building, name)
+        else:
+            np.save(building / f'{name}.npy', columns[name])
+    (building / 'meta.json').write_text(json.dumps(meta, indent=2), encoding='utf-8')
+    shutil.rmtree(folder, ignore_errors=True)
+    os.replace(building, folder)
+
+
+def build_genre(genre, catalog, index_dir=INDEX_DIR, force=False):
+    """
+    Pontua o catálogo para um gênero, reaproveitando os scores do índice
+    anterior quando a versão do modelo e o hash das features não mudaram.
+    """
+    genre = resolve_genre(genre)
+    start = time.time()
+    version = model_version(genre)
+    features = catalog[ML_FEATURES].to_numpy(dtype=np.float32)
+    hashes = feature_hashes(features)
+
+    scores = np.full(len(catalog), np.nan, dtype=np.float32)
+    probabilities = np.full(len(catalog), np.nan, dtype=np.float32)
+
+    previous, meta = (None, None) if force else _read_index(genre, index_dir)
+    if previous is not None and meta['model_version'] == version:
+        known = {h: i for i, h in enumerate(np.asarray(previous['feature_hash']).tolist())}
+        old = np.array([known.get(h, -1) for h in hashes.tolist()], dtype=np.int64)
+        reuse = old >= 0
+        scores[reuse] = previous['hit_score'][old[reuse]]
+        probabilities[reuse] = previous['ml_probability'][old[reuse]]
+
+    # Faixas com features iguais recebem o mesmo score: pontua cada vetor uma vez
+    pending = np.flatnonzero(np.isnan(scores))
+    unique_hashes, first, inverse = np.unique(hashes[pending], return_index=True, return_inverse=True)
+    if len(unique_hashes):
+        new_scores, new_probabilities = score_features(genre, features[pending[first]])
+        scores[pending] = new_scores[inverse]
+        probabilities[pending] = new_probabilities[inverse]
+
+    # Ordem do índice: score decrescente, empate por chave e dataset (estável entre builds)
+    keys = catalog['key'].to_numpy(dtype=str)
+    order = np.lexsort((catalog['source'].to_numpy(dtype=str), keys, -scores))
+    columns = {
+        'key': keys[order],
+        'track_name': catalog['track_name'].to_numpy(dtype=str)[order],
+        'artist': catalog['artist'].to_numpy(dtype=str)[order],
+        'source': catalog['source'].to_numpy(dtype=str)[order],
+        'is_hit': catalog['is_hit'].to_numpy(dtype=np.int8)[order],
+        'features': features[order],
+        'feature_hash': hashes[order],
+        'hit_score': scores[order],
+        'ml_probability': probabilities[order],
+    }
+    meta = {
+        'format': INDEX_FORMAT,
+        'genre': genre,
+        'model_version': version,
+        'features': ML_FEATURES,
+        'rows': int(len(catalog)),
+        'built_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+    _write_index(genre, columns, meta, index_dir)
+
+    scored = int(len(unique_hashes))
+    return {'genre': genre, 'rows': int(len(catalog)), 'scored': scored,
+            'reused': int(len(catalog) - len(pending)), 'seconds': round(time.time() - start, 1)}
+
+
+def build(genres=GENRES, workers=None, force=False, catalog_dir=CATALOG_DIR, index_dir=INDEX_DIR):
+    """Atualiza os índices dos gêneros em paralelo (um processo por gênero)"""
+    catalog = load_catalog(catalog_dir)
+    genres = [resolve_genre(g) for g in genres]
+    workers = workers or min(len(genres), os.cpu_count() or 1)
+    print(f"Catálogo: {len(catalog)} faixas | gêneros: {', '.join(genres)} | processos: {workers}")
+
+    if workers <= 1:
+        return [build_genre(g, catalog, index_dir, force) for g in genres]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(build_genre, g, catalog, index_dir, force) for g in genres]
+        return [f.result() for f in futures]
+
+
+class CatalogScoreIndex:
+    """
+    Leitura de um índice de gênero (colunas em mmap, ordenadas por score).
+
+    Uso:
+        index = CatalogScoreIndex('mpb')
+        index.top_k(10, source='mpb')
+        index.score_range(70, 90, is_hit=1)
+    """
+
+    def __init__(self, genre, index_dir=INDEX_DIR):
+        self.genre = resolve_genre(genre)
+        self.columns, self.meta = _read_index(self.genre, index_dir)
+        if self.columns is None:
+            raise FileNotFoundError(
+                f"Índice de scores não encontrado para '{self.genre}' "
+                f"(rode: python ml/catalog_scores.py build --genre {self.genre})"
+            )
+        # Scores negados ficam crescentes: faixas de score viram busca binária
+        self._neg_scores = -np.asarray(self.columns['hit_score'])
+
+    @property
+    def stale(self):
+        """True se o modelo mudou desde o build"""
+        return self.meta['model_version'] != model_version(self.genre)
+
+    def __len__(self):
+        return self.meta['rows']
+
+    def _bounds(self, min_score=None, max_score=None):
+        lo = 0 if max_score is None else int(np.searchsorted(self._neg_scores, -max_score, side='left'))
+        hi = len(self) if min_score is None else int(np.searchsorted(self._neg_scores, -min_score, side='right'))
+        return lo, hi
+
+    def _select(self, lo, hi, k=None, source=None, is_hit=None):
+        """Posições em [lo, hi) que passam nos filtros, na ordem do índice"""
+        mask = np.ones(hi - lo, dtype=bool)
+        if source is not None:
+            sources = self.columns['source']
+            mask &= np.isin(sources.codes[lo:hi], sources.codes_for([source]))
+        if is_hit is not None:
+            mask &= self.columns['is_hit'][lo:hi] == is_hit
+        positions = lo + np.flatnonzero(mask)
+        return positions if k is None else positions[:k]
+
+    def rows(self, positions):
+        return [
+            {
+                'track_name': str(self.columns['track_name'][i]),
+                'artist': str(self.columns['artist'][i]),
+                'source': str(self.columns['source'][i]),
+                'is_hit': int(self.columns['is_hit'][i]),
+                'hit_score': float(self.columns['hit_score'][i]),
+                'ml_probability': None if np.isnan(self.columns['ml_probability'][i])
+                else float(self.columns['ml_probability'][i]),
+                **{f: float(v) for f, v in zip(ML_FEATURES, self.columns['features'][i])},
+            }
+            for i in positions
+        ]
+
+    def top_k(self, k=10, source=None, is_hit=None, min_score=None):
+        """As k faixas de maior score (com filtros opcionais)"""
+        lo, hi = self._bounds(min_score=min_score)
+        if source is None and is_hit is None:
+            return self.rows(range(lo, min(hi, lo + k)))
+        return self.rows(self._select(lo, hi, k, source, is_hit))
+
+    def score_range(self, min_score=None, max_score=None, source=None, is_hit=None, limit=None):
+        """Faixas com min_score <= score <= max_score, em ordem decrescente"""
+        lo, hi = self._bounds(min_score, max_score)
+        return self.rows(self._select(lo, hi, limit, source, is_hit))
+
+    def iter_scored(self, source=None, is_hit=None):
+        """(score, linha) em ordem decrescente, preenchendo sob demanda"""
+        for start in range(0, len(self), 256):
+            positions = self._select(start, min(len(self), start + 256), None, source, is_hit)
+            for row in self.rows(positions):
+                yield row['hit_score'], row
+
+
+def top_k_across(genres, k=10, index_dir=INDEX_DIR, **filters):
+    """Top-k entre vários gêneros: merge (heap) dos índices já ordenados"""
+    streams = []
+    for genre in genres:
+        index = CatalogScoreIndex(genre, index_dir)
+        streams.append(((-score, index.genre, row) for score, row in index.iter_scored(**filters)))
+    merged = heapq.merge(*streams, key=lambda item: (item[0], item[1]))
+    return [dict(row, genre=genre) for _, genre, row in islice(merged, k)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = commands.add_parser('build', help='pontua o catálogo (incremental)')
+    build_parser.add_argument('--genre', action='append', help='gênero (repetível; padrão: todos)')
+    build_parser.add_argument('--workers', type=int, default=None, help='processos em paralelo')
+    build_parser.add_argument('--force', action='store_true', help='ignora os scores anteriores')
+
+    top_parser = commands.add_parser('top', help='consulta o top-k de um gênero')
+    top_parser.add_argument('genre')
+    top_parser.add_argument('-k', type=int, default=10)
+    top_parser.add_argument('--source', help='dataset de origem (ex: mpb)')
+    top_parser.add_argument('--hits-only', action='store_true')
+    top_parser.add_argument('--min-score', type=float, default=None)
+
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        print("=" * 80)
+        print("ÍNDICE DE SCORES DO CATÁLOGO")
+        print("=" * 80)
+        for result in build(args.genre or GENRES, args.workers, args.force):
+            print(f"  [OK] {result['genre']:<18} {result['rows']:>6} faixas | "
+                  f"{result['scored']:>6} pontuadas | {result['reused']:>6} reaproveitadas | {result['seconds']}s")
+        return
+
+    index = CatalogScoreIndex(args.genre)
+    if index.stale:
+        print("  [AVISO] Modelo mudou desde o build; rode 'build' para atualizar")
+    rows = index.top_k(args.k, source=args.source, is_hit=1 if args.hits_only else None, min_score=args.min_score)
+    for i, row in enumerate(rows, 1):
+        print(f"{i:<4} {row['hit_score']:<6.0f} {row['track_name'][:48]:<50} {row['artist'][:28]:<30} [{row['source']}]")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,446 @@
+"""
+Histórico das paradas semanais por cidade (ml/datasets/kaggle/regional)
+
+São ~2.000 CSVs pequenos (um por cidade e semana: rank, uri, track_name, peak,
+prev, streak, artist_names). A ingestão compacta tudo numa tabela colunar em
+ml/datasets/chart_history/, com dicionários de faixas, artistas e cidades:
+
+    segments/NNNNN/   colunas .npy (uri, semana, cidade, rank, peak, prev, streak),
+                      ordenadas por (uri, semana, cidade): as linhas de uma faixa
+                      são uma fatia achada por busca binária
+    dictionaries.json uris (+ nome e artistas de cada faixa), artistas, cidades
+    manifest.json     arquivos já ingeridos (tamanho + mtime) e segmentos
+
+Ingestão incremental: só os CSVs novos (ou alterados) viram um novo segmento;
+os segmentos existentes não são reescritos. compact() junta os segmentos
+quando eles se acumulam. O índice por artista sai do dicionário (artista ->
+faixas) e cai no índice por uri.
+
+Uso:
+    python ml/chart_history.py ingest [--compact]
+    python ml/chart_history.py track spotify:track:...    # trajetória
+    python ml/chart_history.py artist "Ana Castela"
+    python ml/chart_history.py top-peaks [-n 20]
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import sys
+import time
+from datetime import date, datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+REGIONAL_DIR = Path(__file__).parent / 'datasets' / 'kaggle' / 'regional'
+HISTORY_DIR = Path(__file__).parent / 'datasets' / 'chart_history'
+
+HISTORY_FORMAT = 1
+
+# Colunas de cada segmento (semana em dias desde 1970-01-01; prev 0 = estreia)
+SEGMENT_COLUMNS = {
+    'uri': np.int32, 'week': np.int32, 'city': np.int16,
+    'rank': np.int16, 'peak': np.int16, 'prev': np.int16, 'streak': np.int16,
+}
+
+# Os nomes das pastas perderam os acentos (U+FFFD) na exportação do Kaggle
+CITY_NAMES = {
+    'Bel�m': 'Belém',
+    'Bras�lia': 'Brasília',
+    'Cuiab�': 'Cuiabá',
+    'Florian�polis': 'Florianópolis',
+    'Goi�nia': 'Goiânia',
+    'S�o Paulo': 'São Paulo',
+    'Uberl�ndia': 'Uberlândia',
+}
+
+# "Apr 1 - 7, 2022", "Apr 28 - May 4, 2023", "Dec 30 - Jan 5, 2022" (o ano é o do início)
+_WEEK_PATTERN = re.compile(r'^([A-Z][a-z]{2}) (\d{1,2}) - (?:[A-Z][a-z]{2} )?\d{1,2}, (\d{4})$')
+
+_EPOCH = date(1970, 1, 1)
+
+
+def city_name(folder_name):
+    return CITY_NAMES.get(folder_name, folder_name)
+
+
+def week_start(file_stem):
+    """Data de início da semana a partir do nome do arquivo"""
+    match = _WEEK_PATTERN.match(file_stem)
+    if not match:
+        raise ValueError(f'Nome de semana não reconhecido: {file_stem}')
+    month, day, year = match.groups()
+    return datetime.strptime(f'{month} {day} {year}', '%b %d %Y').date()
+
+
+def split_artists(artist_names):
+    return [a.strip() for a in str(artist_names).split(',') if a.strip()]
+
+
+class _Dictionaries:
+    """Códigos estáveis de uri/artista/cidade (novos valores vão para o fim)"""
+
+    def __init__(self, data=None):
+        data = data or {}
+        self.uris = data.get('uris', [])
+        self.track_names = data.get('track_names', [])
+        self.track_artists = data.get('track_artists', [])
+        self.artists = data.get('artists', [])
+        self.cities = data.get('cities', [])
+        self._uri_codes = {u: i for i, u in enumerate(self.uris)}
+        self._artist_codes = {a: i for i, a in enumerate(self.artists)}
+        self._city_codes = {c: i for i, c in enumerate(self.cities)}
+        self._artist_tracks = None
+
+    def to_json(self):
+        return {'uris': self.uris, 'track_names': self.track_names, 'track_artists': self.track_artists,
+                'artists': self.artists, 'cities': self.cities}
+
+    def city_code(self, city):
+        if city not in self._city_codes:
+            self._city_codes[city] = len(self.cities)
+            self.cities.append(city)
+        return self._city_codes[city]
+
+    def artist_code(self, artist):
+        if artist not in self._artist_codes:
+            self._artist_codes[artist] = len(self.artists)
+            self.artists.append(artist)
+            self._artist_tracks = None
+        return self._artist_codes[artist]
+
+    def uri_code(self, uri, track_name, artist_names):
+        code = self._uri_codes.get(uri)
+        if code is None:
+            code = self._uri_codes[uri] = len(self.uris)
+            self.uris.append(uri)
+            self.track_names.append(track_name)
+            self.track_artists.append([self.artist_code(a) for a in split_artists(artist_names)])
+            self._artist_tracks = None
+        return code
+
+    def find_uri(self, uri):
+        return self._uri_codes.get(uri)
+
+    def find_artist(self, artist):
+        return self._artist_codes.get(artist)
+
+    def tracks_of_artist(self, artist_code):
+        """Índice artista -> códigos de uri (montado sob demanda a partir das faixas)"""
+        if self._artist_tracks is None:
+            index = [[] for _ in self.artists]
+            for uri_code, artist_codes in enumerate(self.track_artists):
+                for a in artist_codes:
+                    index[a].append(uri_code)
+            self._artist_tracks = index
+        return self._artist_tracks[artist_code]
+
+
+def _file_signature(path):
+    stat = path.stat()
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _write_json(path, data):
+    tmp = path.with_suffix('.tmp')
+    tmp.write_text(json.dumps(data, ensure_ascii=False), encoding='utf-8')
+    os.replace(tmp, path)
+
+
+class ChartHistory:
+    """
+    Tabela de histórico das paradas (segmentos .npy em mmap).
+
+    Uso:
+        history = ChartHistory()
+        history.ingest()                         # incremental
+        history.trajectory('spotify:track:...')  # semanas x cidades
+        history.best_peaks()                     # melhor posição por faixa
+        history.weeks_on_chart_by_artist()
+    """
+
+    def __init__(self, history_dir=HISTORY_DIR, regional_dir=REGIONAL_DIR):
+        self.history_dir = Path(history_dir)
+        self.regional_dir = Path(regional_dir)
+        self._load()
+
+    def _load(self):
+        manifest_path = self.history_dir / 'manifest.json'
+        manifest = {}
+        if manifest_path.exists():
+            manifest = json.loads(manifest_path.read_text(encoding='utf-8'))
+            if manifest.get('format') != HISTORY_FORMAT:
+                print("  [AVISO] Formato do histórico mudou, reingerindo tudo")
+                shutil.rmtree(self.history_dir, ignore_errors=True)
+                manifest = {}
+        self.manifest = {'format': HISTORY_FORMAT, 'files': manifest.get('files', {}),
+                         'segments': manifest.get('segments', []), 'next_segment': manifest.get('next_segment', 1)}
+
+        dictionaries_path = self.history_dir / 'dictionaries.json'
+        data = json.loads(dictionaries_path.read_text(encoding='utf-8')) if dictionaries_path.exists() else None
+        self.dictionaries = _Dictionaries(data)
+        self._segments = [self._open_segment(name) for name in self.manifest['segments']]
+
+    def _open_segment(self, name):
+        folder = self.history_dir / 'segments' / name
+        return {c: np.load(folder / f'{c}.npy', mmap_mode='r') for c in SEGMENT_COLUMNS}
+
+    def _save_manifest(self):
+        self.history_dir.mkdir(parents=True, exist_ok=True)
+        _write_json(self.history_dir / 'dictionaries.json', self.dictionaries.to_json())
+        _write_json(self.history_dir / 'manifest.json', self.manifest)
+
+    def _write_segment(self, columns):
+        """Grava um segmento ordenado por (uri, semana, cidade); devolve o nome"""
+        order = np.lexsort((columns['city'], columns['week'], columns['uri']))
+        name = f"{self.manifest['next_segment']:05d}"
+        self.manifest['next_segment'] += 1
+        folder = self.history_dir / 'segments' / name
+        building = folder.with_name(name + '.building')
+        shutil.rmtree(building, ignore_errors=True)
+        building.mkdir(parents=True)
+        for column, dtype in SEGMENT_COLUMNS.items():
+            np.save(building / f'{column}.npy', np.asarray(columns[column], dtype=dtype)[order])
+        os.replace(building, folder)
+        return name
+
+    # -----------------------------------------------------------------
+    # Ingestão
+    # -----------------------------------------------------------------
+
+    def pending_files(self):
+        """CSVs novos ou alterados desde a última ingestão"""
+        pending = []
+        for path in sorted(self.regional_dir.glob('*/*.csv')):
+            key = path.relative_to(self.regional_dir).as_posix()
+            if self.manifest['files'].get(key) != _file_signature(path):
+                pending.append(path)
+        return pending
+
+    def ingest(self):
+        """Acrescenta os CSVs pendentes como um novo segmento; devolve estatísticas"""
+        pending = self.pending_files()
+        changed = [p for p in pending if p.relative_to(self.regional_dir).as_posix() in self.manifest['files']]
+        if changed:
+            # Arquivo já ingerido mudou: as linhas antigas estão em segmentos imutáveis
+            print(f"  [AVISO] {len(changed)} arquivo(s) alterado(s) desde a ingestão, refazendo o histórico")
+            self.rebuild()
+            return {'files': len(self.manifest['files']), 'rows': self.rows, 'rebuilt': True}
+
+        parts = {c: [] for c in SEGMENT_COLUMNS}
+        skipped = []
+        for path in pending:
+            try:
+                week = (week_start(path.stem) - _EPOCH).days
+                df = pd.read_csv(path, dtype={'prev': str})
+            except (ValueError, pd.errors.ParserError) as e:
+                skipped.append((path, str(e)))
+                continue
+            city = self.dictionaries.city_code(city_name(path.parent.name))
+            if len(df):
+                parts['uri'].append(np.fromiter(
+                    (self.dictionaries.uri_code(u, t, a) for u, t, a in
+                     zip(df['uri'], df['track_name'].fillna(''), df['artist_names'].fillna(''))),
+                    dtype=np.int32, count=len(df)))
+                parts['week'].append(np.full(len(df), week, dtype=np.int32))
+                parts['city'].append(np.full(len(df), city, dtype=np.int16))
+                parts['rank'].append(df['rank'].to_numpy(dtype=np.int16))
+                parts['peak'].append(df['peak'].to_numpy(dtype=np.int16))
+                parts['prev'].append(pd.to_numeric(df['prev'], errors='coerce').fillna(0).to_numpy(dtype=np.int16))
+                parts['streak'].append(df['streak'].to_numpy(dtype=np.int16))
+            self.manifest['files'][path.relative_to(self.regional_dir).as_posix()] = _file_signature(path)
+
+        for path, error in skipped:
+            print(f"  [AVISO] Ignorado {path.name}: {error}")
+
+        rows = 0
+        if parts['uri']:
+            columns = {c: np.concatenate(v) for c, v in parts.items()}
+            rows = len(columns['uri'])
+            name = self._write_segment(columns)
+            self.manifest['segments'].append(name)
+            self._segments.append(self._open_segment(name))
+        if pending:
+            self._save_manifest()
+        return {'files': len(pending) - len(skipped), 'rows': rows, 'rebuilt': False}
+
+    def compact(self):
+        """Junta todos os segmentos num só (mantém a ordem por uri/semana/cidade)"""
+        if len(self._segments) <= 1:
+            return
+        columns = {c: np.concatenate([np.asarray(s[c]) for s in self._segments]) for c in SEGMENT_COLUMNS}
+        old = list(self.manifest['segments'])
+        name = self._write_segment(columns)
+        self.manifest['segments'] = [name]
+        self._save_manifest()
+        self._segments = [self._open_segment(name)]
+        for segment in old:
+            shutil.rmtree(self.history_dir / 'segments' / segment, ignore_errors=True)
+
+    def rebuild(self):
+        """Apaga o histórico e ingere tudo de novo"""
+        shutil.rmtree(self.history_dir, ignore_errors=True)
+        self._load()
+        self.ingest()
+
+    # -----------------------------------------------------------------
+    # Consultas
+    # -----------------------------------------------------------------
+
+    @property
+    def rows(self):
+        return sum(len(s['uri']) for s in self._segments)
+
+    def _rows_for_uris(self, uri_codes):
+        """Linhas das faixas pedidas (busca binária em cada segmento)"""
+        uri_codes = np.unique(np.asarray(uri_codes, dtype=np.int32))
+        parts = {c: [] for c in SEGMENT_COLUMNS}
+        for segment in self._segments:
+            uris = segment['uri']
+            starts = np.searchsorted(uris, uri_codes, side='left')
+            ends = np.searchsorted(uris, uri_codes, side='right')
+            for start, end in zip(starts, ends):
+                if end > start:
+                    for c in SEGMENT_COLUMNS:
+                        parts[c].append(np.asarray(segment[c][start:end]))
+        if not parts['uri']:
+            return {c: np.empty(0, dtype=t) for c, t in SEGMENT_COLUMNS.items()}
+        return {c: np.concatenate(v) for c, v in parts.items()}
+
+    def scan(self, columns):
+        """Colunas pedidas de todas as linhas (códigos de uri/cidade, semana em dias)"""
+        return {c: np.concatenate([np.asarray(s[c]) for s in self._segments])
+                if self._segments else np.empty(0, dtype=SEGMENT_COLUMNS[c]) for c in columns}
+
+    def _frame(self, rows):
+        df = pd.DataFrame({
+            'uri': np.array(self.dictionaries.uris, dtype=object)[rows['uri']],
+            'week': pd.to_datetime(rows['week'], unit='D'),
+            'city': pd.Categorical.from_codes(rows['city'], categories=self.dictionaries.cities),
+            'rank': rows['rank'], 'peak': rows['peak'], 'prev': rows['prev'], 'streak': rows['streak'],
+        })
+        return df.sort_values(['uri', 'week', 'city']).reset_index(drop=True)
+
+    def track_info(self, uri):
+        code = self.dictionaries.find_uri(uri)
+        if code is None:
+            return None
+        return {
+            'uri': uri,
+            'track_name': self.dictionaries.track_names[code],
+            'artists': [self.dictionaries.artists[a] for a in self.dictionaries.track_artists[code]],
+        }
+
+    def trajectory(self, uri, city=None):
+        """Semanas x cidades de uma faixa (rank, peak, prev, streak), em ordem cronológica"""
+        code = self.dictionaries.find_uri(uri)
+        if code is None:
+            return self._frame({c: np.empty(0, dtype=t) for c, t in SEGMENT_COLUMNS.items()})
+        df = self._frame(self._rows_for_uris([code]))
+        return df if city is None else df[df['city'] == city].reset_index(drop=True)
+
+    def artist_history(self, artist):
+        """Todas as entradas das faixas de um artista"""
+        code = self.dictionaries.find_artist(artist)
+        if code is None:
+            return self._frame({c: np.empty(0, dtype=t) for c, t in SEGMENT_COLUMNS.items()})
+        df = self._frame(self._rows_for_uris(self.dictionaries.tracks_of_artist(code)))
+        df.insert(1, 'track_name', df['uri'].map(lambda u: self.track_info(u)['track_name']))
+        return df
+
+    def best_peaks(self, limit=None):
+        """Melhor posição de cada faixa em qualquer cidade, semanas e cidades em que apareceu"""
+        rows = self.scan(['uri', 'week', 'city', 'rank'])
+        df = pd.DataFrame(rows)
+        summary = df.groupby('uri').agg(best_rank=('rank', 'min'), weeks=('week', 'nunique'),
+                                        cities=('city', 'nunique'), first_week=('week', 'min'))
+        summary = summary.sort_values(['best_rank', 'weeks'], ascending=[True, False])
+        if limit:
+            summary = summary.head(limit)
+        return pd.DataFrame({
+            'uri': np.array(self.dictionaries.uris, dtype=object)[summary.index],
+            'track_name': np.array(self.dictionaries.track_names, dtype=object)[summary.index],
+            'best_rank': summary['best_rank'].to_numpy(),
+            'weeks': summary['weeks'].to_numpy(),
+            'cities': summary['cities'].to_numpy(),
+            'first_week': pd.to_datetime(summary['first_week'].to_numpy(), unit='D'),
+        })
+
+    def weeks_on_chart_by_artist(self, limit=None):
+        """Semanas distintas com ao menos uma faixa do artista em alguma cidade"""
+        rows = self.scan(['uri', 'week'])
+        pairs = pd.DataFrame(rows).drop_duplicates()
+        track_artists = self.dictionaries.track_artists
+        artist_codes = [track_artists[u] for u in pairs['uri']]
+        exploded = pd.DataFrame({
+            'artist': np.fromiter((a for codes in artist_codes for a in codes), dtype=np.int32),
+            'week': np.repeat(pairs['week'].to_numpy(), [len(c) for c in artist_codes]),
+        })
+        weeks = exploded.drop_duplicates().groupby('artist').size().sort_values(ascending=False)
+        if limit:
+            weeks = weeks.head(limit)
+        return pd.DataFrame({
+            'artist': np.array(self.dictionaries.artists, dtype=object)[weeks.index],
+            'weeks_on_chart': weeks.to_numpy(),
+        })
+
+    def stats(self):
+        return {
+            'files': len(self.manifest['files']),
+            'segments': len(self._segments),
+            'rows': self.rows,
+            'tracks': len(self.dictionaries.uris),
+            'artists': len(self.dictionaries.artists),
+            'cities': len(self.dictionaries.cities),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    ingest_parser = commands.add_parser('ingest', help='ingere os CSVs novos')
+    ingest_parser.add_argument('--compact', action='store_true', help='junta os segmentos ao final')
+    track_parser = commands.add_parser('track', help='trajetória de uma faixa')
+    track_parser.add_argument('uri')
+    track_parser.add_argument('--city')
+    artist_parser = commands.add_parser('artist', help='histórico de um artista')
+    artist_parser.add_argument('name')
+    peaks_parser = commands.add_parser('top-peaks', help='faixas com melhor posição')
+    peaks_parser.add_argument('-n', type=int, default=20)
+    weeks_parser = commands.add_parser('artist-weeks', help='semanas nas paradas por artista')
+    weeks_parser.add_argument('-n', type=int, default=20)
+    args = parser.parse_args()
+
+    history = ChartHistory()
+    pd.set_option('display.width', 160)
+
+    if args.command == 'ingest':
+        start = time.time()
+        result = history.ingest()
+        if args.compact:
+            history.compact()
+        print(f"  [OK] {result['files']} arquivo(s), {result['rows']} linha(s) novas em {time.time() - start:.1f}s")
+        print(f"  {history.stats()}")
+    elif args.command == 'track':
+        info = history.track_info(args.uri)
+        if info is None:
+            print(f"  Faixa não encontrada: {args.uri}")
+            return 1
+        print(f"  {info['track_name']} - {', '.join(info['artists'])}")
+        print(history.trajectory(args.uri, args.city).drop(columns='uri').to_string(index=False))
+    elif args.command == 'artist':
+        df = history.artist_history(args.name)
+        summary = df.groupby('track_name').agg(best_rank=('rank', 'min'), weeks=('week', 'nunique'),
+                                               cities=('city', 'nunique'))
+        print(summary.sort_values('best_rank').to_string())
+    elif args.command == 'top-peaks':
+        print(history.best_peaks(args.n).to_string(index=False))
+    elif args.command == 'artist-weeks':
+        print(history.weeks_on_chart_by_artist(args.n).to_string(index=False))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,186 @@
+"""
+Rótulos de hit derivados das paradas regionais (join vetorizado)
+
+Os rótulos is_hit vêm de listas manuais (verified_hits_list.py,
+collect_massive_hits.py) e de regras linha a linha. Aqui cada faixa de um
+dataset de features é cruzada com o histórico das paradas (chart_history.py):
+primeiro pela URI do Spotify (track_id/id), depois, para quem não casou, por
+uma chave normalizada título|artista principal (track_keys.py). Tudo com
+merge/groupby do pandas sobre as colunas inteiras do histórico, sem laços em
+Python.
+
+Colunas adicionadas:
+    chart_peak     melhor posição em qualquer cidade (NaN se nunca entrou)
+    chart_weeks    semanas distintas nas paradas
+    chart_cities   cidades distintas em que entrou
+    chart_match    'uri', 'key' ou '' (sem match)
+    chart_hit      1 se chart_peak <= max_peak e chart_weeks >= min_weeks
+
+Uso:
+    python ml/chart_labels.py [tabela ...] [--max-peak 50] [--min-weeks 4] [--benchmark 100000]
+
+As tabelas (padrão: consolidated_knn/*) são lidas do dataset_store e os
+rótulos gravados como labeled/<tabela> no store.
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+import pandas as pd
+
+from ml.chart_history import ChartHistory
+from ml.dataset_store import list_tables, load_table, write_table
+from ml.track_keys import spotify_uris, track_key
+
+DEFAULT_MAX_PEAK = 50
+DEFAULT_MIN_WEEKS = 4
+
+ID_COLUMNS = ('track_id', 'id', 'uri', 'spotify_id')
+ARTIST_COLUMNS = ('artists', 'artist_names', 'artist', 'artist_name')
+
+LABEL_COLUMNS = ['chart_peak', 'chart_weeks', 'chart_cities', 'chart_match', 'chart_hit']
+
+
+def _group_stats(group_codes, week, city, rank, n_groups):
+    """Pico, semanas e cidades distintas por grupo (códigos inteiros 0..n_groups-1)"""
+    rows = pd.DataFrame({'g': group_codes, 'week': week, 'city': city, 'rank': rank})
+    stats = pd.DataFrame(index=pd.RangeIndex(n_groups))
+    stats['chart_peak'] = rows.groupby('g')['rank'].min()
+    stats['chart_weeks'] = rows[['g', 'week']].drop_duplicates().groupby('g').size()
+    stats['chart_cities'] = rows[['g', 'city']].drop_duplicates().groupby('g').size()
+    return stats
+
+
+class ChartLabeler:
+    """
+    Estatísticas das paradas por URI e por chave título|artista, calculadas
+    uma vez a partir do histórico e reaproveitadas em cada label().
+    """
+
+    def __init__(self, history=None, max_peak=DEFAULT_MAX_PEAK, min_weeks=DEFAULT_MIN_WEEKS):
+        history = history or ChartHistory()
+        self.max_peak = max_peak
+        self.min_weeks = min_weeks
+
+        dictionaries = history.dictionaries
+        rows = history.scan(['uri', 'week', 'city', 'rank'])
+
+        self.by_uri = _group_stats(rows['uri'], rows['week'], rows['city'], rows['rank'], len(dictionaries.uris))
+        self.by_uri.index = pd.Index(dictionaries.uris, name='uri')
+
+        # Várias URIs (single, álbum, remaster) podem ser a mesma música: agrega pela chave
+        primary_artist = pd.Series([dictionaries.artists[a[0]] if a else '' for a in dictionaries.track_artists],
+                                   dtype='string')
+        keys = track_key(pd.Series(dictionaries.track_names, dtype='string'), primary_artist)
+        key_codes, unique_keys = pd.factorize(keys)
+        self.by_key = _group_stats(key_codes[rows['uri']], rows['week'], rows['city'], rows['rank'],
+                                   len(unique_keys))
+        self.by_key.index = pd.Index(unique_keys, name='key')
+        self.by_key = self.by_key.drop(index='', errors='ignore')
+
+    def label(self, df):
+        """Copia df com as colunas de rótulo das paradas"""
+        out = df.reset_index(drop=True).copy()
+        n = len(out)
+        stats = pd.DataFrame({'chart_peak': np.full(n, np.nan), 'chart_weeks': np.zeros(n),
+                              'chart_cities': np.zeros(n)})
+        match = np.full(n, '', dtype=object)
+
+        id_column = next((c for c in ID_COLUMNS if c in out.columns), None)
+        if id_column is not None:
+            joined = self.by_uri.reindex(spotify_uris(out[id_column]).to_numpy())
+            found = joined['chart_peak'].notna().to_numpy()
+            stats.loc[found] = joined.to_numpy()[found]
+            match[found] = 'uri'
+
+        artist_column = next((c for c in ARTIST_COLUMNS if c in out.columns), None)
+        title_column = 'track_name' if 'track_name' in out.columns else ('name' if 'name' in out.columns else None)
+        pending = match == ''
+        if title_column and artist_column and pending.any():
+            keys = track_key(out.loc[pending, title_column], out.loc[pending, artist_column])
+            joined = self.by_key.reindex(keys.to_numpy())
+            found = joined['chart_peak'].notna().to_numpy()
+            positions = np.flatnonzero(pending)[found]
+            stats.loc[positions] = joined.to_numpy()[found]
+            match[positions] = 'key'
+
+        out['chart_peak'] = stats['chart_peak'].to_numpy(dtype=np.float32)
+        out['chart_weeks'] = stats['chart_weeks'].to_numpy(dtype=np.int32)
+        out['chart_cities'] = stats['chart_cities'].to_numpy(dtype=np.int32)
+        out['chart_match'] = match
+        out['chart_hit'] = ((out['chart_peak'] <= self.max_peak) & (out['chart_weeks'] >= self.min_weeks)).astype(np.int8)
+        return out
+
+
+def relabel(tables, labeler):
+    """Rotula as tabelas do store e grava como labeled/<tabela>"""
+    results = []
+    for name in tables:
+        start = time.perf_counter()
+        labeled = labeler.label(load_table(name))
+        write_table(f'labeled/{name}', labeled)
+        counts = labeled['chart_match'].value_counts()
+        results.append({
+            'table': name, 'rows': len(labeled),
+            'uri': int(counts.get('uri', 0)), 'key': int(counts.get('key', 0)),
+            'chart_hits': int(labeled['chart_hit'].sum()),
+            'is_hit': int((labeled['is_hit'] == 1).sum()) if 'is_hit' in labeled.columns else None,
+            'seconds': time.perf_counter() - start,
+        })
+    return results
+
+
+def benchmark(labeler, n_rows):
+    """Rotula n_rows faixas (catálogo consolidado repetido) e mede o tempo"""
+    catalog = pd.concat([load_table(n) for n in list_tables() if n.startswith('consolidated_knn/')],
+                        ignore_index=True)
+    sample = catalog.sample(n=n_rows, replace=True, random_state=0).reset_index(drop=True)
+    start = time.perf_counter()
+    labeled = labeler.label(sample)
+    elapsed = time.perf_counter() - start
+    print(f"  {n_rows} faixas rotuladas em {elapsed:.2f}s "
+          f"({(labeled['chart_match'] != '').mean():.1%} com match nas paradas)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('tables', nargs='*', help='tabelas do dataset_store (padrão: consolidated_knn/*)')
+    parser.add_argument('--max-peak', type=int, default=DEFAULT_MAX_PEAK, help='pior posição que ainda conta como hit')
+    parser.add_argument('--min-weeks', type=int, default=DEFAULT_MIN_WEEKS, help='semanas mínimas nas paradas')
+    parser.add_argument('--benchmark', type=int, default=0, metavar='N', help='só mede o tempo com N faixas')
+    args = parser.parse_args()
+
+    print("=" * 80)
+    print("RÓTULOS A PARTIR DAS PARADAS REGIONAIS")
+    print("=" * 80)
+
+    history = ChartHistory()
+    ingested = history.ingest()
+    if ingested['files']:
+        print(f"  Histórico atualizado: {ingested['files']} arquivo(s) novo(s)")
+
+    start = time.perf_counter()
+    labeler = ChartLabeler(history, args.max_peak, args.min_weeks)
+    print(f"  Estatísticas: {len(labeler.by_uri)} URIs, {len(labeler.by_key)} chaves "
+          f"({time.perf_counter() - start:.2f}s)")
+
+    if args.benchmark:
+        benchmark(labeler, args.benchmark)
+        return
+
+    tables = args.tables or [n for n in list_tables() if n.startswith('consolidated_knn/')]
+    print(f"\n  {'Tabela':<45} {'Linhas':>7} {'URI':>6} {'Chave':>6} {'Hits':>6} {'is_hit':>7} {'Tempo':>7}")
+    for r in relabel(tables, labeler):
+        is_hit = '-' if r['is_hit'] is None else r['is_hit']
+        print(f"  {r['table']:<45} {r['rows']:>7} {r['uri']:>6} {r['key']:>6} "
+              f"{r['chart_hits']:>6} {is_hit:>7} {r['seconds']:>6.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,311 @@
+"""
+Modelos compactos: variante menor e mais rápida de cada floresta treinada
+
+As RandomForest de 150-200 árvores têm ~3 MB cada e levam ~10 ms por
+predição de uma música; o backend carrega uma por gênero/subcategoria.
+Depois do treino, procura-se um modelo menor que caiba no orçamento:
+
+    COMPACT_MAX_KB      tamanho do pickle (padrão 256)
+    COMPACT_MAX_MS      predict_proba de uma linha (padrão 2.0)
+    COMPACT_MAX_DELTA   perda de accuracy tolerada na validação (padrão 0.02)
+
+Candidatos (o menor que cumpre tudo ganha):
+- as primeiras k árvores da própria floresta (sem retreino);
+- florestas rasas retreinadas (poucas árvores, profundidade limitada);
+- destilação: regressão logística e gradient boosting pequeno treinados no
+  treino + cópias com ruído rotuladas pela floresta original.
+Todo candidato também precisa prever uma linha com features faltando (NaN),
+que o treino nunca vê (prepare() preenche com a média) mas a predição pode.
+
+A escolha usa uma validação separada do treino do modelo original (hashes do
+_rows.npz): candidatos e uma floresta de referência (mesmos parâmetros do
+original) são treinados no restante e comparados nela. O vencedor é então
+reajustado no treino inteiro e medido uma única vez no split de teste do
+original, que não participa da escolha; essas são as métricas gravadas. O
+compacto vai para ml/models/compact/<mesmo nome>.pkl (fora do
+glob do HitPredictor) com metadata próprio; o metadata do original ganha a
+linha 'compact:' com as métricas dos dois. O HitPredictor só usa o compacto
+com HIT_PREDICTOR_COMPACT=1 (ou HitPredictor(genre, compact=True)).
+
+Uso:
+    python ml/compact_models.py [genres subcategories enhanced] [--only mpb ...]
+    python ml/training.py genres --compact
+"""
+import argparse
+import copy
+import io
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from ml.training import (JOB_SETS, MODELS_DIR, RANDOM_STATE, _atomic_dump, _atomic_text, holdout_scores,
+                         prepare, read_metadata)
+
+COMPACT_DIR_NAME = 'compact'
+
+FOREST_SUBSETS = (10, 25, 50)
+SHALLOW_FORESTS = ((25, 6), (50, 8))   # (árvores, profundidade)
+AUGMENT_FACTOR = 5                     # cópias com ruído por linha de treino na destilação
+AUGMENT_NOISE = 0.1                    # desvio do ruído, em desvios-padrão da coluna
+VALIDATION_SIZE = 0.2                  # fração do treino separada para escolher o candidato
+
+
+def _env_float(name, default):
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return float(default)
+
+
+def budget():
+    return {'max_kb': _env_float('COMPACT_MAX_KB', '256'),
+            'max_ms': _env_float('COMPACT_MAX_MS', '2.0'),
+            'max_delta': _env_float('COMPACT_MAX_DELTA', '0.02')}
+
+
+def model_size_kb(model):
+    import joblib
+    buffer = io.BytesIO()
+    joblib.dump(model, buffer)
+    return buffer.tell() / 1024
+
+
+def latency_ms(model, X, repeats=30):
+    """Mediana de predict_proba para uma linha (como no HitPredictor)"""
+    row = X[:1]
+    model.predict_proba(row)
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        model.predict_proba(row)
+        times.append(time.perf_counter() - start)
+    return float(np.median(times) * 1000)
+
+
+def _distillation_set(teacher, X_train, y_train):
+    """Treino + cópias com ruído rotuladas pelo modelo original"""
+    rng = np.random.default_rng(RANDOM_STATE)
+    picks = rng.integers(0, len(X_train), len(X_train) * AUGMENT_FACTOR)
+    noise = rng.normal(0, 1, (len(picks), X_train.shape[1])) * (X_train.std(axis=0) * AUGMENT_NOISE)
+    X_aug = X_train[picks] + noise
+    return np.vstack([X_train, X_aug]), np.concatenate([y_train, teacher.predict(X_aug)])
+
+
+def candidates(teacher, X_train, y_train, only=None):
+    """
+    (método, modelo ajustado) do mais barato para o mais caro de cada família;
+    com only, só os métodos listados são ajustados
+    """
+    from sklearn.ensemble import HistGradientBoostingClassifier, RandomForestClassifier
+    from sklearn.impute import SimpleImputer
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import make_pipeline
+    from sklearn.preprocessing import StandardScaler
+
+    def wanted(method):
+        return only is None or method in only
+
+    if wanted('distill_logistic') or wanted('distill_boosting'):
+        X_distill, y_distill = _distillation_set(teacher, X_train, y_train)
+    if wanted('distill_logistic'):
+        # Na predição podem chegar NaN (prepare() só preenche no treino); árvores e HGB aceitam, a logística não
+        logistic = make_pipeline(SimpleImputer(strategy='mean'), StandardScaler(), LogisticRegression(max_iter=1000))
+        yield 'distill_logistic', logistic.fit(X_distill, y_distill)
+    if wanted('distill_boosting'):
+        boosting = HistGradientBoostingClassifier(max_iter=50, max_depth=3, random_state=RANDOM_STATE)
+        yield 'distill_boosting', boosting.fit(X_distill, y_distill)
+
+    for k in FOREST_SUBSETS:
+        if k < len(teacher.estimators_) and wanted(f'forest_first_{k}'):
+            subset = copy.copy(teacher)
+            subset.estimators_ = teacher.estimators_[:k]
+            subset.n_estimators = k
+            subset.n_jobs = 1
+            yield f'forest_first_{k}', subset
+
+    for trees, depth in SHALLOW_FORESTS:
+        if wanted(f'forest_{trees}x{depth}'):
+            forest = RandomForestClassifier(n_estimators=trees, max_depth=depth, min_samples_leaf=3,
+                                            random_state=RANDOM_STATE, n_jobs=1)
+            yield f'forest_{trees}x{depth}', forest.fit(X_train, y_train)
+
+
+def serves_missing(model, X):
+    """O modelo prevê uma linha com features faltando (NaN), como o HitPredictor pode montar?"""
+    row = np.array(X[:1], dtype=np.float64)
+    row[:, ::2] = np.nan
+    try:
+        return bool(np.isfinite(model.predict_proba(row)).all())
+    except ValueError:
+        return False
+
+
+def _measure(model, X_test, y_test):
+    return {**{k: float(v) for k, v in holdout_scores(model, X_test, y_test).items()},
+            'size_kb': round(model_size_kb(model), 1),
+            'latency_ms': round(latency_ms(model, X_test), 3)}
+
+
+def validation_split(train_rows, y):
+    """Separa do treino a fatia de validação da escolha (estratificada quando dá)"""
+    from sklearn.model_selection import train_test_split
+
+    train_rows = np.asarray(train_rows)
+    labels = y[train_rows]
+    stratify = labels if np.bincount(labels, minlength=2).min() >= 2 else None
+    fit_rows, val_rows = train_test_split(train_rows, test_size=VALIDATION_SIZE,
+                                          random_state=RANDOM_STATE, stratify=stratify)
+    return fit_rows, val_rows
+
+
+def compact_model(model_path, data, train_rows, test_rows, limits=None):
+    """
+    Procura o menor modelo que cumpre o orçamento e grava em compact/.
+    A escolha é feita numa validação tirada de train_rows; test_rows só mede
+    o vencedor (e o original) no fim.
+    Devolve {'original', 'compact', 'method', 'path', 'validation', 'tried'}
+    (compact/path None se nenhum cumpre).
+    """
+    import joblib
+    from sklearn.base import clone
+
+    limits = limits or budget()
+    model_path = Path(model_path)
+    teacher = joblib.load(model_path)
+    fit_rows, val_rows = validation_split(train_rows, data.y)
+    X_fit, y_fit = data.X[fit_rows], data.y[fit_rows]
+    X_val, y_val = data.X[val_rows], data.y[val_rows]
+
+    # Referência da validação: o original viu essas linhas, então compara-se com a
+    # mesma floresta treinada só no restante (como os candidatos)
+    reference = clone(teacher).fit(X_fit, y_fit)
+    reference_val = _measure(reference, X_val, y_val)
+    ranked, tried = [], []
+    for method, model in candidates(reference, X_fit, y_fit):
+        metrics = _measure(model, X_val, y_val)
+        fits = (metrics['size_kb'] <= limits['max_kb'] and metrics['latency_ms'] <= limits['max_ms']
+                and metrics['accuracy'] >= reference_val['accuracy'] - limits['max_delta']
+                and serves_missing(model, X_val))
+        tried.append((method, metrics, fits))
+        if fits:
+            ranked.append((metrics['size_kb'], method, metrics))
+
+    # O escolhido é reajustado no treino inteiro (a partir do original) e medido no teste
+    X_train, y_train = data.X[train_rows], data.y[train_rows]
+    X_test, y_test = data.X[test_rows], data.y[test_rows]
+    original = _measure(teacher, X_test, y_test)
+    best = None
+    for _, method, val_metrics in sorted(ranked, key=lambda r: r[0]):
+        _, model = next(candidates(teacher, X_train, y_train, only={method}))
+        metrics = _measure(model, X_test, y_test)
+        # Tamanho e latência não dependem do split: o reajuste ainda precisa caber
+        if metrics['size_kb'] <= limits['max_kb'] and metrics['latency_ms'] <= limits['max_ms']:
+            best = (method, model, metrics, val_metrics)
+            break
+
+    result = {'original': original, 'compact': None, 'method': None, 'path': None, 'tried': tried,
+              'validation': {'original': reference_val, 'compact': best[3] if best else None}}
+    if best is None:
+        return result
+
+    method, model, metrics, val_metrics = best
+    compact_path = model_path.parent / COMPACT_DIR_NAME / model_path.name
+    _atomic_dump(model, compact_path)
+
+    summary = {'method': method, 'original': original, 'compact': metrics,
+               'validation': {'original': reference_val['accuracy'], 'compact': val_metrics['accuracy'],
+                              'rows': len(val_rows)},
+               'budget': limits}
+    metadata_path = model_path.with_name(f'{model_path.stem}_metadata.txt')
+    metadata = read_metadata(metadata_path) if metadata_path.exists() else {}
+    compact_metadata = {k: v for k, v in metadata.items() if k not in ('params', 'cv_mean', 'cv_std', 'compact')}
+    compact_metadata.update({'model_type': type(model).__name__, 'compact_of': model_path.name,
+                             **{k: metrics[k] for k in ('accuracy', 'precision', 'recall', 'f1')},
+                             **summary})
+    _atomic_text(compact_path.with_name(f'{compact_path.stem}_metadata.txt'),
+                 ''.join(f'{key}: {value}\n' for key, value in compact_metadata.items()))
+    if metadata:
+        metadata['compact'] = summary
+        _atomic_text(metadata_path, ''.join(f'{key}: {value}\n' for key, value in metadata.items()))
+
+    result.update({'compact': metrics, 'method': method, 'path': compact_path})
+    return result
+
+
+def compact_saved(model_path, data, limits=None):
+    """Compacta um modelo gravado pelo ml/training.py, com o split do _rows.npz dele"""
+    model_path = Path(model_path)
+    with np.load(model_path.with_name(f'{model_path.stem}_rows.npz')) as rows:
+        in_train = np.isin(data.row_hashes, rows['train'])
+        in_test = np.isin(data.row_hashes, rows['test']) & ~in_train
+    if not in_test.any():
+        raise ValueError('split de teste do modelo não está mais no dataset')
+    return compact_model(model_path, data, np.flatnonzero(in_train), np.flatnonzero(in_test), limits)
+
+
+def compact_latest(job, models_dir=MODELS_DIR, limits=None):
+    """Compacta o último modelo do job (precisa do _rows.npz gravado pelo ml/training.py)"""
+    from ml.incremental import latest_model
+
+    previous = latest_model(job, models_dir)
+    if previous is None:
+        raise FileNotFoundError(f'nenhum modelo com _rows.npz para {job.model_prefix}')
+    return compact_saved(previous[0], prepare(job.dataset, job.features, job.test_size), limits)
+
+
+def print_compaction(label, result):
+    o = result['original']
+    if result['compact'] is None:
+        print(f"  [AVISO] {label}: nenhum candidato cumpre o orçamento "
+              f"(original {o['size_kb']:.0f} KB, {o['latency_ms']:.1f} ms, {o['accuracy']:.1%})")
+        return
+    c = result['compact']
+    print(f"  [OK] {label}: {result['method']} {c['size_kb']:.0f} KB / {c['latency_ms']:.2f} ms / "
+          f"{c['accuracy']:.1%} (original {o['size_kb']:.0f} KB / {o['latency_ms']:.1f} ms / {o['accuracy']:.1%})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('sets', nargs='*', help=f"conjuntos de jobs ({', '.join(JOB_SETS)}; padrão: todos)")
+    parser.add_argument('--only', nargs='+', default=None, metavar='GENERO', help='só estes gêneros/subcategorias')
+    parser.add_argument('--verbose', action='store_true', help='mostra todos os candidatos')
+    args = parser.parse_args()
+
+    unknown = [s for s in args.sets if s not in JOB_SETS]
+    if unknown:
+        parser.error(f"conjunto(s) desconhecido(s): {', '.join(unknown)}")
+    jobs = [job for s in (args.sets or list(JOB_SETS)) for job in JOB_SETS[s]()]
+    if args.only:
+        jobs = [job for job in jobs if job.name in args.only]
+
+    print("=" * 70)
+    print("MODELOS COMPACTOS")
+    print("=" * 70)
+    limits = budget()
+    print(f"  Orçamento: {limits['max_kb']:.0f} KB, {limits['max_ms']} ms, "
+          f"perda máxima de {limits['max_delta']:.1%}\n")
+
+    compacted = 0
+    for job in jobs:
+        try:
+            result = compact_latest(job, limits=limits)
+        except (FileNotFoundError, ValueError) as e:
+            print(f"  [AVISO] {job.label}: {e}")
+            continue
+        print_compaction(job.label, result)
+        if args.verbose:
+            for method, metrics, fits in result['tried']:
+                print(f"       {'*' if fits else ' '} {method:<20} {metrics['size_kb']:>8.0f} KB "
+                      f"{metrics['latency_ms']:>7.2f} ms {metrics['accuracy']:>7.1%}")
+        compacted += result['compact'] is not None
+    sys.exit(0 if compacted else 1)
+
+
+if __name__ == '__main__':
+    main()
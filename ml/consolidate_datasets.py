@@ -4,8 +4,12 @@ Varre todos os arquivos em ml/datasets/ e combina por gênero
 """
 import pandas as pd
 import os
+import sys
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from ml.track_keys import deduplicate, title_column
+
 def load_available_datasets():
     """Carrega todos os datasets disponíveis"""
     datasets_dir = Path(__file__).parent / 'datasets'
@@ -177,21 +181,10 @@ def merge_and_deduplicate(datasets_dict):
         before_dedup = len(df_combined)
         print(f"{genre.upper()}: {before_dedup} músicas (antes de deduplicação)")
         
-        # Identifica colunas de identificação
-        id_cols = []
-        if 'track_name' in df_combined.columns:
-            id_cols.append('track_name')
-        if 'artist' in df_combined.columns:
-            id_cols.append('artist')
-        elif 'artist_name' in df_combined.columns:
-            id_cols.append('artist_name')
-        elif 'artists' in df_combined.columns:
-            id_cols.append('artists')
-        
-        # Remove duplicatas
-        if id_cols:
-            df_combined = df_combined.drop_duplicates(subset=id_cols, keep='first')
-            removed = before_dedup - len(df_combined)
+        # Remove duplicatas pela chave normalizada título|artista principal:
+        # acentos, caixa, '(feat. ...)' e remaster não separam a mesma música (ao vivo/remix sim)
+        if title_column(df_combined) is not None:
+            df_combined, removed = deduplicate(df_combined)
             print(f"          -> Removidas {removed} duplicatas ({removed/before_dedup*100:.1f}%)")
         elif 'track_id' in df_combined.columns:
             df_combined = df_combined.drop_duplicates(subset=['track_id'], keep='first')
@@ -2,10 +2,14 @@
 Versão otimizada da consolidação de datasets
 Usa KNN Imputation para recuperar músicas com valores faltantes
 """
+import sys
 import pandas as pd
 import numpy as np
 from pathlib import Path
-from sklearn.impute import KNNImputer
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from ml.knn_imputation import impute_all
+from ml.track_keys import deduplicate, title_column
 
 def load_available_datasets():
     """Carrega todos os datasets disponíveis"""
@@ -164,77 +168,40 @@ def merge_and_deduplicate(datasets_dict):
         before_dedup = len(df_combined)
         print(f"{genre.upper()}: {before_dedup} musicas (antes de deduplicacao)")
         
-        # Identifica colunas de identificação
-        id_cols = []
-        if 'track_name' in df_combined.columns:
-            id_cols.append('track_name')
-        if 'artist' in df_combined.columns:
-            id_cols.append('artist')
-        elif 'artist_name' in df_combined.columns:
-            id_cols.append('artist_name')
-        elif 'artists' in df_combined.columns:
-            id_cols.append('artists')
-        
-        # Remove duplicatas
-        if id_cols:
-            df_combined = df_combined.drop_duplicates(subset=id_cols, keep='first')
-            removed = before_dedup - len(df_combined)
+        # Remove duplicatas pela chave normalizada título|artista principal:
+        # acentos, caixa, '(feat. ...)' e remaster não separam a mesma música (ao vivo/remix sim)
+        if title_column(df_combined) is not None:
+            df_combined, removed = deduplicate(df_combined)
             print(f"          + Removidas {removed} duplicatas ({removed/before_dedup*100:.1f}%)")
         
         consolidated[genre] = df_combined
     
     return consolidated
 
-def apply_knn_imputation(df, genre_name):
-    """Aplica KNN Imputation para preencher valores faltantes"""
-    print(f"\n  [KNN] Processando {genre_name}...")
-    
-    # Features críticas para ML
-    critical_features = ['bpm', 'energy', 'danceability', 'valence', 
-                        'acousticness', 'instrumentalness', 'liveness', 
-                        'speechiness', 'loudness']
-    
-    # Verifica quais features existem
-    available_features = [f for f in critical_features if f in df.columns]
-    
-    if not available_features:
-        print(f"        Nenhuma feature critica encontrada")
-        return df
+def apply_knn_imputation(consolidated, workers=None):
+    """
+    Aplica KNN Imputation para preencher valores faltantes (ml/knn_imputation.py):
+    índice de vizinhos sobre as linhas completas, consultado só pelas incompletas,
+    gêneros em paralelo e cache pelo hash das features de entrada
+    """
+    results = impute_all(consolidated, workers=workers)
     
-    before_imputation = len(df)
-    
-    # Remove linhas completamente vazias (todas features faltando)
-    df_clean = df.dropna(subset=available_features, how='all')
-    
-    # Conta valores faltantes antes
-    missing_before = df_clean[available_features].isnull().sum().sum()
-    print(f"        Valores faltantes: {missing_before}")
-    
-    if missing_before == 0:
-        print(f"        Nenhum valor para imputar OK")
-        return df_clean
+    consolidated_knn = {}
+    for genre, (df_imputed, stats) in results.items():
+        print(f"\n  [KNN] {genre}")
+        if not stats['features']:
+            print(f"        Nenhuma feature critica encontrada")
+        elif stats['missing'] == 0:
+            print(f"        Nenhum valor para imputar OK")
+        else:
+            origin = 'cache' if stats['cached'] else f"{stats['seconds']:.1f}s"
+            print(f"        Valores faltantes: {stats['missing']}")
+            print(f"        Valores preenchidos: {stats['filled']} ({origin})")
+        if stats['dropped']:
+            print(f"        Removidas {stats['dropped']} musicas sem nenhuma feature")
+        consolidated_knn[genre] = df_imputed
     
-    # Aplica KNN Imputation
-    try:
-        imputer = KNNImputer(n_neighbors=5, weights='distance')
-        
-        # Imputa apenas as features disponíveis
-        df_imputed = df_clean.copy()
-        df_imputed[available_features] = imputer.fit_transform(df_clean[available_features])
-        
-        # Conta valores faltantes depois
-        missing_after = df_imputed[available_features].isnull().sum().sum()
-        recovered = missing_before - missing_after
-        
-        print(f"        Valores preenchidos: {recovered}")
-        print(f"        Musicas recuperadas: {before_imputation - len(df_clean)} -> 0")
-        
-        return df_imputed
-        
-    except Exception as e:
-        print(f"        X Erro no KNN: {e}")
-        print(f"        Usando dataset sem imputacao")
-        return df_clean
+    return consolidated_knn
 
 def save_consolidated_datasets(consolidated_dict):
     """Salva datasets consolidados"""
@@ -258,7 +225,8 @@ def save_consolidated_datasets(consolidated_dict):
     report.append("# Relatorio de Consolidacao com KNN Imputation\n")
     report.append(f"Data: {pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
     report.append("## Metodo\n")
-    report.append("- KNN Imputation (k=5) para preencher valores faltantes")
+    report.append("- KNN Imputation (k=5, ponderado pela distancia) para preencher valores faltantes")
+    report.append("- Vizinhos buscados so entre as musicas completas (ml/knn_imputation.py)")
     report.append("- Features imputadas: bpm, energy, danceability, valence, etc.\n")
     report.append("## Resumo\n")
     report.append("| Genero | Musicas | Arquivo |")
@@ -302,10 +270,7 @@ def main():
     print("APLICANDO KNN IMPUTATION")
     print("="*70)
     
-    consolidated_knn = {}
-    for genre, df in consolidated.items():
-        df_imputed = apply_knn_imputation(df, genre)
-        consolidated_knn[genre] = df_imputed
+    consolidated_knn = apply_knn_imputation(consolidated)
     
     # Salva
     save_consolidated_datasets(consolidated_knn)
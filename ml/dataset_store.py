@@ -0,0 +1,486 @@
+"""
+Armazenamento colunar dos datasets de ml/datasets
+
+Os CSVs são relidos com pd.read_csv por vários scripts e pela API, com tipos
+inferidos a cada leitura. Este módulo guarda cada tabela uma vez em formato
+colunar tipado em ml/datasets/store/<tabela>/ e devolve DataFrames já com os
+tipos certos:
+  - features de áudio (e demais floats que cabem) em float32
+  - gênero/artista como category
+  - colunas 'Unnamed: N' (índice salvo por engano) descartadas
+
+Formato: Parquet via pyarrow quando instalado; sem pyarrow, uma .npy por
+coluna + schema.json (strings em dicionário: códigos int32 + bytes UTF-8 com
+offsets, tudo lido por mmap). Em ambos, load_table lê só as colunas pedidas e
+aplica os filtros antes de montar o DataFrame.
+
+O CSV continua sendo a origem: se ele mudou (tamanho/mtime) a tabela é
+reconvertida na próxima leitura.
+
+Uso:
+    from ml.dataset_store import load_table
+    hits = load_table('consolidated_knn/mpb_consolidated',
+                      columns=['track_name', 'energy'], filters=[('is_hit', '==', 1)])
+
+    python ml/dataset_store.py migrate [--force]     # converte todos os CSVs
+    python ml/dataset_store.py list
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+DATASETS_DIR = Path(__file__).parent / 'datasets'
+STORE_DIR = DATASETS_DIR / 'store'
+
+STORE_FORMAT = 2
+
+# Cada gravação vai para uma versão própria em <tabela>/<versão>/; CURRENT aponta a
+# versão publicada (trocado com os.replace). Versões substituídas há mais que isso
+# são apagadas (leituras em andamento ainda as usam por alguns milissegundos).
+CURRENT_FILE = 'CURRENT'
+STALE_VERSION_S = 60
+
+# Colunas de gênero/artista: poucos valores distintos, viram category
+CATEGORICAL_COLUMNS = {'genre', 'track_genre', 'sub_genre', 'genres', 'bpm_category', 'primary_theme',
+                       'artist', 'artists', 'artist_name', 'artist_names', 'source'}
+
+# Acima disso float32 perde precisão inteira (contagens, ids): mantém float64
+_FLOAT32_MAX_EXACT = 2 ** 24
+
+_FILTER_OPS = {'==', '!=', '<', '<=', '>', '>=', 'in', 'not in'}
+
+
+def _has_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _source_signature(csv_path):
+    stat = os.stat(csv_path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def table_name(csv_path):
+    """Nome da tabela: caminho relativo a ml/datasets, sem .csv"""
+    relative = Path(csv_path).resolve().relative_to(DATASETS_DIR.resolve())
+    return relative.with_suffix('').as_posix()
+
+
+def csv_path(name):
+    return DATASETS_DIR / f'{name}.csv'
+
+
+def list_tables():
+    """Tabelas disponíveis (todos os CSVs de ml/datasets)"""
+    return sorted(table_name(p) for p in DATASETS_DIR.rglob('*.csv') if STORE_DIR not in p.parents)
+
+
+# ---------------------------------------------------------------------------
+# Conversão de tipos
+# ---------------------------------------------------------------------------
+
+def read_csv(path):
+    """Lê o CSV de origem (UTF-8 com ou sem BOM; latin-1 nos arquivos antigos)"""
+    try:
+        return pd.read_csv(path, encoding='utf-8-sig', low_memory=False)
+    except UnicodeDecodeError:
+        return pd.read_csv(path, encoding='latin-1', low_memory=False)
+
+
+def normalize_types(df):
+    """Aplica os tipos do store a um DataFrame lido do CSV"""
+    df = df.loc[:, [c for c in df.columns if not str(c).startswith('Unnamed:')]]
+    columns = {}
+    for name in df.columns:
+        col = df[name]
+        inferred = pd.api.types.infer_dtype(col, skipna=True)
+        if pd.api.types.is_bool_dtype(col) or inferred == 'boolean':
+            columns[name] = col.astype('boolean')
+        elif pd.api.types.is_float_dtype(col):
+            finite = col.abs().max(skipna=True)
+            columns[name] = col.astype(np.float32) if not finite > _FLOAT32_MAX_EXACT else col.astype(np.float64)
+        elif pd.api.types.is_integer_dtype(col):
+            columns[name] = col.astype(np.int64)
+        elif name in CATEGORICAL_COLUMNS:
+            columns[name] = col.astype('string').astype('category')
+        else:
+            columns[name] = col.astype('string')
+    return pd.DataFrame(columns, index=pd.RangeIndex(len(df)))
+
+
+def _kind(col):
+    if isinstance(col.dtype, pd.CategoricalDtype):
+        return 'category'
+    if isinstance(col.dtype, pd.BooleanDtype):
+        return 'bool'
+    if pd.api.types.is_string_dtype(col):
+        return 'string'
+    return str(col.dtype)
+
+
+# ---------------------------------------------------------------------------
+# Backend .npy (sem pyarrow)
+# ---------------------------------------------------------------------------
+
+class StringColumn:
+    """
+    Coluna de strings em dicionário: códigos int32 (-1 = nulo) + valores
+    distintos em UTF-8 concatenados com offsets. Os três arrays vêm por mmap.
+    """
+
+    def __init__(self, codes, data, offsets):
+        self.codes = codes
+        self.data = data
+        self.offsets = offsets
+
+    @classmethod
+    def encode(cls, values):
+        """values: sequência de str/None -> StringColumn em memória"""
+        series = pd.Series(values, dtype='object')
+        codes, uniques = pd.factorize(series, use_na_sentinel=True)
+        encoded = [str(u).encode('utf-8') for u in uniques]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        data = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+        return cls(codes.astype(np.int32), data, offsets)
+
+    @classmethod
+    def load(cls, folder, name):
+        return cls(*(np.load(Path(folder) / f'{name}.{part}.npy', mmap_mode='r')
+                     for part in ('codes', 'data', 'offsets')))
+
+    def save(self, folder, name):
+        for part, array in (('codes', self.codes), ('data', self.data), ('offsets', self.offsets)):
+            np.save(Path(folder) / f'{name}.{part}.npy', array)
+
+    def __len__(self):
+        return len(self.codes)
+
+    @property
+    def categories(self):
+        blob = bytes(self.data)
+        offsets = np.asarray(self.offsets).tolist()
+        return [blob[start:end].decode('utf-8') for start, end in zip(offsets, offsets[1:])]
+
+    def value(self, code):
+        if code < 0:
+            return None
+        return bytes(self.data[self.offsets[code]:self.offsets[code + 1]]).decode('utf-8')
+
+    def __getitem__(self, i):
+        return self.value(int(self.codes[i]))
+
+    def codes_for(self, values):
+        """Códigos dos valores pedidos (os ausentes do dicionário são ignorados)"""
+        wanted = set(values)
+        return np.array([c for c, v in enumerate(self.categories) if v in wanted], dtype=np.int32)
+
+    def to_categorical(self, positions=None):
+        codes = np.asarray(self.codes if positions is None else self.codes[positions])
+        return pd.Categorical.from_codes(codes, categories=pd.Index(self.categories, dtype='string'))
+
+
+def _write_npy(folder, df, meta):
+    for name in df.columns:
+        col = df[name]
+        kind = meta['kinds'][name]
+        if kind in ('category', 'string'):
+            StringColumn.encode(col.astype('object').where(col.notna(), None)).save(folder, name)
+        elif kind == 'bool':
+            np.save(folder / f'{name}.npy', col.astype('float32').fillna(-1).to_numpy(dtype=np.int8))
+        else:
+            np.save(folder / f'{name}.npy', col.to_numpy())
+
+
+def _load_npy_column(folder, name, kind):
+    if kind in ('category', 'string'):
+        return StringColumn.load(folder, name)
+    return np.load(folder / f'{name}.npy', mmap_mode='r')
+
+
+def _npy_mask(column, kind, op, value):
+    """Máscara booleana de um filtro sobre uma coluna .npy (strings comparam códigos)"""
+    if kind in ('category', 'string'):
+        if op in ('==', '!='):
+            match = np.isin(column.codes, column.codes_for([value]))
+            return match if op == '==' else ~match
+        if op in ('in', 'not in'):
+            match = np.isin(column.codes, column.codes_for(value))
+            return match if op == 'in' else ~match
+        raise ValueError(f"Operador {op} não suportado em coluna de texto")
+
+    data = np.asarray(column)
+    if kind == 'bool':
+        data = np.where(data < 0, np.nan, data)
+    if op == 'in':
+        return np.isin(data, list(value))
+    if op == 'not in':
+        return ~np.isin(data, list(value))
+    return {
+        '==': np.equal, '!=': np.not_equal, '<': np.less,
+        '<=': np.less_equal, '>': np.greater, '>=': np.greater_equal,
+    }[op](data, value)
+
+
+def _read_npy(folder, meta, columns, filters):
+    kinds = meta['kinds']
+    mask = None
+    for name, op, value in filters or []:
+        column_mask = _npy_mask(_load_npy_column(folder, name, kinds[name]), kinds[name], op, value)
+        mask = column_mask if mask is None else mask & column_mask
+    positions = None if mask is None else np.flatnonzero(mask)
+
+    data = {}
+    for name in columns:
+        kind = kinds[name]
+        column = _load_npy_column(folder, name, kind)
+        if kind in ('category', 'string'):
+            values = column.to_categorical(positions)
+            data[name] = values if kind == 'category' else pd.array(np.asarray(values, dtype=object), dtype='string')
+        elif kind == 'bool':
+            raw = np.asarray(column if positions is None else column[positions])
+            data[name] = pd.array(np.where(raw < 0, None, raw.astype(bool)), dtype='boolean')
+        else:
+            data[name] = np.array(column if positions is None else column[positions])
+    rows = meta['rows'] if positions is None else len(positions)
+    return pd.DataFrame(data, index=pd.RangeIndex(rows))
+
+
+# ---------------------------------------------------------------------------
+# Backend Parquet (pyarrow)
+# ---------------------------------------------------------------------------
+
+def _write_parquet(folder, df, meta):
+    df.to_parquet(folder / 'table.parquet', engine='pyarrow', index=False)
+
+
+def _read_parquet(folder, meta, columns, filters):
+    df = pd.read_parquet(folder / 'table.parquet', engine='pyarrow', columns=columns,
+                         filters=[tuple(f) for f in filters] if filters else None)
+    return df.reset_index(drop=True)
+
+
+# ---------------------------------------------------------------------------
+# Store
+# ---------------------------------------------------------------------------
+
+def _table_dir(name, store_dir):
+    return Path(store_dir) / name
+
+
+_table_locks = {}
+_table_locks_guard = threading.Lock()
+
+
+def _table_lock(name, store_dir):
+    """Lock por tabela: threads da API que acham a mesma tabela desatualizada convertem uma vez só"""
+    key = (str(Path(store_dir).resolve()), name)
+    with _table_locks_guard:
+        return _table_locks.setdefault(key, threading.Lock())
+
+
+def _read_meta(name, store_dir):
+    folder = _table_dir(name, store_dir)
+    try:
+        version = (folder / CURRENT_FILE).read_text(encoding='utf-8').strip()
+        meta = json.loads((folder / version / 'schema.json').read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return None
+    if meta.get('format') != STORE_FORMAT or meta.get('version') != version:
+        return None
+    if meta['backend'] == 'parquet' and not _has_pyarrow():
+        return None
+    return meta
+
+
+def _is_current(name, meta):
+    source = csv_path(name)
+    return meta is not None and (not source.exists() or meta['source_signature'] == _source_signature(source))
+
+
+def _remove_stale_versions(folder, keep):
+    """Apaga versões (e arquivos do formato antigo) substituídas há mais de STALE_VERSION_S (pelo mtime)"""
+    now = time.time()
+    for entry in folder.iterdir():
+        if entry.name in (CURRENT_FILE, keep):
+            continue
+        try:
+            if now - entry.stat().st_mtime < STALE_VERSION_S:
+                continue
+            if entry.is_dir():
+                shutil.rmtree(entry, ignore_errors=True)
+            else:
+                entry.unlink()
+        except OSError:
+            continue
+
+
+def write_table(name, df, store_dir=STORE_DIR, source_signature=None):
+    """
+    Grava um DataFrame (já normalizado ou não) como tabela do store.
+    A versão é montada num diretório próprio e publicada trocando CURRENT:
+    leitores nunca veem uma tabela pela metade e gravações simultâneas
+    (threads ou processos) não apagam o trabalho uma da outra.
+    """
+    df = normalize_types(df)
+    backend = 'parquet' if _has_pyarrow() else 'npy'
+    folder = _table_dir(name, store_dir)
+    folder.mkdir(parents=True, exist_ok=True)
+    version_dir = Path(tempfile.mkdtemp(prefix=time.strftime('v%Y%m%d%H%M%S-'), dir=folder))
+    meta = {
+        'format': STORE_FORMAT,
+        'backend': backend,
+        'version': version_dir.name,
+        'rows': int(len(df)),
+        'columns': [str(c) for c in df.columns],
+        'kinds': {str(c): _kind(df[c]) for c in df.columns},
+        'source_signature': source_signature,
+        'written_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
+    try:
+        (_write_parquet if backend == 'parquet' else _write_npy)(version_dir, df, meta)
+        (version_dir / 'schema.json').write_text(json.dumps(meta, indent=2, ensure_ascii=False), encoding='utf-8')
+        pointer = folder / f'{CURRENT_FILE}.{version_dir.name}.tmp'
+        pointer.write_text(version_dir.name, encoding='utf-8')
+        # mtime da versão anterior passa a marcar quando ela foi substituída
+        previous = _read_meta(name, store_dir)
+        if previous is not None:
+            os.utime(folder / previous['version'])
+        os.replace(pointer, folder / CURRENT_FILE)
+    except BaseException:
+        shutil.rmtree(version_dir, ignore_errors=True)
+        raise
+    _remove_stale_versions(folder, keep=version_dir.name)
+    return meta
+
+
+def convert(name, store_dir=STORE_DIR, force=False):
+    """Converte o CSV da tabela se o store estiver ausente ou desatualizado; devolve o schema"""
+    with _table_lock(name, store_dir):
+        # Relido sob o lock: outra thread pode ter acabado de converter
+        meta = None if force else _read_meta(name, store_dir)
+        if _is_current(name, meta):
+            return meta
+        source = csv_path(name)
+        return write_table(name, read_csv(source), store_dir, _source_signature(source))
+
+
+def _validate_filters(filters, kinds):
+    for f in filters or []:
+        if len(f) != 3 or f[1] not in _FILTER_OPS:
+            raise ValueError(f"Filtro inválido: {f} (use (coluna, op, valor) com op em {sorted(_FILTER_OPS)})")
+        if f[0] not in kinds:
+            raise KeyError(f"Coluna inexistente no filtro: {f[0]}")
+
+
+def load_table(name, columns=None, filters=None, store_dir=STORE_DIR):
+    """
+    Lê uma tabela do store (convertendo o CSV na primeira vez ou se ele mudou).
+
+    Args:
+        name: caminho relativo a ml/datasets sem .csv (ex: 'consolidated_knn/mpb_consolidated')
+        columns: colunas a ler (padrão: todas); as ausentes na tabela são ignoradas
+        filters: lista de (coluna, op, valor), combinados com AND;
+                 op em ==, !=, <, <=, >, >=, in, not in
+    """
+    meta = _read_meta(name, store_dir)
+    if not _is_current(name, meta):
+        if not csv_path(name).exists():
+            raise FileNotFoundError(f"Tabela não encontrada: {name}")
+        try:
+            meta = convert(name, store_dir)
+        except OSError as e:
+            # Sistema de arquivos somente leitura (ex: deploy): lê direto do CSV
+            print(f"    [WARNING] Store indisponível para {name}, lendo CSV: {e}")
+            return _filter_frame(normalize_types(read_csv(csv_path(name))), columns, filters)
+
+    _validate_filters(filters, meta['kinds'])
+    selected = meta['columns'] if columns is None else [c for c in columns if c in meta['kinds']]
+    folder = _table_dir(name, store_dir) / meta['version']
+    if meta['backend'] == 'parquet':
+        return _read_parquet(folder, meta, selected, filters)
+    return _read_npy(folder, meta, selected, filters)
+
+
+def _filter_frame(df, columns, filters):
+    """Mesmo contrato de load_table sobre um DataFrame em memória"""
+    _validate_filters(filters, df.columns)
+    mask = np.ones(len(df), dtype=bool)
+    for name, op, value in filters or []:
+        col = df[name]
+        if op == 'in':
+            mask &= col.isin(list(value)).to_numpy(dtype=bool)
+        elif op == 'not in':
+            mask &= ~col.isin(list(value)).to_numpy(dtype=bool)
+        else:
+            result = {'==': col.__eq__, '!=': col.__ne__, '<': col.__lt__,
+                      '<=': col.__le__, '>': col.__gt__, '>=': col.__ge__}[op](value)
+            mask &= result.fillna(False).to_numpy(dtype=bool)
+    selected = list(df.columns) if columns is None else [c for c in columns if c in df.columns]
+    return df.loc[mask, selected].reset_index(drop=True)
+
+
+def migrate(force=False, store_dir=STORE_DIR):
+    """Converte todos os CSVs de ml/datasets para o store"""
+    converted, current, failed = 0, 0, []
+    for name in list_tables():
+        meta = None if force else _read_meta(name, store_dir)
+        if _is_current(name, meta):
+            current += 1
+            continue
+        try:
+            convert(name, store_dir, force=True)
+            converted += 1
+        except Exception as e:
+            failed.append((name, str(e)))
+    return {'converted': converted, 'current': current, 'failed': failed}
+
+
+def _dir_size(path):
+    return sum(p.stat().st_size for p in Path(path).rglob('*') if p.is_file())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    migrate_parser = commands.add_parser('migrate', help='converte os CSVs para o store')
+    migrate_parser.add_argument('--force', action='store_true', help='reconverte mesmo sem mudanças')
+    commands.add_parser('list', help='lista as tabelas e o estado no store')
+    args = parser.parse_args()
+
+    if args.command == 'migrate':
+        print("=" * 80)
+        print(f"MIGRAÇÃO DOS DATASETS PARA O STORE ({'parquet' if _has_pyarrow() else 'npy'})")
+        print("=" * 80)
+        start = time.time()
+        result = migrate(args.force)
+        for name, error in result['failed']:
+            print(f"  [ERRO] {name}: {error}")
+        csv_bytes = sum(csv_path(n).stat().st_size for n in list_tables())
+        print(f"  Convertidas: {result['converted']} | Já atualizadas: {result['current']} | "
+              f"Falhas: {len(result['failed'])} | {time.time() - start:.1f}s")
+        print(f"  CSV: {csv_bytes / 1e6:.1f} MB -> store: {_dir_size(STORE_DIR) / 1e6:.1f} MB")
+        return
+
+    for name in list_tables():
+        meta = _read_meta(name, STORE_DIR)
+        state = 'ok' if _is_current(name, meta) else ('desatualizada' if meta else 'não convertida')
+        rows = meta['rows'] if meta else '-'
+        print(f"  {name:<70} {str(rows):>8}  {state}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,92 +2,32 @@
 Feature Engineering Pipeline
 Adiciona features derivadas para melhorar performance do modelo ML
 """
-import pandas as pd
-import numpy as np
+import sys
 from pathlib import Path
 
+import pandas as pd
+
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from ml.feature_store import compute, materialize
+
+
 def engineer_features(df):
     """
     Adiciona features derivadas ao dataset
     
+    As fórmulas ficam registradas em ml/feature_store.py (as mesmas que o
+    HitPredictor usa na predição); só entram as features cujas colunas de
+    entrada existem em df.
+    
     Args:
         df: DataFrame com features básicas
         
     Returns:
         DataFrame com features adicionais
     """
-    df_enhanced = df.copy()
-    
-    # 1. Groove Factor (combinação de danceability, energy e BPM)
-    # Músicas com bom groove têm danceability alta, energy moderada-alta e BPM adequado
-    if all(col in df.columns for col in ['danceability', 'energy', 'bpm']):
-        # Normaliza BPM para 0-1 (assumindo range 60-180)
-        bpm_normalized = (df['bpm'].clip(60, 180) - 60) / 120
-        df_enhanced['groove_factor'] = (
-            df['danceability'] * 0.5 + 
-            df['energy'] * 0.3 + 
-            bpm_normalized * 0.2
-        )
-    
-    # 2. Commercial Appeal (loudness + valence)
-    # Músicas comerciais tendem a ser mais altas e positivas
-    if all(col in df.columns for col in ['loudness', 'valence']):
-        # Normaliza loudness de -60 a 0 dB para 0-1
-        loudness_normalized = (df['loudness'].clip(-60, 0) + 60) / 60
-        df_enhanced['commercial_appeal'] = (
-            loudness_normalized * 0.6 + 
-            df['valence'] * 0.4
-        )
-    
-    # 3. Energy-Dance Ratio
-    # Relação entre energia e danceability (detecta músicas energéticas mas não dançantes)
-    if all(col in df.columns for col in ['energy', 'danceability']):
-        # Evita divisão por zero
-        df_enhanced['energy_dance_ratio'] = df['energy'] / (df['danceability'] + 0.01)
-    
-    # 4. Vocal Presence (inverso de instrumentalness)
-    if 'instrumentalness' in df.columns:
-        df_enhanced['vocal_presence'] = 1 - df['instrumentalness']
-    
-    # 5. BPM Category (categórico -> numérico)
-    if 'bpm' in df.columns:
-        df_enhanced['bpm_category'] = pd.cut(
-            df['bpm'], 
-            bins=[0, 90, 120, 140, 200],
-            labels=[0, 1, 2, 3]  # slow, medium, fast, very_fast
-        ).astype(float)
-    
-    # 6. Loudness Normalized (0-1)
-    if 'loudness' in df.columns:
-        df_enhanced['loudness_normalized'] = (df['loudness'].clip(-60, 0) + 60) / 60
-    
-    # 7. Spectral Complexity (se tivermos brightness e dynamic_variation)
-    # Nota: Esses campos podem não existir em todos os datasets
-    if all(col in df.columns for col in ['brightness', 'dynamic_variation']):
-        # Normaliza brightness (assumindo range 1000-4000 Hz)
-        brightness_norm = (df['brightness'].clip(1000, 4000) - 1000) / 3000
-        df_enhanced['spectral_complexity'] = brightness_norm * df['dynamic_variation']
-    
-    # 8. Hit Potential Score (combinação heurística)
-    # Baseado nas correlações conhecidas
-    if all(col in df.columns for col in ['energy', 'danceability', 'valence']):
-        df_enhanced['hit_potential_score'] = (
-            df['energy'] * 0.3 +
-            df['danceability'] * 0.4 +
-            df['valence'] * 0.2 +
-            df_enhanced.get('commercial_appeal', 0.5) * 0.1
-        )
-    
-    # 9. Acoustic-Electric Balance
-    if 'acousticness' in df.columns:
-        df_enhanced['acoustic_electric_balance'] = 1 - abs(df['acousticness'] - 0.5) * 2
-    
-    # 10. Speech-Music Ratio
-    if 'speechiness' in df.columns:
-        # Músicas com muita fala (>0.33) são provavelmente podcasts/spoken word
-        df_enhanced['is_music'] = (df['speechiness'] < 0.33).astype(float)
-    
-    return df_enhanced
+    return pd.concat([df, compute(df)], axis=1)
 
 def add_features_to_dataset(input_file, output_file=None):
     """
@@ -102,8 +42,11 @@ def add_features_to_dataset(input_file, output_file=None):
     
     print(f"  Antes: {len(df.columns)} colunas")
     
-    # Adiciona features
-    df_enhanced = engineer_features(df)
+    # Adiciona features (do cache do feature store se a entrada não mudou)
+    features, stats = materialize(df, input_file)
+    df_enhanced = pd.concat([df, features], axis=1)
+    if stats['cached']:
+        print(f"  Do cache: {len(stats['cached'])} feature(s)")
     
     new_features = set(df_enhanced.columns) - set(df.columns)
     print(f"  Depois: {len(df_enhanced.columns)} colunas")
@@ -0,0 +1,282 @@
+"""
+Feature store das features derivadas (mesmo código no treino e na predição)
+
+engineer_features.py recalculava groove_factor, commercial_appeal, etc. sobre
+os CSVs inteiros a cada execução, e o HitPredictor não calculava nenhuma
+delas: um modelo enhanced recebia só as 9 features básicas. Aqui:
+
+- cada feature derivada é uma transformação vetorizada registrada com nome,
+  versão e colunas de entrada (@feature); funciona igual para um dataset
+  inteiro e para uma música só (compute_row);
+- materialize() grava cada feature de um dataset em
+  ml/datasets/feature_store/<dataset>/<feature>.v<versão>.<hash>.npy, com o
+  hash das colunas de entrada: só recalcula quando a entrada ou a versão da
+  transformação muda;
+- mudar a fórmula de uma feature = subir a versão (o cache antigo deixa de
+  valer e os metadados guardam feature_set_version()).
+
+Uso:
+    python ml/feature_store.py [--list] [dataset.csv ...]
+"""
+import argparse
+import hashlib
+import sys
+from pathlib import Path
+
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+import pandas as pd
+
+STORE_DIR = PROJECT_ROOT / 'ml' / 'datasets' / 'feature_store'
+
+
+class Transform:
+    """Uma feature derivada: fn(src) -> array, onde src[coluna] dá um array float64"""
+
+    def __init__(self, name, version, inputs, fn, optional=()):
+        self.name = name
+        self.version = version
+        self.inputs = tuple(inputs)
+        self.optional = tuple(optional)
+        self.fn = fn
+
+
+_REGISTRY = {}
+
+
+def feature(name, version, inputs, optional=()):
+    """Registra uma transformação (decorador)"""
+    def register(fn):
+        _REGISTRY[name] = Transform(name, version, inputs, fn, optional)
+        return fn
+    return register
+
+
+def registered():
+    """Nomes das features na ordem de registro"""
+    return list(_REGISTRY)
+
+
+def _normalized(values, low, high):
+    return (np.clip(values, low, high) - low) / (high - low)
+
+
+@feature('groove_factor', 1, ['danceability', 'energy', 'bpm'])
+def _groove_factor(src):
+    # Músicas com bom groove têm danceability alta, energy moderada-alta e BPM adequado (60-180)
+    return src['danceability'] * 0.5 + src['energy'] * 0.3 + _normalized(src['bpm'], 60, 180) * 0.2
+
+
+@feature('commercial_appeal', 1, ['loudness', 'valence'])
+def _commercial_appeal(src):
+    # Músicas comerciais tendem a ser mais altas e positivas (loudness de -60 a 0 dB)
+    return _normalized(src['loudness'], -60, 0) * 0.6 + src['valence'] * 0.4
+
+
+@feature('energy_dance_ratio', 1, ['energy', 'danceability'])
+def _energy_dance_ratio(src):
+    return src['energy'] / (src['danceability'] + 0.01)
+
+
+@feature('vocal_presence', 1, ['instrumentalness'])
+def _vocal_presence(src):
+    return 1 - src['instrumentalness']
+
+
+@feature('bpm_category', 2, ['bpm'])
+def _bpm_category(src):
+    # slow (-inf, 90], medium (90, 120], fast (120, 140], very_fast (140, inf). Total para
+    # qualquer bpm finito: na predição um bpm ausente chega como 0 e viraria NaN no modelo
+    bins = np.array([90, 120, 140], dtype=np.float64)
+    category = np.searchsorted(bins, src['bpm'], side='left').astype(np.float64)
+    category[np.isnan(src['bpm'])] = np.nan
+    return category
+
+
+@feature('loudness_normalized', 1, ['loudness'])
+def _loudness_normalized(src):
+    return _normalized(src['loudness'], -60, 0)
+
+
+@feature('spectral_complexity', 1, ['brightness', 'dynamic_variation'])
+def _spectral_complexity(src):
+    # brightness em Hz (1000-4000)
+    return _normalized(src['brightness'], 1000, 4000) * src['dynamic_variation']
+
+
+@feature('hit_potential_score', 1, ['energy', 'danceability', 'valence'], optional=['commercial_appeal'])
+def _hit_potential_score(src):
+    # commercial_appeal entra com 0.5 quando não dá para calcular
+    appeal = src.get('commercial_appeal', 0.5)
+    return src['energy'] * 0.3 + src['danceability'] * 0.4 + src['valence'] * 0.2 + appeal * 0.1
+
+
+@feature('acoustic_electric_balance', 1, ['acousticness'])
+def _acoustic_electric_balance(src):
+    return 1 - np.abs(src['acousticness'] - 0.5) * 2
+
+
+@feature('is_music', 1, ['speechiness'])
+def _is_music(src):
+    # Muita fala (>0.33) é provavelmente podcast/spoken word
+    return (src['speechiness'] < 0.33).astype(np.float64)
+
+
+class _Source:
+    """
+    Colunas base (float64, convertidas sob demanda) + features já calculadas.
+    df é um DataFrame ou, para uma música só, um dicionário coluna -> valor.
+    """
+
+    def __init__(self, df):
+        self.df = df
+        self.names = set(df.columns) if isinstance(df, pd.DataFrame) else set(df)
+        self.n_rows = len(df) if isinstance(df, pd.DataFrame) else 1
+        self.base = {}
+        self.computed = {}
+
+    def is_base(self, name):
+        return name in self.names
+
+    def available(self, name):
+        if self.is_base(name):
+            return True
+        transform = _REGISTRY.get(name)
+        return transform is not None and all(self.available(i) for i in transform.inputs)
+
+    def __getitem__(self, name):
+        if self.is_base(name):
+            if name not in self.base and isinstance(self.df, pd.DataFrame):
+                self.base[name] = pd.to_numeric(self.df[name], errors='coerce').to_numpy(
+                    dtype=np.float64, na_value=np.nan)
+            elif name not in self.base:
+                self.base[name] = np.array([self.df[name]], dtype=np.float64)
+            return self.base[name]
+        if name not in self.computed:
+            values = _REGISTRY[name].fn(self)
+            self.computed[name] = np.broadcast_to(np.asarray(values, dtype=np.float64), (self.n_rows,)).copy()
+        return self.computed[name]
+
+    def get(self, name, default=None):
+        return self[name] if self.available(name) else default
+
+
+def _base_inputs(name, source):
+    """Colunas base (transitivas) de que a feature depende no dataset"""
+    if source.is_base(name):
+        return [name]
+    transform = _REGISTRY[name]
+    names = []
+    for i in transform.inputs + transform.optional:
+        if source.available(i):
+            names.extend(n for n in _base_inputs(i, source) if n not in names)
+    return names
+
+
+def _signature(name, source):
+    """Versões da feature e das features de que ela depende"""
+    if source.is_base(name):
+        return []
+    transform = _REGISTRY[name]
+    parts = [f'{name}@{transform.version}']
+    for i in transform.inputs + transform.optional:
+        if source.available(i):
+            parts.extend(_signature(i, source))
+    return parts
+
+
+def feature_set_version(names=None):
+    """Hash curto dos nomes + versões das features (vai para o metadata dos modelos)"""
+    names = names if names is not None else registered()
+    spec = ','.join(f'{n}@{_REGISTRY[n].version}' for n in names if n in _REGISTRY)
+    return hashlib.blake2b(spec.encode(), digest_size=6).hexdigest()
+
+
+def compute(df, names=None):
+    """
+    Features derivadas de df (DataFrame com as mesmas linhas). Sem names,
+    calcula todas cujas entradas existem; colunas já presentes em df são
+    mantidas como estão.
+    """
+    source = _Source(df)
+    names = names if names is not None else registered()
+    out = {n: source[n] for n in names if n not in df.columns and source.available(n)}
+    return pd.DataFrame(out, index=df.index)
+
+
+def compute_row(features, names=None):
+    """As mesmas transformações para uma música (dicionário de features) -> {feature: valor}"""
+    source = _Source({k: v for k, v in features.items()
+                      if isinstance(v, (int, float, np.number)) and not isinstance(v, bool)})
+    names = names if names is not None else registered()
+    return {n: float(source[n][0]) for n in names if not source.is_base(n) and source.available(n)}
+
+
+def _dataset_key(path):
+    return Path(path).stem
+
+
+def materialize(df, dataset, names=None, store_dir=STORE_DIR):
+    """
+    Como compute(), mas cada feature é lida do cache do dataset quando a
+    entrada e a versão não mudaram. Devolve (features, estatísticas).
+    """
+    source = _Source(df)
+    names = names if names is not None else registered()
+    folder = Path(store_dir) / _dataset_key(dataset)
+    out, stats = {}, {'cached': [], 'computed': []}
+    for name in names:
+        if name in df.columns or not source.available(name):
+            continue
+        digest = hashlib.blake2b(digest_size=8)
+        digest.update('|'.join(_signature(name, source)).encode())
+        for column in _base_inputs(name, source):
+            digest.update(column.encode())
+            digest.update(np.ascontiguousarray(source[column]).tobytes())
+        path = folder / f'{name}.v{_REGISTRY[name].version}.{digest.hexdigest()}.npy'
+
+        values = None
+        if path.exists():
+            try:
+                values = np.load(path, allow_pickle=False)
+            except (OSError, ValueError):
+                values = None
+        if values is not None and len(values) == len(df):
+            stats['cached'].append(name)
+        else:
+            values = source[name]
+            folder.mkdir(parents=True, exist_ok=True)
+            for stale in folder.glob(f'{name}.v*.npy'):
+                stale.unlink()
+            tmp = path.with_name(path.name + '.tmp')
+            with open(tmp, 'wb') as f:
+                np.save(f, values)
+            tmp.replace(path)
+            stats['computed'].append(name)
+        source.computed[name] = values
+        out[name] = values
+    return pd.DataFrame(out, index=df.index), stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('datasets', nargs='*', help='CSVs a materializar')
+    parser.add_argument('--list', action='store_true', help='lista as features registradas')
+    args = parser.parse_args()
+
+    if args.list or not args.datasets:
+        print(f"Feature set {feature_set_version()}")
+        for name in registered():
+            t = _REGISTRY[name]
+            print(f"  {name:<28} v{t.version}  <- {', '.join(t.inputs + t.optional)}")
+    for dataset in args.datasets:
+        df = pd.read_csv(dataset)
+        features, stats = materialize(df, dataset)
+        print(f"  {Path(dataset).name}: {len(stats['computed'])} calculada(s), {len(stats['cached'])} do cache")
+
+
+if __name__ == '__main__':
+    main()
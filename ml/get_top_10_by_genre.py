@@ -1,158 +1,36 @@
 """
 Script para gerar as TOP 10 músicas de cada gênero
-usando os modelos treinados e datasets disponíveis
+usando o índice de scores do catálogo (ml/catalog_scores.py)
 """
 import pandas as pd
-import joblib
-import os
 from pathlib import Path
-import numpy as np
 
-# Features usadas pelos modelos ML
-ML_FEATURES = ['bpm', 'energy', 'danceability', 'valence',
-               'acousticness', 'instrumentalness', 'liveness',
-               'speechiness', 'loudness']
-
-def load_latest_model(genre):
-    """Carrega o modelo mais recente para um gênero"""
-    models_dir = Path(__file__).parent / 'models'
-    pattern = f"{genre}_*.pkl"
-    model_files = list(models_dir.glob(pattern))
-    
-    if not model_files:
-        return None
-    
-    # Pega o mais recente
-    latest_model = sorted(model_files)[-1]
-    try:
-        model = joblib.load(latest_model)
-        return model, latest_model.name
-    except Exception as e:
-        print(f"Erro ao carregar modelo {latest_model.name}: {e}")
-        return None
-
-def get_genre_dataset_path(genre):
-    """Retorna o caminho do dataset para o gênero"""
-    datasets_dir = Path(__file__).parent / 'datasets'
-    
-    # Mapeamento de gêneros para arquivos de dataset
-    dataset_map = {
-        'mpb': 'master_mpb.csv',
-        'rnb_brasil': 'master_rnb_brasil.csv',
-        'brazil': 'kaggle_pop_urban_brasil_ml.csv',
-        'pop_urban_brasil': 'kaggle_pop_urban_brasil_ml.csv',
-        'sertanejo': 'kaggle_sertanejo_ml.csv',
-        'pagode': 'kaggle_pagode_ml.csv',
-        'samba': 'kaggle_samba_ml.csv',
-        'forro': 'kaggle_forro_ml.csv'
-    }
-    
-    dataset_file = dataset_map.get(genre)
-    if not dataset_file:
-        return None
-    
-    dataset_path = datasets_dir / dataset_file
-    if dataset_path.exists():
-        return dataset_path
-    else:
-        print(f"Dataset não encontrado: {dataset_path}")
-        return None
-
-def prepare_features(df):
-    """Prepara as features para predição"""
-    # Verifica se todas as features necessárias estão presentes
-    missing_features = [f for f in ML_FEATURES if f not in df.columns]
-    
-    if missing_features:
-        print(f"  [AVISO] Features faltando: {missing_features}")
-        # Preenche com valores padrão
-        for feature in missing_features:
-            if feature == 'bpm':
-                df[feature] = 120
-            elif feature in ['energy', 'danceability', 'valence', 'acousticness', 
-                            'instrumentalness', 'liveness', 'speechiness']:
-                df[feature] = 0.5
-            elif feature == 'loudness':
-                df[feature] = -8.0
-    
-    return df[ML_FEATURES].values
+from catalog_scores import CatalogScoreIndex, build, resolve_genre
 
 def get_top_10_for_genre(genre):
-    """Retorna as top 10 músicas para um gênero específico"""
+    """Retorna as top 10 músicas do dataset do gênero (consulta ao índice de scores)"""
     print(f"\n{'='*60}")
     print(f"Processando gênero: {genre.upper()}")
     print(f"{'='*60}")
     
-    # 1. Carrega o modelo
-    model_result = load_latest_model(genre)
-    if not model_result:
-        print(f"  [ERRO] Nenhum modelo encontrado para {genre}")
-        return None
-    
-    model, model_name = model_result
-    print(f"  Modelo: {model_name}")
-    
-    # 2. Carrega o dataset
-    dataset_path = get_genre_dataset_path(genre)
-    if not dataset_path:
-        print(f"  [ERRO] Dataset não encontrado para {genre}")
-        return None
-    
-    print(f"  Dataset: {dataset_path.name}")
-    
     try:
-        df = pd.read_csv(dataset_path)
-        print(f"  Total de músicas: {len(df)}")
-    except Exception as e:
-        print(f"  [ERRO] Erro ao ler dataset: {e}")
+        index = CatalogScoreIndex(genre)
+    except FileNotFoundError as e:
+        print(f"  [ERRO] {e}")
         return None
     
-    # 3. Prepara features
-    X = prepare_features(df.copy())
+    dataset = resolve_genre(genre)
+    print(f"  Índice: modelo {index.meta['model_version']} ({index.meta['built_at']})")
     
-    # 4. Faz predições
-    try:
-        predictions = model.predict_proba(X)[:, 1]  # Probabilidade de ser hit
-        df['hit_probability'] = predictions
-        df['hit_score'] = (predictions * 100).astype(int)
-    except Exception as e:
-        print(f"  [ERRO] Erro ao fazer predições: {e}")
+    top_10 = pd.DataFrame(index.top_k(10, source=dataset))
+    if top_10.empty:
+        print(f"  [ERRO] Nenhuma música do dataset {dataset} no índice")
         return None
     
-    # 5. Ordena por score e pega top 10
-    top_10 = df.nlargest(10, 'hit_score')
-    
-    # 6. Seleciona colunas relevantes para exibir
-    display_cols = []
-    
-    # Identifica colunas de identificação disponíveis
-    if 'track_name' in top_10.columns:
-        display_cols.append('track_name')
-    elif 'name' in top_10.columns:
-        display_cols.append('name')
-    
-    if 'artist_name' in top_10.columns:
-        display_cols.append('artist_name')
-    elif 'artist' in top_10.columns:
-        display_cols.append('artist')
-    elif 'artists' in top_10.columns:
-        display_cols.append('artists')
-    
-    # Adiciona features principais
-    feature_cols = ['bpm', 'energy', 'danceability', 'valence', 'loudness']
-    for col in feature_cols:
-        if col in top_10.columns:
-            display_cols.append(col)
-    
-    # Sempre adiciona o score
-    display_cols.extend(['hit_score', 'hit_probability'])
-    
-    # Remove duplicatas mantendo ordem
-    display_cols = list(dict.fromkeys(display_cols))
-    
-    top_10_display = top_10[display_cols].copy()
-    
-    return top_10_display
+    top_10['hit_probability'] = top_10['ml_probability']
+    display_cols = ['track_name', 'artist', 'bpm', 'energy', 'danceability', 'valence', 'loudness',
+                    'hit_score', 'hit_probability']
+    return top_10[display_cols]
 
 def main():
     """Processa todos os gêneros e gera relatório"""
@@ -172,6 +50,9 @@ def main():
     print("TOP 10 MÚSICAS POR GÊNERO - USANDO MODELOS ML")
     print("=" * 80)
     
+    # Atualiza o índice (só pontua faixas/modelos que mudaram desde o último build)
+    build(genres)
+    
     results = {}
     
     for genre in genres:
@@ -191,8 +72,11 @@ def main():
                 score = row['hit_score']
                 prob = row['hit_probability']
                 
-                print(f"  {len(results[genre]) - list(top_10.index).index(idx)}. {track_name[:40]:<40} | {artist[:25]:<25}")
-                print(f"     Score: {score}/100 ({prob:.1%} probabilidade)")
+                print(f"  {list(top_10.index).index(idx) + 1}. {track_name[:40]:<40} | {artist[:25]:<25}")
+                if pd.notna(prob):
+                    print(f"     Score: {score:.0f}/100 ({prob:.1%} probabilidade)")
+                else:
+                    print(f"     Score: {score:.0f}/100 (heurística)")
                 
                 # Mostra features principais
                 features_str = ""
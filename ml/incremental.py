@@ -0,0 +1,146 @@
+"""
+Retreino incremental (warm start) quando chegam músicas rotuladas novas
+
+Acrescentar 50 hits verificados a um gênero hoje significa treinar a floresta
+inteira de novo. Aqui o último modelo do job (mesmo prefixo em ml/models)
+é reaproveitado:
+
+- o _rows.npz gravado ao lado de cada modelo (ml/training.py) guarda o hash
+  das linhas de treino e de teste; as linhas do dataset atual que não estão
+  em nenhum dos dois são as músicas novas;
+- uma parte das novas vai para a validação (junto com o teste antigo) e o
+  resto para o treino; a floresta ganha árvores novas com warm_start,
+  ajustadas em treino antigo + novo, com peso NEW_ROW_WEIGHT nas novas;
+- janela móvel: passando de MAX_TREE_FACTOR x o número de árvores do job,
+  as árvores mais antigas saem;
+- checagem de drift: se a accuracy do modelo atualizado na validação cair
+  mais que INCREMENTAL_MAX_DROP (padrão 0.03) em relação à do último modelo
+  nessa mesma validação, o gênero é treinado do zero (ml/training.py fit_job).
+
+O modelo atualizado é gravado como um modelo novo com o mesmo prefixo e o
+mesmo formato de _metadata.txt, então o HitPredictor passa a usá-lo sem
+mudança nenhuma.
+
+Uso:
+    python ml/training.py genres --incremental [--cores N] [--only mpb ...]
+"""
+import math
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from ml.training import (MODELS_DIR, RANDOM_STATE, fit_job, holdout_scores, read_metadata,
+                         save_model)
+
+NEW_ROW_WEIGHT = 2.0    # peso das músicas novas nas árvores acrescentadas
+MIN_NEW_TREES = 20
+MAX_TREE_FACTOR = 2     # janela móvel: no máximo 2x as árvores do job
+
+
+def max_drop():
+    try:
+        return float(os.environ.get('INCREMENTAL_MAX_DROP', '0.03'))
+    except ValueError:
+        return 0.03
+
+
+def latest_model(job, models_dir=MODELS_DIR):
+    """(caminho do .pkl, metadata, hashes de treino, hashes de teste) do último modelo do job, ou None"""
+    for path in sorted(Path(models_dir).glob(f'{job.model_prefix}_[0-9]*.pkl'), reverse=True):
+        rows_path = path.with_name(f'{path.stem}_rows.npz')
+        metadata_path = path.with_name(f'{path.stem}_metadata.txt')
+        if not (rows_path.exists() and metadata_path.exists()):
+            continue
+        with np.load(rows_path) as rows:
+            return path, read_metadata(metadata_path), rows['train'], rows['test']
+    return None
+
+
+def _full(job, data, n_jobs, models_dir, search_dir, reason, start):
+    metrics = fit_job(job, data, n_jobs, models_dir, search_dir)
+    metrics['reason'] = reason
+    metrics['seconds'] = round(time.time() - start, 2)
+    return metrics
+
+
+def update_job(job, data, n_jobs, models_dir=MODELS_DIR, search_dir=None):
+    """
+    Acrescenta árvores ao último modelo do job com as músicas novas; treina
+    do zero se não há modelo anterior compatível ou se a validação piorou.
+    """
+    import joblib
+
+    start = time.time()
+    previous = latest_model(job, models_dir)
+    if previous is None:
+        return _full(job, data, n_jobs, models_dir, search_dir, 'sem modelo anterior', start)
+    base_path, metadata, old_train, old_test = previous
+    if metadata.get('features') != str(data.features):
+        return _full(job, data, n_jobs, models_dir, search_dir, 'features mudaram', start)
+
+    in_train = np.isin(data.row_hashes, old_train)
+    in_test = np.isin(data.row_hashes, old_test) & ~in_train
+    new_rows = np.flatnonzero(~in_train & ~in_test)
+    reference = float(metadata.get('accuracy', 'nan'))
+
+    model = joblib.load(base_path)
+    if not len(new_rows):
+        return {'accuracy': reference, 'cv_mean': float(metadata.get('cv_mean', 'nan')),
+                'params': metadata.get('params'), 'mode': 'unchanged', 'reason': 'sem músicas novas',
+                'genre': job.name, 'kind': job.kind, 'n_samples': len(data.y),
+                'n_features': len(data.features), 'n_jobs': n_jobs, 'model': base_path.name,
+                'seconds': round(time.time() - start, 2)}
+
+    # Parte das novas vai para a validação, como no split original
+    rng = np.random.default_rng(RANDOM_STATE)
+    shuffled = rng.permutation(new_rows)
+    n_holdout = int(round(len(shuffled) * data.test_size))
+    train_rows = np.concatenate([np.flatnonzero(in_train), np.sort(shuffled[n_holdout:])])
+    test_rows = np.concatenate([np.flatnonzero(in_test), np.sort(shuffled[:n_holdout])])
+    if not len(test_rows) or len(np.unique(data.y[train_rows])) < 2:
+        return _full(job, data, n_jobs, models_dir, search_dir, 'validação insuficiente', start)
+
+    X_test, y_test = data.X[test_rows], data.y[test_rows]
+    before = holdout_scores(model, X_test, y_test)['accuracy']
+
+    n_trees = len(model.estimators_)
+    base_trees = job.params['n_estimators']
+    added = max(MIN_NEW_TREES, math.ceil(base_trees * (len(new_rows) - n_holdout) / len(train_rows)))
+    weights = np.ones(len(train_rows))
+    weights[np.isin(train_rows, new_rows)] = NEW_ROW_WEIGHT
+    model.set_params(warm_start=True, n_estimators=n_trees + added, n_jobs=n_jobs)
+    model.fit(data.X[train_rows], data.y[train_rows], sample_weight=weights)
+    model.set_params(warm_start=False)
+
+    window = MAX_TREE_FACTOR * base_trees
+    if len(model.estimators_) > window:
+        model.estimators_ = model.estimators_[-window:]
+        model.n_estimators = window
+
+    metrics = holdout_scores(model, X_test, y_test)
+    if metrics['accuracy'] < before - max_drop():
+        return _full(job, data, n_jobs, models_dir, search_dir,
+                     f"validação caiu para {metrics['accuracy']:.1%} (antes {before:.1%})", start)
+
+    params = {**model.get_params(), 'n_estimators': len(model.estimators_)}
+    metrics.update({
+        'cv_mean': float('nan'), 'cv_std': float('nan'), 'n_jobs': n_jobs, 'mode': 'incremental',
+        'params': {k: params[k] for k in ('n_estimators', 'max_depth', 'min_samples_split',
+                                          'min_samples_leaf', 'max_features')},
+        'reason': f'{len(new_rows)} música(s) nova(s)',
+        'seconds': round(time.time() - start, 2),
+    })
+    extra = {
+        'mode': 'incremental',
+        'base_model': base_path.name,
+        'new_rows': len(new_rows),
+        'trees_added': added,
+        'validation_before': before,
+    }
+    return save_model(model, job, data, metrics, train_rows, test_rows, models_dir, extra)
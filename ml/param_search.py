@@ -0,0 +1,184 @@
+"""
+Busca de hiperparâmetros da RandomForest por successive halving
+
+Os retrain_*.py usam parâmetros fixos escolhidos à mão porque um grid search
+completo (dezenas de combinações x 5 dobras x 200 árvores) por gênero é lento
+demais. Aqui todas as combinações do grid começam baratas (poucas árvores e
+uma amostra do treino) e a cada rodada só o melhor terço continua, com 3x
+mais árvores e 3x mais músicas, até a última rodada com o orçamento cheio.
+
+- a busca usa só a parte de treino do split (o teste continua intocado) e
+  dobras estratificadas sobre a amostra de cada rodada;
+- cada dobra avaliada é gravada em ml/.search_cache/<modelo>.jsonl com uma
+  chave (hash dos dados + parâmetros + árvores + amostra + dobra): uma busca
+  interrompida recomeça de onde parou e uma repetida com os mesmos dados não
+  refaz nada;
+- os parâmetros escolhidos vão para o metadata do modelo (ml/training.py).
+
+Uso:
+    python ml/training.py genres enhanced --search [--cores N] [--only mpb ...]
+"""
+import hashlib
+import itertools
+import json
+import math
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+SEARCH_DIR = PROJECT_ROOT / 'ml' / '.search_cache'
+
+# Grid em ordem do modelo mais simples para o mais complexo (desempate)
+PARAM_GRID = {
+    'max_depth': [6, 10, 15, None],
+    'min_samples_leaf': [4, 2, 1],
+    'min_samples_split': [10, 5, 2],
+    'max_features': ['sqrt', 0.5],
+}
+
+ETA = 3             # fração que sobrevive a cada rodada (1/ETA) e fator de crescimento
+MIN_TREES = 25      # árvores na primeira rodada
+MIN_SAMPLE = 60     # músicas mínimas na amostra de uma rodada
+SEARCH_FOLDS = 3
+RANDOM_STATE = 42
+
+# Versão do método: muda as chaves e invalida o cache quando a avaliação muda
+_CACHE_VERSION = 1
+
+
+def candidates(grid=PARAM_GRID):
+    """Todas as combinações do grid como dicionários"""
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[n] for n in names))]
+
+
+def data_hash(X, y):
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f'{X.shape}'.encode())
+    digest.update(np.ascontiguousarray(X, dtype=np.float64).tobytes())
+    digest.update(np.ascontiguousarray(y, dtype=np.int64).tobytes())
+    return digest.hexdigest()
+
+
+def _fold_key(data_key, params, trees, rows, n_folds, fold):
+    payload = json.dumps([_CACHE_VERSION, data_key, params, trees, rows, n_folds, fold], sort_keys=True)
+    return hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+
+
+class FoldCache:
+    """Resultados por dobra num arquivo JSON Lines (uma linha gravada por dobra)"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.scores = {}
+        if self.path.exists():
+            with open(self.path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        self.scores[entry['key']] = entry['score']
+                    except (ValueError, KeyError):
+                        continue  # linha cortada por uma interrupção
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        score = self.scores.get(key)
+        if score is not None:
+            self.hits += 1
+        return score
+
+    def put(self, key, score):
+        self.misses += 1
+        self.scores[key] = score
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'key': key, 'score': score}) + '\n')
+            f.flush()
+
+
+def schedule(n_candidates, n_rows, max_trees, eta=ETA):
+    """(árvores, músicas) de cada rodada; a última usa o orçamento cheio"""
+    rounds = max(1, math.ceil(math.log(max(n_candidates, 2), eta)))
+    plan = []
+    for r in range(rounds):
+        shrink = eta ** (rounds - 1 - r)
+        plan.append((max(MIN_TREES, max_trees // shrink) if shrink > 1 else max_trees,
+                     max(min(MIN_SAMPLE, n_rows), n_rows // shrink)))
+    return plan
+
+
+def _sample(indices, y, rows):
+    """Amostra estratificada e fixa de rows índices (a própria lista se rows >= len)"""
+    if rows >= len(indices):
+        return indices
+    from sklearn.model_selection import train_test_split
+    minority = int(np.bincount(y[indices], minlength=2).min())
+    sample, _ = train_test_split(indices, train_size=rows, random_state=RANDOM_STATE,
+                                 stratify=y[indices] if minority >= 2 else None)
+    return np.sort(sample)
+
+
+def successive_halving(X, y, indices, max_trees, cache_path, n_jobs=1, grid=PARAM_GRID,
+                       eta=ETA, verbose=False):
+    """
+    Escolhe os parâmetros da floresta usando só as linhas `indices`.
+    Devolve {'params', 'score', 'rounds', 'candidates', 'folds_evaluated', 'folds_cached', 'seconds'}.
+    """
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.model_selection import StratifiedKFold
+
+    start = time.time()
+    log = print if verbose else (lambda *a, **k: None)
+    cache = FoldCache(cache_path)
+    data_key = data_hash(X[indices], y[indices])
+
+    alive = candidates(grid)
+    plan = schedule(len(alive), len(indices), max_trees, eta)
+    scores = {}
+    for round_no, (trees, rows) in enumerate(plan):
+        sample = _sample(indices, y, rows)
+        minority = int(np.bincount(y[sample], minlength=2).min())
+        n_folds = min(SEARCH_FOLDS, minority)
+        if n_folds < 2:
+            break
+        folds = list(StratifiedKFold(n_splits=n_folds, shuffle=True, random_state=RANDOM_STATE)
+                     .split(X[sample], y[sample]))
+
+        scores = {}
+        for i, params in enumerate(alive):
+            fold_scores = []
+            for fold, (fit_rows, eval_rows) in enumerate(folds):
+                key = _fold_key(data_key, params, trees, len(sample), n_folds, fold)
+                score = cache.get(key)
+                if score is None:
+                    model = RandomForestClassifier(n_estimators=trees, random_state=RANDOM_STATE,
+                                                   n_jobs=n_jobs, **params)
+                    model.fit(X[sample[fit_rows]], y[sample[fit_rows]])
+                    score = float(model.score(X[sample[eval_rows]], y[sample[eval_rows]]))
+                    cache.put(key, score)
+                fold_scores.append(score)
+            scores[i] = float(np.mean(fold_scores))
+
+        # Estável: empates ficam com o candidato mais simples (ordem do grid)
+        ranking = sorted(scores, key=lambda i: -scores[i])
+        keep = len(alive) if round_no == len(plan) - 1 else max(1, len(alive) // eta)
+        log(f"    rodada {round_no + 1}/{len(plan)}: {len(alive)} candidato(s), {trees} árvores, "
+            f"{len(sample)} músicas -> melhor {scores[ranking[0]]:.1%}")
+        alive = [alive[i] for i in ranking[:keep]]
+        scores = {j: scores[i] for j, i in enumerate(ranking[:keep])}
+
+    return {
+        'params': dict(alive[0]),
+        'score': scores.get(0, float('nan')),
+        'rounds': len(plan),
+        'candidates': len(candidates(grid)),
+        'folds_evaluated': cache.misses,
+        'folds_cached': cache.hits,
+        'seconds': round(time.time() - start, 2),
+    }
@@ -0,0 +1,453 @@
+"""
+Pipeline de dados do ml/ com execução incremental (hash de conteúdo)
+
+Os scripts de coleta, consolidação, limpeza, features e treino eram rodados à
+mão numa ordem decorada, e cada um relê e regrava CSVs inteiros. Aqui cada
+etapa declara o script, as entradas e as saídas (padrões glob relativos à
+raiz do projeto). As dependências saem do cruzamento saída -> entrada.
+
+Uma etapa só roda de novo quando:
+- o hash do script ou de algum arquivo de entrada mudou desde a última execução;
+- alguma saída declarada não existe.
+
+Os hashes ficam em ml/.pipeline/state.json junto com tamanho/mtime de cada
+arquivo, para não reler arquivos que não mudaram. Etapas independentes rodam
+em paralelo (um subprocesso por etapa); a saída de cada uma vai para
+ml/.pipeline/logs/<etapa>.log. Etapas de coleta (rede/credenciais do Spotify)
+são manuais: só rodam quando pedidas pelo nome.
+
+Uso:
+    python ml/pipeline.py                       # roda o que estiver desatualizado
+    python ml/pipeline.py --dry-run             # só mostra o plano
+    python ml/pipeline.py train_knn [--force]   # uma etapa (e o que ela precisa)
+    python ml/pipeline.py --list
+    python ml/pipeline.py --touch               # adota as saídas que já existem
+"""
+import argparse
+import fnmatch
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).parent.parent
+STATE_DIR = PROJECT_ROOT / 'ml' / '.pipeline'
+
+# Versão do formato do state.json
+_STATE_VERSION = 1
+
+
+class Stage:
+    """
+    Uma etapa: script + padrões de entrada/saída (relativos à raiz do projeto).
+    code lista módulos importados pelo script: entram no hash, mas não contam
+    como dados (sem nenhum arquivo de entrada a etapa não roda).
+    """
+
+    def __init__(self, name, script, inputs, outputs, code=(), manual=False, description=''):
+        self.name = name
+        self.script = script
+        self.code = list(code)
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.manual = manual
+        self.description = description
+
+
+STAGES = [
+    Stage('collect_verified_hits', 'ml/collect_option2.py',
+          inputs=['ml/datasets/verified_hits_massive.csv'],
+          outputs=['ml/datasets/verified_hits_complete.csv'],
+          manual=True, description='hits verificados via API do Spotify'),
+    Stage('process_real_data', 'scripts/data_gen/process_real_data.py',
+          inputs=['ml/datasets/raw/spotify_songs.csv'],
+          outputs=['ml/datasets/kaggle_*_ml.csv'],
+          code=['ml/track_keys.py'],
+          description='extrai os gêneros brasileiros do dump de 30k músicas'),
+    Stage('validate_and_clean', 'ml/validate_and_clean_datasets.py',
+          inputs=['ml/datasets/kaggle_*_ml.csv'],
+          outputs=['ml/datasets/kaggle_*_ml_clean.csv'],
+          description='valida e limpa os datasets kaggle_*_ml'),
+    Stage('consolidate_knn', 'ml/consolidate_datasets_knn.py',
+          inputs=['ml/datasets/massive_brazil_spotify.csv', 'ml/datasets/spotify_114k/dataset.csv',
+                  'ml/datasets/master_*.csv', 'ml/datasets/kaggle_*_ml.csv',
+                  'ml/datasets/*_dataset.csv', 'ml/datasets/kaggle_brazilian_music.csv'],
+          outputs=['ml/datasets/consolidated_knn/*_consolidated.csv'],
+          code=['ml/knn_imputation.py', 'ml/track_keys.py'],
+          description='consolida por gênero com deduplicação e imputação KNN'),
+    Stage('consolidate_quality', 'ml/consolidate_quality.py',
+          inputs=['ml/datasets/master_*.csv', 'ml/datasets/kaggle_mpb.csv', 'ml/datasets/kaggle_*_ml.csv'],
+          outputs=['ml/datasets/ml_ready/*_ml_ready.csv'],
+          description='datasets ml_ready de alta qualidade'),
+    Stage('engineer_features', 'ml/engineer_features.py',
+          inputs=['ml/datasets/ml_ready/*_ml_ready.csv'],
+          outputs=['ml/datasets/ml_ready/*_ml_ready_enhanced.csv'],
+          code=['ml/feature_store.py'],
+          description='features derivadas (*_ml_ready_enhanced)'),
+    Stage('validate_labels', 'ml/validate_and_clean_labels.py',
+          inputs=['ml/datasets/ml_ready/mpb_ml_ready.csv', 'ml/datasets/ml_ready/rnb_brasil_ml_ready.csv'],
+          outputs=['ml/datasets/cleaned/*.csv'],
+          description='corrige rótulos de MPB e R&B'),
+    Stage('combine_final', 'ml/combine_final_datasets.py',
+          inputs=['ml/datasets/verified_hits_complete.csv', 'ml/datasets/mpb_rock_ml.csv',
+                  'ml/datasets/nova_mpb_ml.csv', 'ml/datasets/rnb_trap_ml.csv', 'ml/datasets/rnb_pop_ml.csv'],
+          outputs=['ml/datasets/mpb_rock_final.csv', 'ml/datasets/nova_mpb_final.csv',
+                   'ml/datasets/rnb_trap_final.csv', 'ml/datasets/rnb_pop_final.csv'],
+          description='junta hits verificados aos datasets das subcategorias'),
+    Stage('balance', 'ml/balance_datasets.py',
+          inputs=['ml/datasets/kaggle_mpb_ml.csv', 'ml/datasets/kaggle_rnb_ml.csv',
+                  'ml/datasets/mpb_rock_final.csv', 'ml/datasets/nova_mpb_final.csv',
+                  'ml/datasets/rnb_trap_final.csv', 'ml/datasets/rnb_pop_final.csv'],
+          outputs=['ml/datasets/*_balanced.csv'],
+          description='adiciona non-hits às subcategorias'),
+    Stage('train_enhanced', 'ml/retrain_enhanced.py',
+          inputs=['ml/datasets/ml_ready/*_enhanced.csv'],
+          outputs=['ml/models/enhanced_models_summary.csv'],
+          code=['ml/training.py'],
+          description='modelos com as features derivadas'),
+    Stage('train_knn', 'ml/retrain_all_models_knn.py',
+          inputs=['ml/datasets/consolidated_knn/*_consolidated.csv'],
+          outputs=['ml/datasets/consolidated_knn/training_report.md'],
+          code=['ml/training.py'],
+          description='modelos por gênero a partir dos consolidados KNN'),
+]
+
+STAGES_BY_NAME = {s.name: s for s in STAGES}
+
+
+def _overlaps(a, b):
+    """Dois padrões glob podem casar o mesmo arquivo"""
+    return a == b or fnmatch.fnmatchcase(a, b) or fnmatch.fnmatchcase(b, a)
+
+
+def dependencies(stages=STAGES):
+    """{etapa: [etapas cujas saídas ela lê]}, na ordem declarada"""
+    deps = {}
+    for stage in stages:
+        deps[stage.name] = [
+            other.name for other in stages
+            if other is not stage and any(_overlaps(i, o) for i in stage.inputs for o in other.outputs)
+        ]
+    return deps
+
+
+def topological_order(names, deps):
+    """Ordem de execução (upstream primeiro); ValueError se houver ciclo"""
+    order, state = [], {}
+
+    def visit(name, path):
+        if state.get(name) == 'done':
+            return
+        if state.get(name) == 'visiting':
+            raise ValueError(f"Ciclo no pipeline: {' -> '.join(path + [name])}")
+        state[name] = 'visiting'
+        for dep in deps[name]:
+            visit(dep, path + [name])
+        state[name] = 'done'
+        order.append(name)
+
+    for name in names:
+        visit(name, [])
+    return order
+
+
+def expand(patterns, root=PROJECT_ROOT):
+    """Arquivos existentes que casam com os padrões (caminhos relativos, ordenados)"""
+    files = set()
+    for pattern in patterns:
+        for path in root.glob(pattern):
+            if path.is_file():
+                files.add(path.relative_to(root).as_posix())
+    return sorted(files)
+
+
+class FileHasher:
+    """Hash de conteúdo com cache por (tamanho, mtime) entre execuções"""
+
+    def __init__(self, cache=None, root=PROJECT_ROOT):
+        self.root = root
+        self.cache = dict(cache or {})
+        self._lock = threading.Lock()
+
+    def hash(self, relative):
+        path = self.root / relative
+        stat = path.stat()
+        signature = [stat.st_size, stat.st_mtime_ns]
+        with self._lock:
+            cached = self.cache.get(relative)
+        if cached and cached[:2] == signature:
+            return cached[2]
+
+        digest = hashlib.blake2b(digest_size=16)
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        value = digest.hexdigest()
+        with self._lock:
+            self.cache[relative] = signature + [value]
+        return value
+
+
+class Pipeline:
+    """
+    Plano e execução das etapas.
+
+    Uso:
+        pipeline = Pipeline()
+        for item in pipeline.plan(): ...
+        pipeline.run(workers=2)
+    """
+
+    def __init__(self, stages=STAGES, root=PROJECT_ROOT, state_dir=STATE_DIR):
+        self.stages = {s.name: s for s in stages}
+        self.deps = dependencies(stages)
+        self.root = Path(root)
+        self.state_dir = Path(state_dir)
+        self.state_path = self.state_dir / 'state.json'
+        self.state = self._load_state()
+        self.hasher = FileHasher(self.state.get('files'), self.root)
+        self._lock = threading.Lock()
+
+    def _load_state(self):
+        try:
+            state = json.loads(self.state_path.read_text(encoding='utf-8'))
+            if state.get('version') == _STATE_VERSION:
+                return state
+        except (OSError, ValueError):
+            pass
+        return {'version': _STATE_VERSION, 'stages': {}, 'files': {}}
+
+    def _save_state(self):
+        with self._lock:
+            self.state['files'] = dict(self.hasher.cache)
+            self.state_dir.mkdir(parents=True, exist_ok=True)
+            tmp = self.state_path.with_suffix('.tmp')
+            tmp.write_text(json.dumps(self.state, indent=2, sort_keys=True), encoding='utf-8')
+            os.replace(tmp, self.state_path)
+
+    def fingerprint(self, name):
+        """{'script': hash do script + módulos, 'inputs': {arquivo: hash}} com o conteúdo atual"""
+        stage = self.stages[name]
+        code = [stage.script] + [c for c in stage.code if (self.root / c).exists()]
+        script = hashlib.blake2b('|'.join(self.hasher.hash(c) for c in code).encode(), digest_size=16)
+        return {
+            'script': script.hexdigest(),
+            'inputs': {f: self.hasher.hash(f) for f in expand(stage.inputs, self.root)},
+        }
+
+    def status(self, name, force=False):
+        """(desatualizada?, motivo) comparando com a última execução bem-sucedida"""
+        stage = self.stages[name]
+        if not (self.root / stage.script).exists():
+            return False, 'script não encontrado'
+        current = self.fingerprint(name)
+        if stage.inputs and not current['inputs']:
+            return False, 'sem entradas'
+        if force:
+            return True, 'forçada'
+
+        last = self.state['stages'].get(name)
+        if last is None:
+            return True, 'nunca executada'
+        missing = [o for o in stage.outputs if not expand([o], self.root)]
+        if missing:
+            return True, f"saída ausente: {', '.join(missing)}"
+        if last['script'] != current['script']:
+            return True, 'script alterado'
+        changed = sorted(f for f in set(current['inputs']) | set(last['inputs'])
+                         if current['inputs'].get(f) != last['inputs'].get(f))
+        if changed:
+            more = f' (+{len(changed) - 3})' if len(changed) > 3 else ''
+            return True, f"entradas alteradas: {', '.join(changed[:3])}{more}"
+        return False, 'atualizada'
+
+    def targets(self, names=None):
+        """Etapas pedidas e tudo o que elas precisam, em ordem de execução"""
+        if names:
+            unknown = [n for n in names if n not in self.stages]
+            if unknown:
+                raise KeyError(f"Etapa(s) desconhecida(s): {', '.join(unknown)}")
+            requested = set(names)
+        else:
+            requested = {n for n, s in self.stages.items() if not s.manual}
+        declared = list(self.stages)
+        order = topological_order(sorted(requested, key=declared.index), self.deps)
+        # Etapas manuais só entram quando pedidas pelo nome
+        return [n for n in order if n in requested or not self.stages[n].manual]
+
+    def plan(self, names=None, force=False):
+        """
+        [{'stage', 'action', 'reason'}] sem executar nada. action: 'run',
+        'skip' (atualizada/sem entradas) ou 'after' (depende de uma etapa que vai rodar).
+        """
+        plan, will_run = [], set()
+        for name in self.targets(names):
+            stale, reason = self.status(name, force)
+            upstream = [d for d in self.deps[name] if d in will_run]
+            if stale:
+                action = 'run'
+            elif upstream and reason != 'script não encontrado':
+                action, reason = 'after', f"depende de {', '.join(upstream)}"
+            else:
+                action = 'skip'
+            if action in ('run', 'after'):
+                will_run.add(name)
+            plan.append({'stage': name, 'action': action, 'reason': reason})
+        return plan
+
+    def touch(self, names=None):
+        """
+        Registra o estado atual como executado sem rodar nada (adotar saídas que
+        já existem). Só etapas com todas as saídas presentes.
+        """
+        touched = []
+        for name in self.targets(names):
+            stage = self.stages[name]
+            if not (self.root / stage.script).exists() or not all(expand([o], self.root) for o in stage.outputs):
+                continue
+            self.state['stages'][name] = dict(self.fingerprint(name), finished='touch', seconds=0)
+            touched.append(name)
+        self._save_state()
+        return touched
+
+    def _execute(self, name):
+        stage = self.stages[name]
+        log_dir = self.state_dir / 'logs'
+        log_dir.mkdir(parents=True, exist_ok=True)
+        log_path = log_dir / f'{name}.log'
+        env = dict(os.environ, PYTHONIOENCODING='utf-8')
+        start = time.time()
+        with open(log_path, 'w', encoding='utf-8') as log:
+            result = subprocess.run([sys.executable, stage.script], cwd=self.root, env=env,
+                                    stdout=log, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL)
+        return result.returncode, time.time() - start, log_path
+
+    def run(self, names=None, force=False, workers=None):
+        """
+        Executa as etapas desatualizadas, em paralelo quando independentes.
+        A decisão de cada etapa é tomada quando todas as dependências terminaram
+        (uma etapa upstream que regravou arquivos iguais não força o resto).
+        """
+        order = self.targets(names)
+        workers = workers or min(len(order), os.cpu_count() or 1) or 1
+        pending = set(order)
+        done, failed, results = set(), set(), []
+        running = {}
+
+        def ready(name):
+            # Dependências fora do conjunto pedido (ex.: etapas manuais) não bloqueiam
+            return all(d in done for d in self.deps[name] if d in order)
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            while pending or running:
+                for name in [n for n in order if n in pending]:
+                    blocked = [d for d in self.deps[name] if d in failed]
+                    if blocked:
+                        pending.discard(name)
+                        failed.add(name)
+                        results.append({'stage': name, 'action': 'blocked',
+                                        'reason': f"falhou: {', '.join(blocked)}"})
+                        print(f"  [AVISO] {name}: não executada (falhou {', '.join(blocked)})")
+                        continue
+                    if not ready(name) or len(running) >= workers:
+                        continue
+                    pending.discard(name)
+                    stale, reason = self.status(name, force)
+                    if not stale:
+                        done.add(name)
+                        results.append({'stage': name, 'action': 'skip', 'reason': reason})
+                        print(f"  [OK] {name}: {reason}")
+                        continue
+                    fingerprint = self.fingerprint(name)
+                    print(f"  [RUN] {name}: {reason}")
+                    running[pool.submit(self._execute, name)] = (name, fingerprint, reason)
+
+                if not running:
+                    if pending:
+                        raise RuntimeError(f"Etapas sem como prosseguir: {', '.join(sorted(pending))}")
+                    continue
+                finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name, fingerprint, reason = running.pop(future)
+                    code, seconds, log_path = future.result()
+                    if code == 0:
+                        done.add(name)
+                        with self._lock:
+                            self.state['stages'][name] = dict(fingerprint, finished=time.strftime('%Y-%m-%d %H:%M:%S'),
+                                                              seconds=round(seconds, 1))
+                        self._save_state()
+                        print(f"  [OK] {name}: concluída em {seconds:.1f}s")
+                        results.append({'stage': name, 'action': 'run', 'reason': reason, 'seconds': seconds})
+                    else:
+                        failed.add(name)
+                        print(f"  [ERRO] {name}: código {code} em {seconds:.1f}s (log: {log_path})")
+                        results.append({'stage': name, 'action': 'failed', 'reason': f'código {code}',
+                                        'seconds': seconds, 'log': str(log_path)})
+
+        self._save_state()
+        return results
+
+
+def print_plan(plan):
+    labels = {'run': 'RODAR', 'after': 'TALVEZ', 'skip': '-'}
+    for item in plan:
+        label = 'OK' if item['reason'] == 'atualizada' else labels[item['action']]
+        print(f"  {label:<7} {item['stage']:<24} {item['reason']}")
+    to_run = sum(1 for i in plan if i['action'] == 'run')
+    maybe = sum(1 for i in plan if i['action'] == 'after')
+    print(f"\n  {to_run} etapa(s) a executar, {maybe} dependendo do resultado delas")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('stages', nargs='*', help='etapas (padrão: todas as não manuais)')
+    parser.add_argument('--dry-run', action='store_true', help='só mostra o plano')
+    parser.add_argument('--force', action='store_true', help='executa mesmo se atualizada')
+    parser.add_argument('--workers', type=int, default=None, help='etapas em paralelo')
+    parser.add_argument('--list', action='store_true', help='lista as etapas e dependências')
+    parser.add_argument('--touch', action='store_true',
+                        help='marca como atualizadas as etapas cujas saídas já existem, sem executar')
+    args = parser.parse_args()
+
+    pipeline = Pipeline()
+
+    if args.list:
+        for stage in STAGES:
+            deps = ', '.join(pipeline.deps[stage.name]) or '-'
+            manual = ' (manual)' if stage.manual else ''
+            print(f"  {stage.name:<24} {stage.script:<42} depende de: {deps}{manual}")
+            if stage.description:
+                print(f"  {'':<24} {stage.description}")
+        return
+
+    if args.touch:
+        touched = pipeline.touch(args.stages)
+        print(f"  Marcadas como atualizadas: {', '.join(touched) or 'nenhuma'}")
+        return
+
+    print("=" * 70)
+    print("PIPELINE DE DADOS" + (" - PLANO" if args.dry_run else ""))
+    print("=" * 70 + "\n")
+
+    try:
+        if args.dry_run:
+            print_plan(pipeline.plan(args.stages, args.force))
+            return
+        results = pipeline.run(args.stages, args.force, args.workers)
+    except (KeyError, ValueError, RuntimeError) as e:
+        print(f"[ERRO] {e}")
+        sys.exit(2)
+
+    failed = [r['stage'] for r in results if r['action'] in ('failed', 'blocked')]
+    ran = sum(1 for r in results if r['action'] == 'run')
+    print(f"\n  {ran} executada(s), {len(results) - ran - len(failed)} atualizada(s), {len(failed)} com falha")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
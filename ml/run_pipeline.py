@@ -104,41 +104,23 @@ def collect_data():
         return False
 
 def train_models():
-    """Treina modelos ML"""
+    """Treina modelos ML (etapas de treino do pipeline incremental, ml/pipeline.py)"""
     print_header("Treinamento de Modelos")
     
-    from train_model import ModelTrainer
+    from pipeline import Pipeline, print_plan
     
-    datasets = []
-    if os.path.exists('datasets/mpb_dataset.csv'):
-        datasets.append(('MPB', 'datasets/mpb_dataset.csv'))
-    if os.path.exists('datasets/rnb_brasil_dataset.csv'):
-        datasets.append(('R&B Brasil', 'datasets/rnb_brasil_dataset.csv'))
+    pipeline = Pipeline()
+    targets = ['train_knn', 'train_enhanced']
+    print_plan(pipeline.plan(targets))
+    print()
+    # Uma etapa por vez: cada uma já usa todos os núcleos (TRAIN_CPU_BUDGET)
+    results = pipeline.run(targets, workers=1)
     
-    if not datasets:
-        print("✗ Nenhum dataset encontrado!")
-        print("Execute a coleta de dados primeiro.")
+    failed = [r['stage'] for r in results if r['action'] in ('failed', 'blocked')]
+    if failed:
+        print(f"\n✗ Etapas com falha: {', '.join(failed)} (logs em ml/.pipeline/logs/)")
         return False
     
-    for genre_name, dataset_path in datasets:
-        print(f"\n--- Treinando {genre_name} ---")
-        
-        try:
-            trainer = ModelTrainer(dataset_path)
-            trainer.load_dataset()
-            trainer.prepare_data()
-            trainer.train_random_forest(n_estimators=100, max_depth=10)
-            metrics = trainer.evaluate()
-            
-            if metrics['accuracy'] > 0.70:
-                trainer.save_model()
-                print(f"✓ Modelo {genre_name} salvo com sucesso!")
-            else:
-                print(f"⚠ Performance de {genre_name} abaixo do esperado")
-                
-        except Exception as e:
-            print(f"✗ Erro ao treinar {genre_name}: {e}")
-    
     print("\n✓ Treinamento concluído!")
     return True
 
@@ -0,0 +1,330 @@
+"""
+Chaves normalizadas de faixa/artista e índices para deduplicação e busca
+
+As bases misturam 'Marília Mendonça' e 'MARILIA MENDONCA', 'Evidências' e
+'Evidencias (feat. X)', 'Anitta;MC Kevinho' e 'Anitta, MC Kevinho'. Aqui fica
+a normalização única (sem acentos, minúscula, sem créditos '(feat. ...)' e
+tags de remaster, só [a-z0-9] separados por espaço), aplicada em colunas
+inteiras do pandas, e três índices construídos uma vez por tabela. Versões
+('Ao Vivo', 'Acústico', 'Remix') continuam na chave: têm áudio diferente.
+
+    KeyIndex      hash 64 bits da chave -> linhas (busca exata e duplicatas)
+    TokenIndex    palavra -> linhas (busca de artista/termo sem varrer a tabela)
+    FuzzyMatcher  blocos (artista ou início da palavra) + difflib dentro do bloco
+
+Uso:
+    keys = track_key(df['track_name'], artist_column(df))
+    df = df[~KeyIndex(keys).duplicated()]
+    rows = TokenIndex(df['track_artist']).search('marilia mendonca')
+"""
+import difflib
+import re
+
+import numpy as np
+import pandas as pd
+
+ARTIST_COLUMNS = ('artists', 'artist_names', 'artist', 'artist_name', 'track_artist')
+TITLE_COLUMNS = ('track_name', 'name', 'title')
+
+_NON_ALNUM = r'[^a-z0-9]+'
+
+
+def _on_uniques(values, transform):
+    """Aplica a transformação de texto só aos valores distintos (nomes se repetem muito)"""
+    values = pd.Series(values)
+    codes, uniques = pd.factorize(values.astype('string').fillna(''))
+    done = transform(pd.Series(uniques, dtype='string')).to_numpy(dtype=object)
+    return pd.Series(done[codes] if len(done) else np.full(len(codes), '', dtype=object),
+                     index=values.index, dtype='string')
+
+
+def _fold(values):
+    return (values.str.normalize('NFKD').str.encode('ascii', 'ignore').str.decode('ascii')
+            .str.lower()
+            .str.replace(_NON_ALNUM, ' ', regex=True)
+            .str.strip())
+
+
+def fold(values):
+    """Sem acentos, minúsculas, só [a-z0-9] separados por um espaço"""
+    return _on_uniques(values, _fold)
+
+
+def fold_text(text):
+    """fold() de uma string solta (termos de busca)"""
+    return fold([text]).iloc[0]
+
+
+# Créditos de participação: '(feat. X)', '[ft. X]', '(Part. X)' ou 'feat. X' solto no fim
+_FEAT_GROUP = r'[\(\[]\s*(?:feat|ft|featuring|part)\b[^\)\]]*[\)\]]'
+_FEAT_TAIL = r'\s(?:feat|ft|featuring)\b\.?\s.*$'
+# Tags de remasterização: '(Remastered 2011)', ' - 2011 Remaster'
+_REMASTER_GROUP = r'[\(\[][^\)\]]*\bremaster[^\)\]]*[\)\]]'
+_REMASTER_TAIL = r'\s-\s[^-]*\bremaster.*$'
+
+
+def _normalize_title(titles):
+    return (titles.str.normalize('NFKD').str.encode('ascii', 'ignore').str.decode('ascii')
+            .str.lower()
+            .str.replace(_FEAT_GROUP, ' ', regex=True)
+            .str.replace(_REMASTER_GROUP, ' ', regex=True)
+            .str.replace(_REMASTER_TAIL, '', regex=True)
+            .str.replace(_FEAT_TAIL, '', regex=True)
+            .str.replace(_NON_ALNUM, ' ', regex=True)
+            .str.strip())
+
+
+def normalize_title(titles):
+    """
+    Título sem acentos, créditos '(feat. ...)', tags de remaster e pontuação.
+    Versões ficam: 'X (Ao Vivo)' e 'X - Ao Vivo' viram 'x ao vivo', distinta de 'x'.
+    """
+    return _on_uniques(titles, _normalize_title)
+
+
+def normalize_artist(artists):
+    """Primeiro artista creditado ('A;B' nos datasets, 'A, B' nas paradas), normalizado"""
+    return _on_uniques(artists, lambda a: _fold(a.str.split(r'\s*[;,]\s*', n=1, regex=True).str[0]))
+
+
+def track_key(titles, artists):
+    """Chave título|artista principal (vazia se faltar o título)"""
+    title = normalize_title(titles)
+    key = title + '|' + normalize_artist(artists).to_numpy()
+    return key.where(title != '', '')
+
+
+def spotify_uris(ids):
+    ids = pd.Series(ids).astype('string').fillna('').str.strip()
+    return ids.where(ids.str.startswith('spotify:track:') | (ids == ''), 'spotify:track:' + ids)
+
+
+def title_column(df):
+    return next((c for c in TITLE_COLUMNS if c in df.columns), None)
+
+
+def artist_column(df):
+    """Primeiro artista não vazio entre as colunas de artista (bases concatenadas misturam os nomes)"""
+    columns = [c for c in ARTIST_COLUMNS if c in df.columns]
+    if not columns:
+        return pd.Series('', index=df.index, dtype='string')
+    artists = df[columns[0]].astype('string').fillna('')
+    for column in columns[1:]:
+        artists = artists.where(artists != '', df[column].astype('string').fillna(''))
+    return artists
+
+
+def hash_keys(keys):
+    """Hash 64 bits (estável entre execuções) de cada chave"""
+    return pd.util.hash_array(pd.Series(keys).astype(str).to_numpy(dtype=object), categorize=True)
+
+
+class KeyIndex:
+    """
+    Chaves ordenadas por hash: lookup por busca binária em vez de comparar strings.
+    Chaves vazias nunca casam (linhas sem título não são deduplicadas).
+    """
+
+    def __init__(self, keys):
+        keys = pd.Series(keys).astype('string').fillna('').reset_index(drop=True)
+        self.keys = keys.to_numpy(dtype=object)
+        hashes = hash_keys(keys)
+        valid = np.flatnonzero(keys.to_numpy(dtype=object) != '')
+        order = valid[np.argsort(hashes[valid], kind='stable')]
+        self._hashes = hashes[order]
+        self._rows = order
+
+    def __len__(self):
+        return len(self.keys)
+
+    def lookup(self, keys):
+        """Primeira linha (na ordem original) de cada chave, ou -1"""
+        keys = pd.Series(keys).astype('string').fillna('')
+        hashes = hash_keys(keys)
+        pos = np.searchsorted(self._hashes, hashes)
+        pos_clipped = np.minimum(pos, max(len(self._hashes) - 1, 0))
+        if not len(self._hashes):
+            return np.full(len(keys), -1, dtype=np.int64)
+        rows = self._rows[pos_clipped]
+        found = (pos < len(self._hashes)) & (self._hashes[pos_clipped] == hashes) & (keys.to_numpy(dtype=object) != '')
+        # Colisão de hash: confere a string de fato
+        found &= self.keys[rows] == keys.to_numpy(dtype=object)
+        return np.where(found, rows, -1)
+
+    def rows(self, key):
+        """Todas as linhas com a chave"""
+        h = hash_keys([key])[0]
+        lo = np.searchsorted(self._hashes, h, side='left')
+        hi = np.searchsorted(self._hashes, h, side='right')
+        candidates = self._rows[lo:hi]
+        return np.sort(candidates[self.keys[candidates] == key])
+
+    def duplicated(self):
+        """True nas repetições de uma chave já vista (mantém a primeira, como drop_duplicates)"""
+        dup = np.zeros(len(self.keys), dtype=bool)
+        if len(self._hashes) > 1:
+            same = self._hashes[1:] == self._hashes[:-1]
+            # A ordenação estável mantém a primeira ocorrência na frente de cada grupo
+            candidates = np.flatnonzero(same) + 1
+            rows = self._rows[candidates]
+            previous = self._rows[candidates - 1]
+            dup[rows] = self.keys[rows] == self.keys[previous]
+        return dup
+
+
+class TokenIndex:
+    """
+    Índice invertido palavra -> linhas sobre um texto normalizado.
+
+    search('jorge & mateus') intersecta as listas de 'jorge' e 'mateus' e só
+    confere a frase exata nas linhas candidatas.
+    """
+
+    def __init__(self, texts):
+        self.texts = fold(texts).reset_index(drop=True)
+        tokens = self.texts.str.split(' ').explode()
+        tokens = tokens[tokens.notna() & (tokens != '')]
+        rows = tokens.index.to_numpy(dtype=np.int64)
+        codes, self.vocabulary = pd.factorize(tokens.to_numpy(dtype=object))
+        order = np.argsort(codes, kind='stable')
+        self._rows = rows[order]
+        self._bounds = np.searchsorted(codes[order], np.arange(len(self.vocabulary) + 1))
+        self._token_ids = pd.Index(self.vocabulary)
+        self._sorted_vocabulary = np.sort(np.asarray(self.vocabulary, dtype=str))
+
+    def __len__(self):
+        return len(self.texts)
+
+    def token_rows(self, token):
+        pos = self._token_ids.get_indexer([token])[0]
+        if pos < 0:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(self._rows[self._bounds[pos]:self._bounds[pos + 1]])
+
+    def search(self, term, prefix=False):
+        """
+        Linhas cujo texto contém o termo como palavras inteiras e em sequência.
+        prefix=True aceita a última palavra como prefixo ('luedji' acha 'luedji luna',
+        'lini' acha 'liniker').
+        """
+        words = fold_text(term).split()
+        if not words:
+            return np.empty(0, dtype=np.int64)
+
+        postings = [self.token_rows(w) for w in words[:-1]]
+        last = words[-1]
+        if prefix:
+            lo, hi = np.searchsorted(self._sorted_vocabulary, [last, last + '~'])
+            matches = self._sorted_vocabulary[lo:hi]
+            postings.append(np.unique(np.concatenate([self.token_rows(t) for t in matches]))
+                            if len(matches) else np.empty(0, dtype=np.int64))
+        else:
+            postings.append(self.token_rows(last))
+
+        candidates = postings[0]
+        for p in postings[1:]:
+            candidates = np.intersect1d(candidates, p, assume_unique=True)
+        if len(words) == 1 or not len(candidates):
+            return candidates
+
+        phrase = re.escape(' '.join(words)) + (r'' if prefix else r'\b')
+        texts = self.texts.iloc[candidates]
+        return candidates[texts.str.contains(r'\b' + phrase, regex=True).to_numpy(dtype=bool)]
+
+    def search_any(self, terms, prefix=False):
+        """Linhas que casam com qualquer um dos termos"""
+        found = [self.search(t, prefix=prefix) for t in terms]
+        return np.unique(np.concatenate(found)) if found else np.empty(0, dtype=np.int64)
+
+    def mask(self, terms, prefix=False):
+        mask = np.zeros(len(self.texts), dtype=bool)
+        mask[self.search_any(terms, prefix=prefix)] = True
+        return mask
+
+
+def _block(key):
+    if '|' in key:
+        return key.rsplit('|', 1)[1] or key[:2]
+    return key[:2]
+
+
+class FuzzyMatcher:
+    """
+    Casamento aproximado de chaves em blocos: só compara (difflib) chaves do
+    mesmo bloco, em vez do produto de todas contra todas. O bloco de uma chave
+    título|artista é o artista; de um texto solto, as duas primeiras letras.
+    Chaves com números diferentes nunca casam ('sample 2' x 'sample 3', 'vol 1' x 'vol 2').
+    """
+
+    def __init__(self, keys, threshold=0.9):
+        self.keys = pd.Series(keys).astype('string').fillna('').reset_index(drop=True)
+        self.threshold = threshold
+        self._digits = self.keys.str.replace(r'\D+', '', regex=True).to_numpy(dtype=object)
+        blocks = self.keys.map(_block)
+        self._blocks = {b: rows.to_numpy(dtype=np.int64)
+                        for b, rows in self.keys.index.to_series().groupby(blocks.to_numpy(dtype=object))
+                        if b != ''}
+
+    def _similar(self, matcher, row, digits):
+        """matcher já tem a chave de busca em b; compara com a linha (filtros baratos primeiro)"""
+        if self._digits[row] != digits:
+            return 0.0
+        matcher.set_seq1(self.keys.iat[row])
+        if matcher.real_quick_ratio() < self.threshold or matcher.quick_ratio() < self.threshold:
+            return 0.0
+        return matcher.ratio()
+
+    def match(self, key, exclude=None):
+        """(linha, similaridade) da chave mais parecida do bloco, ou (-1, 0.0)"""
+        block = _block(key)
+        best, best_ratio = -1, 0.0
+        matcher = difflib.SequenceMatcher(b=key, autojunk=False)
+        digits = re.sub(r'\D+', '', key)
+        for row in self._blocks.get(block, ()):
+            if row == exclude:
+                continue
+            ratio = self._similar(matcher, row, digits)
+            if ratio > best_ratio:
+                best, best_ratio = row, ratio
+        return (best, best_ratio) if best_ratio >= self.threshold else (-1, 0.0)
+
+    def match_many(self, keys):
+        """Linha mais parecida para cada chave (-1 sem match)"""
+        return np.array([self.match(k)[0] if k else -1 for k in pd.Series(keys).astype('string').fillna('')],
+                        dtype=np.int64)
+
+    def near_duplicates(self):
+        """
+        Linhas que são quase iguais a uma linha anterior do mesmo bloco
+        (ex.: 'evidencia|chitaozinho e xororo' x 'evidencias|chitaozinho e xororo').
+        """
+        dup = np.zeros(len(self.keys), dtype=bool)
+        for rows in self._blocks.values():
+            kept = []
+            for row in rows:
+                matcher = difflib.SequenceMatcher(b=self.keys.iat[row], autojunk=False)
+                for other in kept:
+                    if self._similar(matcher, other, self._digits[row]) >= self.threshold:
+                        dup[row] = True
+                        break
+                else:
+                    kept.append(row)
+        return dup
+
+
+def deduplicate(df, fuzzy_threshold=None):
+    """
+    Remove repetições de título|artista principal (mantém a primeira).
+    Linhas sem título ficam. Com fuzzy_threshold, também remove quase-duplicatas
+    dentro de cada bloco.
+    """
+    title = title_column(df)
+    if title is None:
+        return df, 0
+    keys = track_key(df[title], artist_column(df)).reset_index(drop=True)
+    dup = KeyIndex(keys).duplicated()
+    if fuzzy_threshold:
+        remaining = np.flatnonzero(~dup & (keys.to_numpy(dtype=object) != ''))
+        near = FuzzyMatcher(keys.iloc[remaining], fuzzy_threshold).near_duplicates()
+        dup[remaining[near]] = True
+    return df[~dup], int(dup.sum())
@@ -0,0 +1,470 @@
+"""
+Treino dos modelos por gênero/subcategoria com orçamento global de CPU
+
+Os retrain_*.py treinam um gênero depois do outro e cada RandomForest (e cada
+cross_val_score) usa n_jobs=-1 por conta própria: dois scripts ao mesmo tempo
+disputam todos os núcleos. Aqui os jobs de treino vão para um pool de
+processos que respeita um orçamento único de núcleos (--cores ou
+TRAIN_CPU_BUDGET): cada job recebe um número de threads para a floresta e
+os núcleos liberados vão para os próximos jobs (os maiores datasets primeiro).
+
+Cada dataset é lido uma vez; o split treino/teste e as dobras de validação
+cruzada são calculados uma vez por dataset e compartilhados pelos jobs que o
+usam. Modelos (.pkl), metadados (_metadata.txt) e o resumo (CSV) são gravados
+de forma atômica (arquivo temporário + rename), então o HitPredictor nunca
+lê um arquivo pela metade.
+
+Com --search os parâmetros de cada floresta saem de uma busca por
+successive halving (ml/param_search.py) sobre a parte de treino, com
+cache por dobra; os escolhidos vão para o metadata do modelo. Com
+--incremental, o último modelo de cada job ganha árvores ajustadas com as
+músicas novas (ml/incremental.py) e só volta ao treino completo se a
+validação piorar. Com --compact, cada modelo novo ganha uma variante menor
+dentro de um orçamento de tamanho/latência (ml/compact_models.py).
+
+Conjuntos de jobs:
+    genres          7 gêneros, datasets consolidated_knn
+    subcategories   nova_mpb, rnb_trap, rnb_pop (datasets/*_ml.csv)
+    enhanced        ml_ready/*_ml_ready_enhanced.csv (features derivadas)
+
+Uso:
+    python ml/training.py [genres subcategories enhanced] [--cores N] [--only mpb ...] [--search] [--incremental] [--compact]
+"""
+import argparse
+import io
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+import pandas as pd
+
+DATASETS_DIR = PROJECT_ROOT / 'ml' / 'datasets'
+MODELS_DIR = PROJECT_ROOT / 'ml' / 'models'
+SUMMARY_PATH = MODELS_DIR / 'training_summary.csv'
+
+# Mesmas features (e ordem) do HitPredictor
+ML_FEATURES = ['bpm', 'energy', 'danceability', 'valence',
+               'acousticness', 'instrumentalness', 'liveness',
+               'speechiness', 'loudness']
+
+# Colunas criadas por engineer_features.py
+ENGINEERED_FEATURES = ['groove_factor', 'commercial_appeal', 'energy_dance_ratio', 'vocal_presence',
+                       'bpm_category', 'loudness_normalized', 'hit_potential_score',
+                       'acoustic_electric_balance', 'is_music']
+
+RANDOM_STATE = 42
+CV_FOLDS = 5
+MIN_ROWS = 20
+
+
+def default_cores():
+    try:
+        return max(1, int(os.environ.get('TRAIN_CPU_BUDGET', '')))
+    except ValueError:
+        return os.cpu_count() or 1
+
+
+class TrainJob:
+    """Um modelo a treinar: dataset, parâmetros da floresta e nome do arquivo"""
+
+    def __init__(self, name, dataset, label, model_prefix, n_estimators=200, max_depth=15,
+                 min_samples_split=2, min_samples_leaf=1, min_accuracy=0.6, test_size=None,
+                 features=ML_FEATURES, kind='genre'):
+        self.name = name
+        self.dataset = Path(dataset)
+        self.label = label
+        self.model_prefix = model_prefix
+        self.params = {'n_estimators': n_estimators, 'max_depth': max_depth,
+                       'min_samples_split': min_samples_split, 'min_samples_leaf': min_samples_leaf}
+        self.min_accuracy = min_accuracy
+        self.test_size = test_size
+        self.features = list(features)
+        self.kind = kind
+
+
+def genre_jobs():
+    """Os 7 gêneros (mesma configuração de retrain_all_models_knn.py)"""
+    folder = DATASETS_DIR / 'consolidated_knn'
+    config = [
+        ('mpb', 'MPB', 200, 15, 0.65),
+        ('rnb_brasil', 'R&B Brasil', 200, 15, 0.65),
+        ('sertanejo', 'Sertanejo', 150, 12, 0.60),
+        ('pop_urban_brasil', 'Pop Urban Brasil', 150, 12, 0.60),
+        ('forro', 'Forró', 150, 12, 0.60),
+        ('samba', 'Samba', 150, 12, 0.60),
+        ('pagode', 'Pagode', 150, 12, 0.60),
+    ]
+    return [TrainJob(genre, folder / f'{genre}_consolidated.csv', label, f'{genre}_RandomForestClassifier',
+                     n_estimators=trees, max_depth=depth, min_accuracy=min_accuracy, kind='genre')
+            for genre, label, trees, depth, min_accuracy in config]
+
+
+def subcategory_jobs():
+    """Subcategorias (mesma configuração de retrain_subcategories.py)"""
+    # mpb_rock tem poucas músicas para um modelo próprio
+    return [TrainJob(sub, DATASETS_DIR / f'{sub}_ml.csv', sub.upper().replace('_', ' '),
+                     f'{sub}_RandomForest_enhanced', n_estimators=200, max_depth=10,
+                     min_samples_split=5, min_samples_leaf=2, test_size=0.2, kind='subcategory')
+            for sub in ('nova_mpb', 'rnb_trap', 'rnb_pop')]
+
+
+def enhanced_jobs():
+    """Um job por ml_ready/*_ml_ready_enhanced.csv (features básicas + derivadas)"""
+    return [TrainJob(path.stem.replace('_ml_ready_enhanced', ''), path,
+                     path.stem.replace('_ml_ready_enhanced', '').upper(),
+                     f"{path.stem.replace('_ml_ready_enhanced', '')}_RandomForest_enhanced",
+                     n_estimators=200, max_depth=15, test_size=0.25,
+                     features=ML_FEATURES + ENGINEERED_FEATURES, kind='enhanced')
+            for path in sorted((DATASETS_DIR / 'ml_ready').glob('*_ml_ready_enhanced.csv'))]
+
+
+JOB_SETS = {'genres': genre_jobs, 'subcategories': subcategory_jobs, 'enhanced': enhanced_jobs}
+
+
+class PreparedData:
+    """Matriz de um dataset + split treino/teste e dobras de CV compartilhados"""
+
+    def __init__(self, X, y, features, train_idx, test_idx, cv_splits, test_size, row_hashes=None,
+                 fill_values=None):
+        self.X = X
+        self.y = y
+        self.features = features
+        self.train_idx = train_idx
+        self.test_idx = test_idx
+        self.cv_splits = cv_splits
+        self.test_size = test_size
+        # Hash de cada linha (features brutas + rótulo): identifica músicas novas no retreino incremental
+        self.row_hashes = row_hashes
+        # Valor usado no lugar de cada feature faltante (média da coluna): vai para o
+        # metadata, para o HitPredictor preencher faltantes como no treino
+        self.fill_values = fill_values
+
+
+def _read_dataset(path):
+    try:
+        from ml.dataset_store import load_table, table_name
+        return load_table(table_name(path))
+    except (ImportError, ValueError, KeyError):
+        return pd.read_csv(path)
+
+
+def prepare(path, features, test_size=None):
+    """
+    Lê o dataset uma vez e calcula split e dobras. Features ausentes no
+    arquivo ficam de fora; faltantes são preenchidas com a média (como nos
+    retrain_*.py).
+    """
+    from sklearn.model_selection import StratifiedKFold, train_test_split
+
+    df = _read_dataset(path)
+    y = pd.to_numeric(df.get('is_hit'), errors='coerce')
+    df = df[y.notna()]
+    y = y[y.notna()].astype(int).to_numpy()
+
+    available = [f for f in features if f in df.columns]
+    numeric = df[available].apply(pd.to_numeric, errors='coerce')
+    fill_values = numeric.mean().fillna(0)
+    X = numeric.fillna(fill_values).to_numpy(dtype=np.float64)
+    row_hashes = pd.util.hash_pandas_object(numeric.assign(is_hit=y), index=False).to_numpy()
+
+    if test_size is None:
+        test_size = 0.2 if len(df) >= 100 else 0.3
+    minority = int(np.bincount(y, minlength=2).min()) if len(y) else 0
+    stratify = y if minority >= 2 else None
+    train_idx, test_idx = train_test_split(np.arange(len(y)), test_size=test_size,
+                                           random_state=RANDOM_STATE, stratify=stratify)
+
+    n_folds = min(CV_FOLDS, minority, max(2, len(y) // 10))
+    cv_splits = list(StratifiedKFold(n_splits=n_folds, shuffle=True, random_state=RANDOM_STATE).split(X, y)) \
+        if n_folds >= 2 else []
+    return PreparedData(X, y, available, train_idx, test_idx, cv_splits, test_size, row_hashes,
+                        {f: float(v) for f, v in fill_values.items()})
+
+
+def _atomic_write(path, write):
+    """Grava em <arquivo>.tmp e renomeia (leitores veem o arquivo antigo ou o novo inteiro)"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + '.tmp')
+    write(tmp)
+    os.replace(tmp, path)
+
+
+def _atomic_dump(obj, path):
+    import joblib
+    _atomic_write(path, lambda tmp: joblib.dump(obj, tmp))
+
+
+def _atomic_text(path, text):
+    _atomic_write(path, lambda tmp: tmp.write_text(text, encoding='utf-8'))
+
+
+def write_summary(results, path):
+    """Resumo das métricas (CSV) gravado atomicamente"""
+    buffer = io.StringIO()
+    pd.DataFrame(results).to_csv(buffer, index=False)
+    _atomic_text(path, buffer.getvalue())
+
+
+def holdout_scores(model, X_test, y_test):
+    from sklearn.metrics import accuracy_score, f1_score, precision_score, recall_score
+
+    y_pred = model.predict(X_test)
+    return {
+        'accuracy': accuracy_score(y_test, y_pred),
+        'precision': precision_score(y_test, y_pred, zero_division=0),
+        'recall': recall_score(y_test, y_pred, zero_division=0),
+        'f1': f1_score(y_test, y_pred, zero_division=0),
+    }
+
+
+def read_metadata(path):
+    """_metadata.txt como dicionário de strings"""
+    metadata = {}
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            key, sep, value = line.rstrip('\n').partition(': ')
+            if sep:
+                metadata[key] = value
+    return metadata
+
+
+def save_model(model, job, data, metrics, train_rows, test_rows, models_dir=MODELS_DIR, extra=None):
+    """
+    Grava <prefixo>_<timestamp>.pkl, _metadata.txt e _rows.npz (hashes das
+    linhas de treino e de teste) e completa metrics com o nome do modelo.
+    """
+    from ml.feature_store import feature_set_version
+
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    model_path = Path(models_dir) / f'{job.model_prefix}_{timestamp}.pkl'
+    while model_path.exists():
+        # Dois modelos no mesmo segundo (ex.: incremental logo após o completo) não se sobrescrevem
+        time.sleep(0.2)
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        model_path = Path(models_dir) / f'{job.model_prefix}_{timestamp}.pkl'
+    _atomic_dump(model, model_path)
+
+    metrics.update({
+        'genre': job.name,
+        'kind': job.kind,
+        'n_samples': len(data.y),
+        'n_features': len(data.features),
+        'timestamp': timestamp,
+        'model': model_path.name,
+    })
+    metadata = {
+        'genre': job.name,
+        'model_type': 'RandomForestClassifier',
+        'features': data.features,
+        'trained_at': timestamp,
+        'dataset_size': len(data.y),
+        'test_size': len(test_rows),
+        'dataset': job.dataset.name,
+        'params': metrics['params'],
+        'feature_set': feature_set_version(data.features),
+        **({'fill_values': data.fill_values} if data.fill_values is not None else {}),
+        **{k: metrics[k] for k in ('accuracy', 'precision', 'recall', 'f1', 'cv_mean', 'cv_std')},
+        **(extra or {}),
+    }
+    _atomic_text(model_path.with_name(f'{model_path.stem}_metadata.txt'),
+                 ''.join(f'{key}: {value}\n' for key, value in metadata.items()))
+    if data.row_hashes is not None:
+        def write_rows(tmp):
+            with open(tmp, 'wb') as f:
+                np.savez(f, train=data.row_hashes[train_rows], test=data.row_hashes[test_rows])
+        _atomic_write(model_path.with_name(f'{model_path.stem}_rows.npz'), write_rows)
+    return metrics
+
+
+def fit_job(job, data, n_jobs, models_dir=MODELS_DIR, search_dir=None):
+    """
+    Treina, avalia (teste + CV nas dobras compartilhadas) e salva o modelo de
+    um job. Com search_dir, os parâmetros vêm da busca por successive halving.
+    """
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.model_selection import cross_val_score
+
+    start = time.time()
+    params, search = dict(job.params), None
+    if search_dir is not None:
+        from ml.param_search import successive_halving
+        search = successive_halving(data.X, data.y, data.train_idx, job.params['n_estimators'],
+                                    Path(search_dir) / f'{job.model_prefix}.jsonl', n_jobs)
+        params.update(search['params'])
+
+    model = RandomForestClassifier(random_state=RANDOM_STATE, n_jobs=n_jobs, **params)
+    model.fit(data.X[data.train_idx], data.y[data.train_idx])
+
+    metrics = holdout_scores(model, data.X[data.test_idx], data.y[data.test_idx])
+    cv_scores = (cross_val_score(model, data.X, data.y, cv=data.cv_splits, n_jobs=1)
+                 if data.cv_splits else np.array([np.nan]))
+    metrics.update({'cv_mean': float(np.mean(cv_scores)), 'cv_std': float(np.std(cv_scores)),
+                    'n_jobs': n_jobs, 'params': params, 'mode': 'full'})
+    extra = {}
+    if search is not None:
+        metrics['search_score'] = search['score']
+        metrics['search_seconds'] = search['seconds']
+        extra['search'] = {k: search[k] for k in ('score', 'rounds', 'candidates',
+                                                  'folds_evaluated', 'folds_cached')}
+    metrics['seconds'] = round(time.time() - start, 2)
+    return save_model(model, job, data, metrics, data.train_idx, data.test_idx, models_dir, extra)
+
+
+def _fit_and_compact(fit, job, data, n_jobs, models_dir, search_dir):
+    """Treina e em seguida procura a variante compacta (ml/compact_models.py)"""
+    from ml.compact_models import compact_saved
+
+    metrics = fit(job, data, n_jobs, models_dir, search_dir)
+    if metrics.get('mode') != 'unchanged':
+        result = compact_saved(Path(models_dir) / metrics['model'], data)
+        metrics['compact_method'] = result['method']
+        if result['compact'] is not None:
+            metrics['compact_kb'] = result['compact']['size_kb']
+            metrics['compact_accuracy'] = result['compact']['accuracy']
+    return metrics
+
+
+def run_jobs(jobs, cores=None, models_dir=MODELS_DIR, summary_path=SUMMARY_PATH, verbose=True,
+             search_dir=None, incremental=False, compact=False):
+    """
+    Executa os jobs num pool de processos sem passar de `cores` threads no total.
+    Devolve (resultados, falhas) e grava o resumo em summary_path. Com
+    search_dir, cada job busca os próprios parâmetros antes de treinar; com
+    incremental, atualiza o último modelo (ml/incremental.py) em vez de
+    treinar do zero; com compact, cada modelo novo ganha a variante compacta.
+    """
+    cores = cores or default_cores()
+    if incremental:
+        from ml.incremental import update_job as fit
+    else:
+        fit = fit_job
+    log = print if verbose else (lambda *a, **k: None)
+
+    # Cada dataset é lido e dividido uma vez, mesmo com vários jobs sobre ele
+    prepared, queue, failed = {}, [], []
+    for job in jobs:
+        if not job.dataset.exists():
+            log(f"  [AVISO] {job.label}: dataset não encontrado ({job.dataset.name})")
+            failed.append({'genre': job.name, 'kind': job.kind, 'error': 'dataset não encontrado'})
+            continue
+        key = (str(job.dataset), tuple(job.features), job.test_size)
+        try:
+            if key not in prepared:
+                prepared[key] = prepare(job.dataset, job.features, job.test_size)
+        except Exception as e:
+            log(f"  [ERRO] {job.label}: {e}")
+            failed.append({'genre': job.name, 'kind': job.kind, 'error': str(e)})
+            continue
+        data = prepared[key]
+        if len(data.y) < MIN_ROWS or len(np.unique(data.y)) < 2:
+            log(f"  [AVISO] {job.label}: dataset pequeno ou com uma classe só ({len(data.y)} músicas)")
+            failed.append({'genre': job.name, 'kind': job.kind, 'error': 'dataset insuficiente'})
+            continue
+        queue.append((job, data))
+
+    # Maiores primeiro: os jobs longos começam cedo e os pequenos preenchem o fim
+    queue.sort(key=lambda item: len(item[1].y) * item[0].params['n_estimators'], reverse=True)
+    log(f"  {len(queue)} job(s), orçamento de {cores} núcleo(s)")
+
+    results, running, free = [], {}, cores
+    with ProcessPoolExecutor(max_workers=max(1, min(cores, len(queue)))) as pool:
+        while queue or running:
+            while queue and free > 0:
+                # Divide os núcleos livres entre os jobs que ainda podem começar
+                threads = max(1, free // min(len(queue), free))
+                job, data = queue.pop(0)
+                future = (pool.submit(_fit_and_compact, fit, job, data, threads, models_dir, search_dir) if compact
+                          else pool.submit(fit, job, data, threads, models_dir, search_dir))
+                running[future] = (job, threads)
+                free -= threads
+                log(f"  [RUN] {job.label}: {len(data.y)} músicas, {job.params['n_estimators']} árvores, "
+                    f"{threads} thread(s)")
+
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in done:
+                job, threads = running.pop(future)
+                free += threads
+                try:
+                    metrics = future.result()
+                except Exception as e:
+                    log(f"  [ERRO] {job.label}: {e}")
+                    failed.append({'genre': job.name, 'kind': job.kind, 'error': str(e)})
+                    continue
+                metrics['label'] = job.label
+                metrics['min_accuracy'] = job.min_accuracy
+                metrics['status'] = 'OK' if metrics['accuracy'] >= job.min_accuracy else 'ABAIXO DO ESPERADO'
+                results.append(metrics)
+                log(f"  [OK] {job.label}: accuracy {metrics['accuracy']:.1%}, CV {metrics['cv_mean']:.1%} "
+                    f"({metrics['seconds']:.1f}s) -> {metrics['model']}")
+                if compact:
+                    log(f"       compacto: {metrics.get('compact_method') or 'nenhum candidato no orçamento'}"
+                        + (f" ({metrics['compact_kb']:.0f} KB, {metrics['compact_accuracy']:.1%})"
+                           if 'compact_kb' in metrics else ''))
+                if 'reason' in metrics:
+                    log(f"       {metrics['mode']}: {metrics['reason']}")
+                if 'search_score' in metrics:
+                    log(f"       busca: {metrics['params']} (CV da busca {metrics['search_score']:.1%})")
+
+    if results and summary_path:
+        write_summary(results, summary_path)
+    return results, failed
+
+
+def print_results(results, failed):
+    print(f"\n{'Modelo':<22} {'Tipo':<12} {'Dataset':>8} {'Accuracy':>9} {'CV':>7} {'Tempo':>7}")
+    print('-' * 70)
+    for r in sorted(results, key=lambda r: r['accuracy'], reverse=True):
+        print(f"{r['genre']:<22} {r['kind']:<12} {r['n_samples']:>8} {r['accuracy']:>9.1%} "
+              f"{r['cv_mean']:>7.1%} {r['seconds']:>6.1f}s")
+    for f in failed:
+        print(f"  X {f['genre']}: {f['error']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('sets', nargs='*',
+                        help=f"conjuntos de jobs ({', '.join(JOB_SETS)}; padrão: todos)")
+    parser.add_argument('--cores', type=int, default=None, help='núcleos no total (padrão: TRAIN_CPU_BUDGET ou todos)')
+    parser.add_argument('--search', action='store_true',
+                        help='escolhe os parâmetros por successive halving (cache em ml/.search_cache/)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='acrescenta árvores ao último modelo com as músicas novas (warm start)')
+    parser.add_argument('--compact', action='store_true',
+                        help='grava também a variante compacta de cada modelo (ml/compact_models.py)')
+    parser.add_argument('--only', nargs='+', default=None, metavar='GENERO', help='só estes gêneros/subcategorias')
+    args = parser.parse_args()
+
+    unknown = [s for s in args.sets if s not in JOB_SETS]
+    if unknown:
+        parser.error(f"conjunto(s) desconhecido(s): {', '.join(unknown)}")
+
+    jobs = [job for s in (args.sets or list(JOB_SETS)) for job in JOB_SETS[s]()]
+    if args.only:
+        jobs = [job for job in jobs if job.name in args.only]
+
+    print("=" * 70)
+    print("TREINO DOS MODELOS (ORÇAMENTO GLOBAL DE CPU)")
+    print("=" * 70 + "\n")
+    start = time.time()
+    search_dir = None
+    if args.search:
+        from ml.param_search import SEARCH_DIR
+        search_dir = SEARCH_DIR
+    results, failed = run_jobs(jobs, args.cores, search_dir=search_dir, incremental=args.incremental,
+                               compact=args.compact)
+    print_results(results, failed)
+    print(f"\nTempo total: {time.time() - start:.1f}s | resumo: {SUMMARY_PATH}")
+    sys.exit(0 if results and not failed else (1 if results else 2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""
+Benchmark dos caminhos de decodificação do AudioAnalyzer
+
+Compara, para cada arquivo, o tempo de carregar a janela de análise por:
+  - wav-mmap:  WAV PCM mapeado em memória (sem processo decodificador)
+  - soundfile: libsndfile com seek por frame (WAV/FLAC/OGG)
+  - audioread: caminho antigo (ffmpeg/gstreamer/rawread, lê desde o início)
+e confere se os sinais carregados batem com o do audioread.
+
+Uso:
+    python scripts/analysis/benchmark_audio_decoders.py [arquivo ...] [--repeat N]
+
+Sem arquivos, gera WAV/FLAC/OGG sintéticos de 3 minutos (estéreo, 44.1 kHz).
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, PROJECT_ROOT)
+
+with contextlib.redirect_stdout(io.StringIO()):
+    from backend.audio_analyzer import AudioAnalyzer, sniff_container
+
+DECODERS = {
+    'wav-mmap': lambda a: a._load_wav_mmap(),
+    'soundfile': lambda a: a.load_stream(a.audio_path),
+    'audioread': lambda a: a._load_audioread(),
+}
+
+
+def synthesize_files(folder, duration_s=180.0, sr=44100):
+    """Gera um sinal estéreo com batida e harmônicos nos formatos suportados pelo soundfile"""
+    import soundfile as sf
+
+    t = np.arange(int(duration_s * sr)) / sr
+    beat = (np.sin(2 * np.pi * 2.0 * t) > 0.95).astype(np.float64)
+    left = 0.4 * np.sin(2 * np.pi * 220 * t) + 0.2 * np.sin(2 * np.pi * 440 * t) + 0.3 * beat
+    right = 0.4 * np.sin(2 * np.pi * 330 * t) + 0.3 * beat
+    stereo = np.stack([left, right], axis=1) * 0.8
+
+    paths = []
+    for ext, subtype in (('wav', 'PCM_16'), ('flac', 'PCM_16'), ('ogg', 'VORBIS')):
+        path = os.path.join(folder, f'synthetic.{ext}')
+        try:
+            # Escrita em blocos: o encoder Vorbis do libsndfile falha com buffers muito grandes
+            with sf.SoundFile(path, 'w', sr, 2, subtype=subtype) as out:
+                for start in range(0, len(stereo), sr):
+                    out.write(stereo[start:start + sr])
+            paths.append(path)
+        except Exception as e:
+            print(f"  [AVISO] Não foi possível gerar {ext}: {e}")
+    return paths
+
+
+def load_with(decoder, path):
+    """Carrega a janela com um decodificador específico; devolve (segundos, sinal)"""
+    analyzer = AudioAnalyzer(path)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        DECODERS[decoder](analyzer)
+    return time.perf_counter() - start, analyzer.y
+
+
+def benchmark_file(path, repeat):
+    container = sniff_container(path)
+    size_mb = os.path.getsize(path) / (1024 * 1024)
+    print(f"\n{os.path.basename(path)}  (container={container}, {size_mb:.1f} MB)")
+    print("-" * 80)
+
+    reference = None
+    results = {}
+    for decoder in ('audioread', 'soundfile', 'wav-mmap'):
+        if decoder == 'wav-mmap' and container != 'wav':
+            continue
+        times = []
+        try:
+            for _ in range(repeat):
+                elapsed, y = load_with(decoder, path)
+                times.append(elapsed)
+        except Exception as e:
+            print(f"  {decoder:<10} indisponível: {e}")
+            continue
+        if decoder == 'audioread':
+            reference = y
+        results[decoder] = (times, y)
+
+    base = min(results['audioread'][0]) if 'audioread' in results else None
+    for decoder, (times, y) in results.items():
+        best = min(times) * 1000
+        median = float(np.median(times)) * 1000
+        speedup = f"{base * 1000 / best:6.1f}x" if base else "     -"
+        if reference is not None and len(reference) == len(y):
+            diff = f"{float(np.max(np.abs(reference - y))):.2e}"
+        else:
+            diff = "n/a" if reference is None else f"len {len(y)} vs {len(reference)}"
+        print(f"  {decoder:<10} melhor {best:8.1f} ms  mediana {median:8.1f} ms  {speedup}  max|Δ| {diff}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('files', nargs='*', help='arquivos de áudio (padrão: sintéticos)')
+    parser.add_argument('--repeat', type=int, default=5, help='repetições por decodificador')
+    args = parser.parse_args()
+
+    print("=" * 80)
+    print("BENCHMARK DE DECODIFICAÇÃO - JANELA DE ANÁLISE (30s a partir de 15s)")
+    print("=" * 80)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        files = args.files or synthesize_files(tmp)
+        for path in files:
+            benchmark_file(path, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
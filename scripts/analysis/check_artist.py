@@ -5,6 +5,7 @@ import pandas as pd
 import numpy as np
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
 from backend.hit_predictor import HitPredictor
+from ml.track_keys import TokenIndex, artist_column
 
 def check_artists():
     print("=== CHECK ARTISTAS ESPECIFICOS ===")
@@ -32,38 +33,36 @@ def check_artists():
         local_genre = 'mpb' if 'mpb' in d_name else 'rnb_brasil'
         predictor = HitPredictor(genre=local_genre)
         
-        for idx, row in df.iterrows():
-            track = str(row.get('track_name', '')).lower()
-            # Tenta 'artist' ou 'artist_name'
-            artist = str(row.get('artist', row.get('artist_name', ''))).lower()
-            
-            is_target = False
-            for t in targets:
-                if t.lower() in track or t.lower() in artist:
-                    is_target = True
+        # Índice de palavras (sem acento/caixa) de título e artista: só as linhas
+        # dos alvos são visitadas, em vez de testar cada linha contra cada alvo
+        artists = artist_column(df)
+        titles = df['track_name'] if 'track_name' in df.columns else pd.Series('', index=df.index)
+        index = TokenIndex(titles.astype('string').fillna('') + ' ' + artists)
+        rows = index.search_any(targets, prefix=True)
+        
+        for _, row in df.iloc[rows].iterrows():
+            artist = str(artists.loc[row.name]).lower()
+            features = {
+                'bpm': row.get('bpm', 120),
+                'energy': row.get('energy', 0.5),
+                'danceability': row.get('danceability', 0.5),
+                'loudness': row.get('loudness', -8.0),
+                'valence': row.get('valence', 0.5),
+                'acousticness': row.get('acousticness', 0.1),
+                'liveness': row.get('liveness', 0.1),
+                'speechiness': row.get('speechiness', 0.05),
+                'brightness': 2500,
+                'dynamic_variation': 0.2,
+            }
+            result = predictor.predict(features)
+            s = result['hit_score']
+            ml_prob = result.get('ml_prediction', {}).get('probability', 0) * 100
+            is_hit_truth = row.get('is_hit', -1)
             
-            if is_target:
-                features = {
-                    'bpm': row.get('bpm', 120),
-                    'energy': row.get('energy', 0.5),
-                    'danceability': row.get('danceability', 0.5),
-                    'loudness': row.get('loudness', -8.0),
-                    'valence': row.get('valence', 0.5),
-                    'acousticness': row.get('acousticness', 0.1),
-                    'liveness': row.get('liveness', 0.1),
-                    'speechiness': row.get('speechiness', 0.05),
-                    'brightness': 2500,
-                    'dynamic_variation': 0.2,
-                }
-                result = predictor.predict(features)
-                s = result['hit_score']
-                ml_prob = result.get('ml_prediction', {}).get('probability', 0) * 100
-                is_hit_truth = row.get('is_hit', -1)
-                
-                print(f"   [{'HIT' if is_hit_truth==1 else 'NON'}] {row.get('track_name', 'Unknown')} - {artist}")
-                print(f"     -> Final Score: {s} (ML: {ml_prob:.1f}%)")
-                if s < 60 and is_hit_truth == 1:
-                    print(f"     -> PENALTIES: {result.get('breakdown', [])}")
+            print(f"   [{'HIT' if is_hit_truth==1 else 'NON'}] {row.get('track_name', 'Unknown')} - {artist}")
+            print(f"     -> Final Score: {s} (ML: {ml_prob:.1f}%)")
+            if s < 60 and is_hit_truth == 1:
+                print(f"     -> PENALTIES: {result.get('breakdown', [])}")
 
 if __name__ == "__main__":
     check_artists()
@@ -5,76 +5,50 @@ import pandas as pd
 import os
 import sys
 
-# Adiciona backend ao path
-sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'backend'))
+# Adiciona a raiz do projeto ao path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
-from hit_predictor import HitPredictor
+from ml.catalog_scores import CatalogScoreIndex, build, resolve_genre
 
 GENRES = {
-    'MPB': ('ml/datasets/kaggle_mpb_ml.csv', 'mpb'),
-    'R&B Brasil': ('ml/datasets/kaggle_rnb_ml.csv', 'rnb_brasil'),
-    'Sertanejo': ('ml/datasets/kaggle_sertanejo_ml.csv', 'sertanejo'),
-    'Forró': ('ml/datasets/kaggle_forro_ml.csv', 'forro'),
-    'Pagode': ('ml/datasets/kaggle_pagode_ml.csv', 'pagode'),
-    'Samba': ('ml/datasets/kaggle_samba_ml.csv', 'samba')
+    'MPB': 'mpb',
+    'R&B Brasil': 'rnb_brasil',
+    'Sertanejo': 'sertanejo',
+    'Forró': 'forro',
+    'Pagode': 'pagode',
+    'Samba': 'samba'
 }
 
 TOP_N = 10
 
-def analyze_genre(genre_name, file_path, genre_id):
-    """Analisa um gênero e retorna top músicas"""
-    if not os.path.exists(file_path):
-        print(f"  AVISO: Dataset nao encontrado: {file_path}")
+def analyze_genre(genre_name, genre_id):
+    """Músicas do dataset do gênero ordenadas por score (lidas do índice de scores)"""
+    try:
+        index = CatalogScoreIndex(genre_id)
+    except FileNotFoundError as e:
+        print(f"  AVISO: {e}")
         return None
     
     print(f"\nAnalisando {genre_name}...")
-    df = pd.read_csv(file_path)
-    
-    # Cria predictor para o gênero
-    predictor = HitPredictor(genre=genre_id)
-    
-    # Calcula score para cada música
-    scores = []
-    for idx, row in df.iterrows():
-        features = {
-            'bpm': row.get('bpm', 120),
-            'energy': row.get('energy', 0.5),
-            'danceability': row.get('danceability', 0.5),
-            'valence': row.get('valence', 0.5),
-            'acousticness': row.get('acousticness', 0.5),
-            'instrumentalness': row.get('instrumentalness', 0.0),
-            'liveness': row.get('liveness', 0.2),
-            'speechiness': row.get('speechiness', 0.1),
-            'loudness': row.get('loudness', -8.0)
-        }
-        
-        prediction = predictor.predict(features)
-        
-        scores.append({
-            'track_name': row.get('track_name', row.get('name', 'Unknown')),
-            'artist': row.get('artist_name', row.get('artist', 'Unknown')),
-            'score': prediction['hit_score'],
-            'is_hit': row.get('is_hit', 0),
-            'bpm': features['bpm'],
-            'energy': features['energy'],
-            'danceability': features['danceability']
-        })
-    
-    # Ordena por score
-    df_scores = pd.DataFrame(scores)
-    df_scores = df_scores.sort_values('score', ascending=False)
+    rows = index.score_range(source=resolve_genre(genre_id))
+    if not rows:
+        return None
     
-    return df_scores
+    df_scores = pd.DataFrame(rows).rename(columns={'hit_score': 'score'})
+    return df_scores[['track_name', 'artist', 'score', 'is_hit', 'bpm', 'energy', 'danceability']]
 
 def main():
     print("="*80)
     print("TOP MUSICAS POR GENERO - MAIORES SCORES")
     print("="*80)
     
+    # Atualiza o índice (incremental: só o que mudou desde o último build)
+    build(list(GENRES.values()))
+    
     all_results = {}
     
-    for genre_name, (file_path, genre_id) in GENRES.items():
-        df_scores = analyze_genre(genre_name, file_path, genre_id)
+    for genre_name, genre_id in GENRES.items():
+        df_scores = analyze_genre(genre_name, genre_id)
         
         if df_scores is None:
             continue
@@ -9,59 +9,37 @@ project_root = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
 sys.path.insert(0, project_root)
 
 from backend.hit_predictor import HitPredictor
+from ml.catalog_scores import CatalogScoreIndex, build, resolve_genre
 
-def get_top_10(genre_id, dataset_path):
-    """Retorna TOP 10 músicas do gênero"""
+def get_top_10(genre_id):
+    """Retorna TOP 10 músicas do gênero (índice de scores do catálogo)"""
     print(f"\n{'='*80}")
     print(f"TOP 10 - {genre_id.upper()}")
     print(f"{'='*80}\n")
     
-    if not os.path.exists(dataset_path):
-        print(f"Dataset não encontrado: {dataset_path}")
+    try:
+        index = CatalogScoreIndex(genre_id)
+    except FileNotFoundError as e:
+        print(e)
         return None
     
-    df = pd.read_csv(dataset_path)
-    print(f"Total de músicas analisadas: {len(df)}")
-    
-    predictor = HitPredictor(genre=genre_id)
-    
-    def get_score(row):
-        features = {
-            'bpm': row.get('bpm', 120),
-            'energy': row.get('energy', 0.5),
-            'danceability': row.get('danceability', 0.5),
-            'valence': row.get('valence', 0.5),
-            'acousticness': row.get('acousticness', 0.5),
-            'instrumentalness': row.get('instrumentalness', 0.1),
-            'liveness': row.get('liveness', 0.1),
-            'speechiness': row.get('speechiness', 0.1),
-            'loudness': row.get('loudness', -7.0),
-        }
-        pred = predictor.predict(features)
-        return pred['hit_score']
-    
-    print("Calculando scores...")
-    df['predicted_score'] = df.apply(get_score, axis=1)
-    
-    # TOP 10
-    top_10 = df.nlargest(10, 'predicted_score')
+    dataset = resolve_genre(genre_id)
+    top_10 = pd.DataFrame(index.top_k(10, source=dataset))
+    print(f"Total de músicas analisadas: {len(index.score_range(source=dataset))}")
+    if top_10.empty:
+        return None
     
     # Estratégia usada
-    strategy = predictor.GENRE_STRATEGY.get(genre_id, 'ml')
+    strategy = HitPredictor().GENRE_STRATEGY.get(genre_id, 'ml')
     print(f"Estratégia: {strategy.upper()}\n")
     
     print(f"{'#':<4} {'Score':<8} {'Música':<50} {'Artista':<30}")
     print(f"{'-'*80}")
     
     for idx, (i, row) in enumerate(top_10.iterrows(), 1):
-        track = row.get('track_name', row.get('name', 'Unknown'))[:48]
-        artist = row.get('artist', row.get('artist_name', row.get('artists', 'Unknown')))
-        if isinstance(artist, str):
-            artist = artist[:28]
-        else:
-            artist = 'Unknown'
-        
-        score = row['predicted_score']
+        track = row['track_name'][:48]
+        artist = row['artist'][:28] or 'Unknown'
+        score = row['hit_score']
         print(f"{idx:<4} {score:<8.1f} {track:<50} {artist:<30}")
     
     return top_10
@@ -71,24 +49,24 @@ def main():
     print("TOP 10 MÚSICAS POR GÊNERO - MODELO CALIBRADO")
     print("="*80)
     
-    datasets_dir = os.path.join(project_root, 'ml', 'datasets')
-    
     # Todos os gêneros
     genres = {
-        'R&B Brasil': ('rnb_brasil', 'master_rnb_brasil.csv'),
-        'Pop Urban Brasil': ('brazil', 'kaggle_pop_urban_brasil_ml.csv'),
-        'MPB': ('mpb', 'master_mpb.csv'),
-        'Sertanejo': ('sertanejo', 'kaggle_sertanejo_ml.csv'),
-        'Forró': ('forro', 'kaggle_forro_ml.csv'),
-        'Samba': ('samba', 'kaggle_samba_ml.csv'),
-        'Pagode': ('pagode', 'kaggle_pagode_ml.csv')
+        'R&B Brasil': 'rnb_brasil',
+        'Pop Urban Brasil': 'brazil',
+        'MPB': 'mpb',
+        'Sertanejo': 'sertanejo',
+        'Forró': 'forro',
+        'Samba': 'samba',
+        'Pagode': 'pagode'
     }
     
+    # Atualiza o índice (incremental: só o que mudou desde o último build)
+    build(list(genres.values()))
+    
     all_tops = {}
     
-    for genre_name, (genre_id, filename) in genres.items():
-        dataset_path = os.path.join(datasets_dir, filename)
-        top_10 = get_top_10(genre_id, dataset_path)
+    for genre_name, genre_id in genres.items():
+        top_10 = get_top_10(genre_id)
         if top_10 is not None:
             all_tops[genre_name] = top_10
     
@@ -6,6 +6,9 @@ import numpy as np
 import os
 import sys
 
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from ml.track_keys import TokenIndex, deduplicate
+
 # Corrige problema de encoding no terminal Windows
 sys.stdout.reconfigure(encoding='utf-8')
 
@@ -38,36 +41,28 @@ def process_data():
     # Processa dataset Latin para extrair brasileiros
     print("\nProcessando sub-generos brasileiros dentro de 'latin'...")
     latin_mask = df['playlist_genre'] == 'latin'
-    latin_df = df[latin_mask].copy()
     
     genres = {}
     
+    # Índices de palavras (sem acento/caixa) montados uma vez: cada termo vira
+    # uma consulta ao índice em vez de um .str.contains sobre o dataset inteiro
+    def text(columns):
+        values = [df[c].astype('string').fillna('') for c in columns]
+        return values[0].str.cat(values[1:], sep=' ')
+    
+    index_latin = TokenIndex(text(['playlist_name', 'track_name', 'track_artist', 'playlist_subgenre']))
+    index_all = TokenIndex(text(['playlist_name', 'track_name', 'track_artist']))
+    
     for genre_id, terms in keywords_map.items():
         # Busca termos no nome da playlist, nome da musica ou nome do artista
-        mask = pd.Series([False] * len(latin_df))
-        
-        for term in terms:
-            term = term.lower()
-            m1 = latin_df['playlist_name'].str.lower().str.contains(term, na=False)
-            m2 = latin_df['track_name'].str.lower().str.contains(term, na=False)
-            m3 = latin_df['track_artist'].str.lower().str.contains(term, na=False)
-            m4 = latin_df['playlist_subgenre'].str.lower().str.contains(term, na=False)
-            mask = mask | m1 | m2 | m3 | m4
-            
-        genre_df = latin_df[mask].copy()
+        mask = index_latin.mask(terms, prefix=True) & latin_mask.to_numpy()
+        genre_df = df[mask].copy()
         
         # Se encontrou poucas, tenta buscar no dataset inteiro (não só latin)
         if len(genre_df) < 20:
-             mask_all = pd.Series([False] * len(df))
-             for term in terms:
-                term = term.lower()
-                m1 = df['playlist_name'].str.lower().str.contains(term, na=False)
-                m2 = df['track_name'].str.lower().str.contains(term, na=False)
-                m3 = df['track_artist'].str.lower().str.contains(term, na=False)
-                mask_all = mask_all | m1 | m2 | m3
-             genre_df = df[mask_all].copy()
+             genre_df = df[index_all.mask(terms, prefix=True)].copy()
         
-        genres[genre_id] = genre_df.drop_duplicates(subset=['track_name', 'track_artist'])
+        genres[genre_id], _ = deduplicate(genre_df)
         
     created_files = []
     final_cols = [
@@ -0,0 +1,79 @@
+"""
+Política de dtype do AudioAnalyzer: a análise em float32/complex64 deve dar
+as mesmas features que em float64/complex128 (dentro de uma tolerância).
+
+Uso:
+    python -m pytest tests/test_audio_dtype.py
+    python -m unittest tests.test_audio_dtype
+"""
+import math
+import sys
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+import backend.audio_analyzer as audio_analyzer
+
+SR = 22050
+SECONDS = 30.0
+REL_TOL = 1e-4
+ABS_TOL = 1e-4
+
+
+def synthetic_signal(sr=SR, seconds=SECONDS):
+    """Dois tons (um modulado) + batida de ruído a 120 BPM + ruído de fundo, semente fixa"""
+    rng = np.random.default_rng(0)
+    t = np.arange(int(sr * seconds)) / sr
+    y = 0.3 * np.sin(2 * np.pi * 220 * t)
+    y += 0.2 * np.sin(2 * np.pi * 330 * t) * (1 + np.sin(2 * np.pi * 0.5 * t)) / 2
+    y += ((t % 0.5) < 0.03) * rng.normal(0, 0.4, len(t))
+    y += rng.normal(0, 0.01, len(t))
+    return y
+
+
+class AudioDtypeTest(unittest.TestCase):
+
+    def setUp(self):
+        self._dtypes = (audio_analyzer.AUDIO_DTYPE, audio_analyzer.SPECTRUM_DTYPE)
+
+    def tearDown(self):
+        audio_analyzer.AUDIO_DTYPE, audio_analyzer.SPECTRUM_DTYPE = self._dtypes
+
+    def _analyze(self, audio_dtype, spectrum_dtype):
+        audio_analyzer.AUDIO_DTYPE = audio_dtype
+        audio_analyzer.SPECTRUM_DTYPE = spectrum_dtype
+        analyzer = audio_analyzer.AudioAnalyzer('synthetic.wav')
+        analyzer.load_pcm(synthetic_signal(), SR, SECONDS)
+        self.assertEqual(analyzer.y.dtype, audio_dtype)
+        self.assertEqual(analyzer._get_stft().dtype, spectrum_dtype)
+        return analyzer.analyze_all()
+
+    def test_float32_matches_float64(self):
+        single = self._analyze(np.float32, np.complex64)
+        double = self._analyze(np.float64, np.complex128)
+
+        self.assertEqual(set(single), set(double))
+        for name, value in double.items():
+            with self.subTest(feature=name):
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    self.assertTrue(math.isfinite(single[name]))
+                    self.assertTrue(math.isclose(single[name], value, rel_tol=REL_TOL, abs_tol=ABS_TOL),
+                                    f'{name}: float32 {single[name]} vs float64 {value}')
+                else:
+                    self.assertEqual(single[name], value)
+
+    def test_filterbanks_follow_audio_dtype(self):
+        for dtype in (np.float32, np.float64):
+            with self.subTest(dtype=dtype.__name__):
+                self._analyze(dtype, np.complex64 if dtype == np.float32 else np.complex128)
+                self.assertEqual(audio_analyzer._mel_filterbank(audio_analyzer.ANALYSIS_SR, 2048,
+                                                                np.dtype(dtype)).dtype, dtype)
+                self.assertEqual(audio_analyzer._dct_matrix(np.dtype(dtype)).dtype, dtype)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+"""
+Hash dos landmarks do fingerprint: cada campo (f, df, dt) volta intacto e
+triplos distintos nunca colidem; o pareamento vetorizado é o mesmo do laço.
+
+Uso:
+    python -m pytest tests/test_fingerprint.py
+"""
+import sys
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+import backend.audio_analyzer as audio_analyzer
+from backend.audio_analyzer import landmark_fits, pack_landmarks, unpack_landmarks
+
+
+def all_triples():
+    """Todos os (f, df, dt) que o layout aceita"""
+    f, df, dt = np.meshgrid(np.arange(1 << audio_analyzer.FP_F_BITS),
+                            np.arange(-audio_analyzer.FP_DF_OFFSET, audio_analyzer.FP_DF_OFFSET),
+                            np.arange(1 << audio_analyzer.FP_DT_BITS), indexing='ij')
+    return f.ravel(), df.ravel(), dt.ravel()
+
+
+def reference_pairs(t_q, f_q):
+    """Pareamento âncora -> próximos FP_FAN_OUT picos com o laço original"""
+    hashes, times = [], []
+    for i in range(len(t_q)):
+        targets = 0
+        for j in range(i + 1, len(t_q)):
+            dt = t_q[j] - t_q[i]
+            if dt > audio_analyzer.FP_MAX_DT:
+                break
+            if dt == 0:
+                continue
+            hashes.append(int(pack_landmarks(f_q[i], f_q[j] - f_q[i], dt)))
+            times.append(int(t_q[i]))
+            targets += 1
+            if targets >= audio_analyzer.FP_FAN_OUT:
+                break
+    return hashes, times
+
+
+class LandmarkHashTest(unittest.TestCase):
+
+    def test_fields_round_trip(self):
+        f, df, dt = all_triples()
+        self.assertTrue(landmark_fits(f, df, dt).all())
+        f2, df2, dt2 = unpack_landmarks(pack_landmarks(f, df, dt))
+        np.testing.assert_array_equal(f2, f)
+        np.testing.assert_array_equal(df2, df)
+        np.testing.assert_array_equal(dt2, dt)
+
+    def test_distinct_triples_distinct_hashes(self):
+        hashes = pack_landmarks(*all_triples())
+        self.assertEqual(len(np.unique(hashes)), len(hashes))
+        self.assertTrue((hashes >= 0).all())
+
+    def test_frequency_deltas_of_the_analysis_band_fit(self):
+        # (f, df=+128) e (f+1, df=-128) colidiam com df em 8 bits
+        self.assertNotEqual(int(pack_landmarks(100, 128, 10)), int(pack_landmarks(101, -128, 10)))
+        f_min = int(np.floor(audio_analyzer.FP_FREQ_RANGE_HZ[0] / audio_analyzer.FP_FREQ_QUANT_HZ))
+        f_max = int(np.ceil(audio_analyzer.FP_FREQ_RANGE_HZ[1] / audio_analyzer.FP_FREQ_QUANT_HZ))
+        self.assertTrue(landmark_fits([f_max, f_min], [f_min - f_max, f_max - f_min], [1, 1]).all())
+
+    def test_vectorized_pairing_matches_loop(self):
+        rng = np.random.default_rng(0)
+        sr = 11025
+        t = np.arange(sr * 20) / sr
+        y = sum(np.sin(2 * np.pi * rng.uniform(150, 3500) * t) * (rng.random(len(t)) < 0.3) for _ in range(6))
+        analyzer = audio_analyzer.AudioAnalyzer('synthetic.wav')
+        analyzer.load_pcm(y + rng.normal(0, 0.05, len(t)), sr, 20.0)
+        hashes, times = analyzer.fingerprint()
+        self.assertGreater(len(hashes), 100)
+
+        # Reconstrói os picos ordenados a partir das âncoras e refaz com o laço
+        f, df, dt = unpack_landmarks(hashes)
+        peaks = sorted({(int(ti), int(fi)) for ti, fi in zip(times, f)}
+                       | {(int(ti + d), int(fi + g)) for ti, fi, g, d in zip(times, f, df, dt)})
+        t_q = np.array([p[0] for p in peaks], dtype=np.int64)
+        f_q = np.array([p[1] for p in peaks], dtype=np.int64)
+        ref_hashes, ref_times = reference_pairs(t_q, f_q)
+        self.assertEqual(hashes.tolist(), ref_hashes)
+        self.assertEqual(times.tolist(), ref_times)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+"""
+Chave de deduplicação título|artista: créditos de participação e tags de
+remaster saem, versões (ao vivo, acústico, remix) ficam.
+
+Uso:
+    python -m pytest tests/test_track_keys.py
+"""
+import sys
+import unittest
+from pathlib import Path
+
+import pandas as pd
+
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from ml.track_keys import deduplicate, normalize_title
+
+
+class TrackKeyTest(unittest.TestCase):
+
+    def test_versions_survive_dedup(self):
+        df = pd.DataFrame({
+            'track_name': ['Evidências', 'Evidências (Ao Vivo)', 'Evidências - Acústico',
+                           'Evidências [Remix]', 'Evidencias'],
+            'artists': ['Chitãozinho & Xororó'] * 5,
+            'energy': [0.5, 0.8, 0.2, 0.9, 0.5],
+        })
+        kept, removed = deduplicate(df)
+        self.assertEqual(removed, 1)
+        self.assertEqual(kept['track_name'].tolist(), df['track_name'].tolist()[:4])
+
+    def test_credits_and_remaster_tags_collapse(self):
+        df = pd.DataFrame({
+            'track_name': ['Sua Cara', 'Sua Cara (feat. Anitta & Pabllo Vittar)', 'Sua Cara feat. Anitta',
+                           'Sua Cara - Remastered 2019', 'Sua Cara (Part. Anitta)'],
+            'artists': ['Major Lazer', 'Major Lazer;Anitta', 'Major Lazer, Anitta', 'Major Lazer', 'Major Lazer'],
+        })
+        kept, removed = deduplicate(df)
+        self.assertEqual(removed, 4)
+        self.assertEqual(kept['track_name'].tolist(), ['Sua Cara'])
+
+    def test_version_spellings_share_a_key(self):
+        titles = normalize_title(['Evidências (Ao Vivo)', 'Evidencias - Ao Vivo', 'Evidências'])
+        self.assertEqual(titles.iloc[0], titles.iloc[1])
+        self.assertNotEqual(titles.iloc[0], titles.iloc[2])
+
+
+if __name__ == '__main__':
+    unittest.main()